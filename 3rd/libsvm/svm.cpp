@@ -1439,7 +1439,8 @@ private:
 //
 static void solve_c_svc(
 	const svm_problem *prob, const svm_parameter* param,
-	double *alpha, Solver::SolutionInfo* si, double Cp, double Cn)
+	double *alpha, Solver::SolutionInfo* si, double Cp, double Cn,
+	const double *init_alpha = NULL)
 {
 	int l = prob->l;
 	double *minus_ones = new double[l];
@@ -1449,7 +1450,8 @@ static void solve_c_svc(
 
 	for(i=0;i<l;i++)
 	{
-		alpha[i] = 0;
+		// PyMVPA: start from the given feasible point if provided
+		alpha[i] = init_alpha ? init_alpha[i] : 0;
 		minus_ones[i] = -1;
 		if(prob->y[i] > 0) y[i] = +1; else y[i] = -1;
 	}
@@ -1646,14 +1648,14 @@ struct decision_function
 
 static decision_function svm_train_one(
 	const svm_problem *prob, const svm_parameter *param,
-	double Cp, double Cn)
+	double Cp, double Cn, const double *init_alpha = NULL)
 {
 	double *alpha = Malloc(double,prob->l);
 	Solver::SolutionInfo si;
 	switch(param->svm_type)
 	{
 		case C_SVC:
-			solve_c_svc(prob,param,alpha,&si,Cp,Cn);
+			solve_c_svc(prob,param,alpha,&si,Cp,Cn,init_alpha);
 			break;
 		case NU_SVC:
 			solve_nu_svc(prob,param,alpha,&si);
@@ -2068,10 +2070,63 @@ static void svm_group_classes(const svm_problem *prob, int *nr_class_ret, int **
 	free(data_label);
 }
 
+// PyMVPA: initial alphas of the binary C-SVC subproblem of classes i and j
+// from the dual coefficients of a previous solution (see
+// svm_train_warm_start).  Alphas are clipped into [0, C] and, if needed,
+// those of the class in excess get scaled down to satisfy y'alpha = 0,
+// so the solver always starts from a feasible point.
+static void svm_warm_start_alpha(
+	const double *init_coef, int nr_class, const int *perm,
+	int i, int j, int si, int sj, int ci, int cj,
+	double Ci, double Cj, double *alpha)
+{
+	int k;
+	double sum_i = 0, sum_j = 0;
+	for(k=0;k<ci+cj;k++)
+	{
+		double a, C;
+		if(k<ci)
+		{
+			a = init_coef[perm[si+k]*(nr_class-1)+j-1];
+			C = Ci;
+		}
+		else
+		{
+			a = -init_coef[perm[sj+k-ci]*(nr_class-1)+i];
+			C = Cj;
+		}
+		a *= C;
+		if(!(a > 0)) a = 0;	// also takes care of NaNs
+		if(a > C) a = C;
+		alpha[k] = a;
+		if(k<ci) sum_i += a; else sum_j += a;
+	}
+	if(sum_i > sum_j)
+		for(k=0;k<ci;k++)
+			alpha[k] *= sum_j/sum_i;
+	else if(sum_j > sum_i)
+		for(k=ci;k<ci+cj;k++)
+			alpha[k] *= sum_i/sum_j;
+}
+
 //
 // Interface functions
 //
 svm_model *svm_train(const svm_problem *prob, const svm_parameter *param)
+{
+	return svm_train_warm_start(prob,param,NULL,NULL);
+}
+
+// PyMVPA: C-SVC classification could be started from the dual coefficients
+// of a previous solution of a problem with the same samples (e.g. with
+// some features removed).  Coefficients are stored as a dense l x
+// (nr_class-1) matrix in the order of prob->x, using the layout of
+// svm_model.sv_coef, with values relative to the C of the corresponding
+// class.  init_coef provides them for the warm start, and coef (if not
+// NULL) receives the ones of the new solution.  Both are ignored for other
+// SVM types.
+svm_model *svm_train_warm_start(const svm_problem *prob, const svm_parameter *param,
+	const double *init_coef, double *coef)
 {
 	svm_model *model = Malloc(svm_model,1);
 	model->param = *param;
@@ -2194,7 +2249,24 @@ svm_model *svm_train(const svm_problem *prob, const svm_parameter *param)
 				if(param->probability)
 					svm_binary_svc_probability(&sub_prob,param,weighted_C[i],weighted_C[j],probA[p],probB[p]);
 
-				f[p] = svm_train_one(&sub_prob,param,weighted_C[i],weighted_C[j]);
+				double *init_alpha = NULL;
+				if(init_coef && param->svm_type == C_SVC)
+				{
+					init_alpha = Malloc(double,sub_prob.l);
+					svm_warm_start_alpha(init_coef,nr_class,perm,i,j,si,sj,ci,cj,
+										 weighted_C[i],weighted_C[j],init_alpha);
+				}
+				f[p] = svm_train_one(&sub_prob,param,weighted_C[i],weighted_C[j],init_alpha);
+				free(init_alpha);
+				if(coef && param->svm_type == C_SVC)
+				{
+					for(k=0;k<ci;k++)
+						coef[perm[si+k]*(nr_class-1)+j-1] =
+							weighted_C[i] > 0 ? f[p].alpha[k]/weighted_C[i] : 0;
+					for(k=0;k<cj;k++)
+						coef[perm[sj+k]*(nr_class-1)+i] =
+							weighted_C[j] > 0 ? f[p].alpha[ci+k]/weighted_C[j] : 0;
+				}
 				for(k=0;k<ci;k++)
 					if(!nonzero[si+k] && fabs(f[p].alpha[k]) > 0)
 						nonzero[si+k] = true;
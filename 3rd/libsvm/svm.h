@@ -71,6 +71,9 @@ struct svm_model
 };
 
 struct svm_model *svm_train(const struct svm_problem *prob, const struct svm_parameter *param);
+/* PyMVPA: training of C-SVC starting from a previous solution */
+#define LIBSVM_WARM_START
+struct svm_model *svm_train_warm_start(const struct svm_problem *prob, const struct svm_parameter *param, const double *init_coef, double *coef);
 void svm_cross_validation(const struct svm_problem *prob, const struct svm_parameter *param, int nr_fold, double *target);
 
 int svm_save_model(const char *model_file_name, const struct svm_model *model);
@@ -16,21 +16,22 @@ __all__ = ['GroupClusterThreshold', 'get_thresholding_map',
 if __debug__:
     from mvpa2.base import debug
 
-import random
 from collections import Counter
 
 import numpy as np
 
 from scipy.ndimage import measurements
-from scipy.sparse import dok_matrix
+from scipy.sparse import csr_matrix, coo_matrix, dok_matrix, identity, \
+    issparse
 
 from mvpa2.mappers.base import IdentityMapper, _verified_reverse1
-from mvpa2.datasets import Dataset
 from mvpa2.base.learner import Learner
 from mvpa2.base.param import Parameter
 from mvpa2.base.constraints import \
     EnsureInt, EnsureFloat, EnsureRange, EnsureChoice
 from mvpa2.mappers.fx import mean_sample
+from mvpa2.misc.neighborhood import QueryEngineInterface
+from mvpa2.support.nibabel.surf import Surface
 
 from mvpa2.support.due import due, Doi
 
@@ -74,7 +75,11 @@ class GroupClusterThreshold(Learner):
 
     Moreover, this implementation minimizes the required memory demands and
     allows for computing large numbers of bootstrap samples without
-    significant increase in memory demand (CPU time trade-off).
+    significant increase in memory demand. Each bootstrap average map is
+    computed only once: only the largest values per feature (as many as
+    needed to determine the feature-wise threshold) are kept, and these are
+    sufficient to reconstruct all thresholded bootstrap maps for cluster
+    size estimation.
 
     Instances of this class must be trained before than can be used to
     threshold accuracy maps. The training dataset must match the following
@@ -197,13 +202,27 @@ class GroupClusterThreshold(Learner):
 
     n_blocks = Parameter(
         1, constraints=EnsureInt() & EnsureRange(min=1),
-        doc="""Number of segments used to compute the feature-wise NULL
-            distributions. This parameter determines the peak memory demand.
-            In case of a single segment a matrix of size
+        doc="""Number of blocks of bootstrap samples used to compute the
+            feature-wise NULL distributions. This parameter determines the
+            peak memory demand. In case of a single block a matrix of size
             (n_bootstrap x nfeatures) will be allocated. Increasing the number
-            of segments reduces the peak memory demand by that roughly factor.
+            of blocks reduces the peak memory demand by that roughly factor,
+            down to the (n_bootstrap * feature_thresh_prob x nfeatures) values
+            that need to be tracked for thresholding.
             """)
 
+    feature_adjacency = Parameter(
+        None,
+        doc="""Neighborhood graph of the features used to determine clusters.
+            If ``None``, clusters are determined on the reverse-mapped data
+            (e.g. a volume) via face-connectivity of the grid. Otherwise
+            clusters are connected components of the graph, determined
+            directly on the feature vectors. Supported are a sparse
+            (nfeatures x nfeatures) adjacency matrix, a ``Surface`` (features
+            are assigned to nodes via ``fa.node_indices``, if present, or
+            correspond to nodes otherwise), or a query engine that is
+            trained on the dataset and queried with every feature id.""")
+
     n_proc = Parameter(
         1, constraints=EnsureInt() & EnsureRange(min=1),
         doc="""Number of parallel processes to use for computation.
@@ -220,6 +239,7 @@ class GroupClusterThreshold(Learner):
     def _untrain(self):
         self._thrmap = None
         self._null_cluster_sizes = None
+        self._adjacency = None
 
     @due.dcite(
         Doi("10.1016/j.neuroimage.2012.09.063"),
@@ -228,103 +248,121 @@ class GroupClusterThreshold(Learner):
     def _train(self, ds):
         # shortcuts
         chunk_attr = self.params.chunk_attr
+        n_bootstrap = self.params.n_bootstrap
+        n_proc = self.params.n_proc
         #
         # Step 0: bootstrap maps by drawing one for each chunk and average them
         # (do N iterations)
         # this could take a lot of memory, hence instead of computing the maps
-        # we compute the source maps they can be computed from and then (re)build
-        # the matrix of bootstrapped maps either row-wise or column-wise (as
-        # needed) to save memory by a factor of (close to) `n_bootstrap`
+        # we only store which source maps they are computed from and stream
+        # through the bootstrap samples in blocks
         # which samples belong to which chunk
-        chunk_samples = dict([(c, np.where(ds.sa[chunk_attr].value == c)[0])
-                              for c in ds.sa[chunk_attr].unique])
-        # pre-built the bootstrap combinations
-        bcombos = [[random.sample(v, 1)[0] for v in chunk_samples.values()]
-                   for i in xrange(self.params.n_bootstrap)]
-        bcombos = np.array(bcombos, dtype=int)
+        chunk_samples = [np.where(ds.sa[chunk_attr].value == c)[0]
+                         for c in ds.sa[chunk_attr].unique]
+        # pre-built the bootstrap combinations (n_bootstrap x nchunks)
+        bcombos = np.array(
+            [v[np.random.randint(len(v), size=n_bootstrap)]
+             for v in chunk_samples]).T
         #
         # Step 1: find the per-feature threshold that corresponds to some p
-        # in the NULL
-        segwidth = ds.nfeatures / self.params.n_blocks
+        # in the NULL, by keeping track of the `k` largest bootstrap averages
+        # for each feature
+        k = int(n_bootstrap * self.params.feature_thresh_prob)
+        if k < 1:
+            raise ValueError("requested probability is too low for the given "
+                             "number of samples")
+        blocksize = int(np.ceil(n_bootstrap / float(self.params.n_blocks)))
         # speed things up by operating on an array not a dataset
         ds_samples = ds.samples
         if __debug__:
             debug('GCTHR',
-                  'Compute per-feature thresholds in %i blocks of %i features'
-                  % (self.params.n_blocks, segwidth))
+                  'Compute per-feature thresholds from %i bootstrap samples '
+                  'in blocks of %i' % (n_bootstrap, blocksize))
         # Execution can be done in parallel as the estimation is independent
-        # across features
-
-        def featuresegment_producer(ncols):
-            for segstart in xrange(0, ds.nfeatures, ncols):
-                # one average map for every stored bcombo
-                # this also slices the input data into feature subsets
-                # for the compute blocks
-                yield [np.mean(
-                       # get a view to a subset of the features
-                       # -- should be somewhat efficient as feature axis is
-                       # sliced
-                       ds_samples[sidx, segstart:segstart + ncols],
-                       axis=0)
-                       for sidx in bcombos]
-        if self.params.n_proc == 1:
+        # across bootstrap samples
+        if n_proc == 1:
             # Serial execution
-            thrmap = np.hstack(  # merge across compute blocks
-                [get_thresholding_map(d, self.params.feature_thresh_prob)
-                 # compute a partial threshold map for as many features
-                 # as fit into a compute block
-                 for d in featuresegment_producer(segwidth)])
+            topvals, topids = _get_bootstrap_topk(ds_samples, bcombos, k,
+                                                  blocksize)
         else:
             # Parallel execution
             verbose_level_parallel = 50 \
                 if (__debug__ and 'GCTHR' in debug.active) else 0
             # local import as only parallel execution needs this
             from joblib import Parallel, delayed
-            # same code as above, just in parallel with joblib's Parallel
-            thrmap = np.hstack(
-                Parallel(n_jobs=self.params.n_proc,
-                         pre_dispatch=self.params.n_proc,
-                         verbose=verbose_level_parallel)(
-                             delayed(get_thresholding_map)
-                        (d, self.params.feature_thresh_prob)
-                             for d in featuresegment_producer(segwidth)))
+            # each process streams through its own range of bootstrap samples
+            bounds = np.linspace(0, n_bootstrap, n_proc + 1).astype(int)
+            jobres = Parallel(n_jobs=n_proc,
+                              pre_dispatch=n_proc,
+                              verbose=verbose_level_parallel)(
+                                  delayed(_get_bootstrap_topk)
+                             (ds_samples, bcombos[start:stop], k, blocksize,
+                              start)
+                                  for start, stop in zip(bounds[:-1],
+                                                         bounds[1:]))
+            # merge the partial estimates
+            topvals, topids = _merge_topk(
+                np.vstack([r[0] for r in jobres]),
+                np.vstack([r[1] for r in jobres]),
+                k)
+            del jobres
+        # the k-th largest value is the threshold
+        thrmap = topvals.min(axis=0)
         # store for later thresholding of input data
         self._thrmap = thrmap
         #
         # Step 2: threshold all NULL maps and build distribution of NULL cluster
         #         sizes
         #
-        cluster_sizes = Counter()
-        # recompute the bootstrap average maps to threshold them and determine
-        # cluster sizes
-        dsa = dict(mapper=ds.a.mapper) if 'mapper' in ds.a else {}
+        # any super-threshold value is among the `k` largest ones of its
+        # feature, hence the thresholded bootstrap maps can be assembled from
+        # the tracked values without recomputing any bootstrap average
+        supra = topvals > thrmap
+        supra_boots = topids[supra]
+        supra_features = np.nonzero(supra)[1]
+        del topvals, topids, supra
+        order = np.argsort(supra_boots, kind='mergesort')
+        supra_boots = supra_boots[order]
+        supra_features = supra_features[order]
+        boots, bstarts = np.unique(supra_boots, return_index=True)
+        # features of each bootstrap map with super-threshold values
+        map_features = np.split(supra_features, bstarts[1:]) \
+            if len(boots) else []
+        mapper = ds.a.mapper if 'mapper' in ds.a else IdentityMapper()
+        adjacency = None
+        if self.params.feature_adjacency is not None:
+            adjacency = _get_feature_adjacency(self.params.feature_adjacency,
+                                               ds)
+        # store for labeling clusters in the input data
+        self._adjacency = adjacency
         if __debug__:
-            debug('GCTHR', 'Estimating NULL distribution of cluster sizes')
+            debug('GCTHR', 'Estimating NULL distribution of cluster sizes '
+                           'from %i non-empty bootstrap maps' % len(boots))
         # this step can be computed in parallel chunks to speeds things up
-        if self.params.n_proc == 1:
+        if n_proc == 1:
             # Serial execution
-            for sidx in bcombos:
-                avgmap = np.mean(ds_samples[sidx], axis=0)[None]
-                # apply threshold
-                clustermap = avgmap > thrmap
-                # wrap into a throw-away dataset to get the reverse mapping right
-                bds = Dataset(clustermap, a=dsa)
-                # this function reverse-maps every sample one-by-one, hence no need
-                # to collect chunks of bootstrapped maps
-                cluster_sizes = get_cluster_sizes(bds, cluster_sizes)
+            cluster_sizes = _get_null_cluster_sizes(map_features,
+                                                    ds.nfeatures, mapper,
+                                                    adjacency)
         else:
             # Parallel execution
             # same code as above, just restructured for joblib's Parallel
-            for jobres in Parallel(n_jobs=self.params.n_proc,
-                                   pre_dispatch=self.params.n_proc,
+            bounds = np.linspace(0, len(map_features), n_proc + 1).astype(int)
+            cluster_sizes = Counter()
+            for jobres in Parallel(n_jobs=n_proc,
+                                   pre_dispatch=n_proc,
                                    verbose=verbose_level_parallel)(
-                                       delayed(get_cluster_sizes)
-                                  (Dataset(np.mean(ds_samples[sidx],
-                                           axis=0)[None] > thrmap,
-                                           a=dsa))
-                                       for sidx in bcombos):
+                                       delayed(_get_null_cluster_sizes)
+                                  (map_features[start:stop], ds.nfeatures,
+                                   mapper, adjacency)
+                                       for start, stop in zip(bounds[:-1],
+                                                              bounds[1:])):
                 # aggregate
                 cluster_sizes += jobres
+        # bootstrap maps without any super-threshold feature count as a
+        # size-zero cluster
+        if n_bootstrap > len(boots):
+            cluster_sizes[0] += n_bootstrap - len(boots)
         # store cluster size histogram for later p-value evaluation
         # use a sparse matrix for easy consumption (max dim is the number of
         # features, i.e. biggest possible cluster)
@@ -354,7 +392,13 @@ class GroupClusterThreshold(Learner):
         outds = ds.copy(deep=False)
         outds.fa['featurewise_thresh'] = self._thrmap
         # determine clusters
-        labels, num = measurements.label(othrd)
+        if self._adjacency is None:
+            labels, num = measurements.label(othrd)
+        else:
+            # label on the feature graph, but report locations in the
+            # reverse-mapped space as usual
+            labels, num = _get_graph_cluster_labels(thrd, self._adjacency)
+            labels = _verified_reverse1(mapper, labels)
         area = measurements.sum(othrd,
                                 labels,
                                 index=np.arange(1, num + 1)).astype(int)
@@ -477,12 +521,214 @@ def _get_map_cluster_sizes(map_):
         return area.astype(int)
 
 
-def get_cluster_sizes(ds, cluster_counter=None):
+def _get_bootstrap_means(data, bcombos):
+    """Compute average maps for a set of bootstrap combinations
+
+    Averages are computed as a single matrix product of a sparse selection
+    matrix (one row per bootstrap sample) and the data.
+
+    Parameters
+    ----------
+    data : 2D-array
+      Source maps (one per row).
+    bcombos : 2D-array
+      Row indices into ``data``, one row of indices per bootstrap sample.
+    """
+    nboot, nsrc = bcombos.shape
+    selector = csr_matrix(
+        (np.repeat(1. / nsrc, bcombos.size),
+         bcombos.ravel(),
+         np.arange(0, bcombos.size + 1, nsrc)),
+        shape=(nboot, len(data)))
+    return np.asarray(selector * data)
+
+
+def _merge_topk(values, ids, k):
+    """Reduce 2D-arrays to the `k` largest values (and their ids) per column"""
+    if len(values) > k:
+        idx = np.argpartition(values, len(values) - k, axis=0)[-k:]
+        cols = np.arange(values.shape[1])
+        values = values[idx, cols]
+        ids = ids[idx, cols]
+    return values, ids
+
+
+def _get_bootstrap_topk(data, bcombos, k, blocksize, offset=0):
+    """Track the `k` largest bootstrap averages for each feature
+
+    Bootstrap averages are computed in blocks of ``blocksize`` samples,
+    hence at no point more than ``(blocksize + k) x nfeatures`` values
+    are held in memory.
+
+    Returns
+    -------
+    (values, ids)
+      Two arrays of shape ``(k, nfeatures)`` with the largest averages and
+      the indices of the bootstrap samples they originate from (shifted by
+      ``offset``).
+    """
+    nfeatures = data.shape[1]
+    values = np.empty((0, nfeatures))
+    ids = np.empty((0, nfeatures), dtype=int)
+    for start in xrange(0, len(bcombos), blocksize):
+        means = _get_bootstrap_means(data, bcombos[start:start + blocksize])
+        bids = np.repeat(
+            np.arange(offset + start, offset + start + len(means))[:, None],
+            nfeatures, axis=1)
+        values, ids = _merge_topk(np.vstack((values, means)),
+                                  np.vstack((ids, bids)),
+                                  k)
+    return values, ids
+
+
+def _get_null_cluster_sizes(map_features, nfeatures, mapper, adjacency=None):
+    """Count cluster sizes in thresholded bootstrap maps
+
+    Parameters
+    ----------
+    map_features : list
+      Sequence of index arrays, one per bootstrap map, with the features
+      exceeding the threshold in that map.
+    nfeatures : int
+      Number of features in a map.
+    mapper : Mapper
+      Used to reverse-map each boolean map prior cluster labeling.
+    adjacency : sparse matrix or None
+      If given, clusters are connected components of this feature graph
+      and no reverse-mapping is done.
+    """
+    cluster_counter = Counter()
+    for features in map_features:
+        if adjacency is not None:
+            cluster_counter.update(
+                _get_graph_cluster_sizes(features, adjacency))
+            continue
+        clustermap = np.zeros(nfeatures, dtype=bool)
+        clustermap[features] = True
+        osamp = _verified_reverse1(mapper, clustermap)
+        cluster_counter.update(_get_map_cluster_sizes(osamp))
+    return cluster_counter
+
+
+def _get_feature_adjacency(neighborhood, ds):
+    """Build a symmetric boolean (nfeatures x nfeatures) adjacency matrix
+
+    See ``GroupClusterThreshold.feature_adjacency`` for supported inputs.
+    """
+    nfeatures = ds.nfeatures
+    if isinstance(neighborhood, Surface):
+        # nodes sharing a face edge are neighbors
+        faces = neighborhood.faces
+        nvertices = neighborhood.nvertices
+        vadj = coo_matrix(
+            (np.ones(faces.size),
+             (faces.ravel(), np.roll(faces, 1, axis=1).ravel())),
+            shape=(nvertices, nvertices)).tocsr()
+        if 'node_indices' in ds.fa:
+            nodes = ds.fa.node_indices.ravel()
+        elif nfeatures == nvertices:
+            nodes = np.arange(nfeatures)
+        else:
+            raise ValueError("dataset has no 'node_indices' feature attribute "
+                             "and %i features do not match %i surface nodes"
+                             % (nfeatures, nvertices))
+        # features at the same or at neighboring nodes are adjacent
+        incidence = csr_matrix(
+            (np.ones(nfeatures), (np.arange(nfeatures), nodes)),
+            shape=(nfeatures, nvertices))
+        adjacency = incidence * (vadj + identity(nvertices)) * incidence.T
+    elif isinstance(neighborhood, QueryEngineInterface):
+        neighborhood.train(ds)
+        indptr, indices = neighborhood.query_byid_batch(np.arange(nfeatures))
+        adjacency = csr_matrix((np.ones(len(indices)), indices, indptr),
+                               shape=(nfeatures, nfeatures))
+    elif issparse(neighborhood):
+        adjacency = neighborhood
+    else:
+        raise ValueError("feature adjacency has to be a sparse matrix, a "
+                         "Surface or a query engine, got %r" % (neighborhood,))
+    if adjacency.shape != (nfeatures, nfeatures):
+        raise ValueError("feature adjacency of shape %s does not match %i "
+                         "features" % (adjacency.shape, nfeatures))
+    # connectivity is undirected
+    return (adjacency + adjacency.T).astype(bool).tocsr()
+
+
+def _label_graph(features, adjacency):
+    """Connected components among `features` of a feature graph
+
+    Returns
+    -------
+    (num, labels)
+      Number of components and component index (starting with 0) for each
+      of the given features.
+    """
+    order = np.argsort(features)
+    sfeatures = features[order]
+    nsel = len(sfeatures)
+    # gather the neighbor lists of all given features straight from the CSR
+    # structure (much cheaper than fancy-indexing the sparse matrix)
+    starts = adjacency.indptr[sfeatures]
+    counts = adjacency.indptr[sfeatures + 1] - starts
+    offsets = np.arange(counts.sum()) \
+        - np.repeat(np.cumsum(counts) - counts, counts)
+    nbrs = adjacency.indices[np.repeat(starts, counts) + offsets]
+    # only keep edges among the given features
+    cols = np.minimum(np.searchsorted(sfeatures, nbrs), nsel - 1)
+    keep = sfeatures[cols] == nbrs
+    cols = cols[keep]
+    # number of kept neighbors per feature -- `cols` is grouped by feature
+    kept = np.bincount(np.repeat(np.arange(nsel), counts)[keep],
+                       minlength=nsel)
+    rows = np.flatnonzero(kept)
+    segstarts = np.cumsum(kept) - kept
+    # union-find: hook every feature onto the smallest label among its
+    # neighbors and compress paths until nothing changes
+    labels = np.arange(nsel)
+    if len(rows):
+        segstarts = segstarts[rows]
+        while True:
+            new = labels.copy()
+            new[rows] = np.minimum(
+                new[rows], np.minimum.reduceat(labels[cols], segstarts))
+            new = new[new]
+            if np.all(new == labels):
+                break
+            labels = new
+    roots, labels = np.unique(labels, return_inverse=True)
+    # back into the order of the input features
+    flabels = np.empty(nsel, dtype=int)
+    flabels[order] = labels
+    return len(roots), flabels
+
+
+def _get_graph_cluster_labels(map_, adjacency):
+    """Label clusters of non-zero features in a map given a feature graph
+
+    Same return values as ``scipy.ndimage.measurements.label``.
+    """
+    features = np.flatnonzero(map_)
+    labels = np.zeros(len(map_), dtype=int)
+    if not len(features):
+        return labels, 0
+    num, flabels = _label_graph(features, adjacency)
+    labels[features] = flabels + 1
+    return labels, num
+
+
+def _get_graph_cluster_sizes(features, adjacency):
+    if not len(features):
+        return [0]
+    return np.bincount(_label_graph(features, adjacency)[1])
+
+
+def get_cluster_sizes(ds, cluster_counter=None, adjacency=None):
     """Compute cluster sizes from all samples in a boolean dataset.
 
     Individually for each sample, in the input dataset, clusters of non-zero
     values will be determined after reverse-applying any transformation of the
-    dataset's mapper (if any).
+    dataset's mapper (if any), or as connected components of a feature
+    graph.
 
     Parameters
     ----------
@@ -491,6 +737,10 @@ def get_cluster_sizes(ds, cluster_counter=None):
     cluster_counter : list or None
       If not None, given list is extended with the cluster sizes computed
       from the present input dataset. Otherwise, a new list is generated.
+    adjacency : sparse matrix or None
+      If not None, a symmetric (nfeatures x nfeatures) adjacency matrix of
+      the features. Clusters are then determined directly on the samples
+      without any reverse-mapping.
 
     Returns
     -------
@@ -508,6 +758,10 @@ def get_cluster_sizes(ds, cluster_counter=None):
         mapper = ds.a.mapper
 
     for i in xrange(len(ds)):
+        if adjacency is not None:
+            cluster_counter.update(
+                _get_graph_cluster_sizes(np.flatnonzero(data[i]), adjacency))
+            continue
         osamp = _verified_reverse1(mapper, data[i])
         m_clusters = _get_map_cluster_sizes(osamp)
         cluster_counter.update(m_clusters)
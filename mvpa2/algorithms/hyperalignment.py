@@ -20,10 +20,14 @@ __docformat__ = 'restructuredtext'
 # don't leak the world
 __all__ = ['Hyperalignment']
 
+from itertools import islice
+
 from mvpa2.support.copy import deepcopy
+from mvpa2.support.utils import dump_to_tempfile, load_from_tempfile
 
 import numpy as np
 
+from mvpa2.base import externals
 from mvpa2.base.state import ConditionalAttribute, ClassWithCollections
 from mvpa2.base.param import Parameter
 from mvpa2.base.constraints import *
@@ -161,10 +165,25 @@ class Hyperalignment(ClassWithCollections):
             updated common space, and is subsequently called again after each
             2nd-level iteration.""")
 
+    nproc = Parameter(1, constraints=EnsureInt() & EnsureRange(min=1)
+                                     | EnsureNone(),
+            doc="""Number of processes to use for aligning the datasets with
+            the common space in the 2nd and 3rd level, where all datasets
+            are aligned independently with the same common space.  The
+            common space is shared read-only with the child processes, and
+            the results are identical to those of a single process.
+            Requires `pprocess` module for values other than 1.  If None --
+            all available cores are used.""")
+
 
     def __init__(self, **kwargs):
         ClassWithCollections.__init__(self, **kwargs)
         self.commonspace = None
+        if self.params.nproc != 1 and not externals.exists('pprocess'):
+            raise RuntimeError("The 'pprocess' module is required for "
+                               "multiprocess hyperalignment. Please either "
+                               "install python-pprocess, or set `nproc` "
+                               "to 1 (got nproc=%s)" % self.params.nproc)
 
 
     @due.dcite(
@@ -249,9 +268,13 @@ class Hyperalignment(ClassWithCollections):
             commonspace = commonspace.astype(float)
             zscore(commonspace, chunks_attr=None)
 
-        # create a mapper per dataset
+        # create a mapper per dataset, unless transformations could be
+        # estimated without them
         # might prefer some other way to initialize... later
-        mappers = [deepcopy(params.alignment) for ds in datasets]
+        if self._supports_batch():
+            mappers = None
+        else:
+            mappers = [deepcopy(params.alignment) for ds in datasets]
 
         #
         # Level 1 -- initial projection
@@ -340,24 +363,114 @@ class Hyperalignment(ClassWithCollections):
         return datasets, wmappers
 
 
+    def _supports_batch(self):
+        """Whether alignments could be estimated without mappers at once"""
+        alignment = self.params.alignment
+        return type(alignment) is ProcrusteanMapper \
+               and alignment.supports_batch
+
+
+    def _train_alignments(self, datasets, targets, mappers):
+        """Align each dataset with its target space
+
+        With `nproc` > 1 the datasets are split into contiguous blocks,
+        which are aligned in child processes.
+
+        Parameters
+        ----------
+        datasets : sequence of datasets
+        targets : iterable of arrays
+          Target spaces, consumed in the order of datasets.
+        mappers : list of mappers or None
+          Mappers to be trained, or None if alignments should be estimated
+          in a batch without mappers (see `_supports_batch()`).
+
+        Returns
+        -------
+        list
+          Per each dataset a trained mapper or a transformation (see
+          `ProcrusteanMapper.get_batch_transformations()`).
+        """
+        nproc = self.params.nproc
+        if nproc is None:
+            import pprocess
+            nproc = pprocess.get_number_of_cores() or 1
+        nproc = min(nproc, len(datasets))
+        if nproc <= 1:
+            return self._train_alignments_block(datasets, targets, mappers)
+
+        import pprocess
+        if __debug__:
+            debug('HPAL_', "Starting off %i child processes to align %i "
+                  "datasets" % (nproc, len(datasets)))
+        blocks = np.array_split(np.arange(len(datasets)), nproc)
+        # Map keeps the results in the order of blocks
+        results = pprocess.Map(limit=nproc)
+        compute = results.manage(
+            pprocess.MakeParallel(self._train_alignments_block_file))
+        targets = iter(targets)
+        for block in blocks:
+            # children are forked, so they get the datasets and (possibly
+            # shared) target spaces without copying
+            compute([datasets[i] for i in block],
+                    list(islice(targets, len(block))),
+                    None if mappers is None else [mappers[i] for i in block])
+        alignments = []
+        for results_file in results:
+            alignments.extend(load_from_tempfile(results_file))
+        return alignments
+
+
+    def _train_alignments_block_file(self, datasets, targets, mappers):
+        """Align datasets in a child process and store results into a file
+
+        Transfer of large results through pprocess' channels is very slow,
+        so only the name of the temporary file is sent back.
+        """
+        alignments = self._train_alignments_block(datasets, targets, mappers)
+        return dump_to_tempfile(alignments, prefix='tmphpal')
+
+
+    def _train_alignments_block(self, datasets, targets, mappers):
+        """Align each dataset with its target space in the current process
+        """
+        if mappers is None:
+            return self.params.alignment.get_batch_transformations(
+                [ds.samples for ds in datasets], targets)
+        for m, ds_new, target in zip(mappers, datasets, targets):
+            # assign target space to ``space`` of the mapper, because this is
+            # where it will be looking for it
+            ds_new.sa[m.get_space()] = target
+            # find transformation of this dataset into the target space
+            m.train(ds_new)
+            # remove common space attribute again to save on memory when the
+            # common space is updated for the next iteration
+            del ds_new.sa[m.get_space()]
+        return mappers
+
+
+    @staticmethod
+    def _forward_alignment(alignment, data):
+        """Project data with a mapper or a transformation"""
+        if isinstance(alignment, tuple):
+            return ProcrusteanMapper.forward_transformation(data, alignment)
+        return alignment.forward(data)
+
+
     def _level1(self, datasets, commonspace, ref_ds, mappers, residuals):
         params = self.params            # for quicker access ;)
         data_mapped = [ds.samples for ds in datasets]
-        for i, (m, ds_new) in enumerate(zip(mappers, datasets)):
+        for i, ds_new in enumerate(datasets):
             if __debug__:
                 debug('HPAL_', "Level 1: ds #%i" % i)
             if i == ref_ds:
                 continue
-            # assign common space to ``space`` of the mapper, because this is
-            # where it will be looking for it
-            ds_new.sa[m.get_space()] = commonspace
             # find transformation of this dataset into the current common space
-            m.train(ds_new)
-            # remove common space attribute again to save on memory when the
-            # common space is updated for the next iteration
-            del ds_new.sa[m.get_space()]
+            alignment = self._train_alignments(
+                [ds_new], [commonspace],
+                None if mappers is None else [mappers[i]])[0]
             # project this dataset into the current common space
-            ds_ = m.forward(ds_new.samples)
+            ds_ = self._forward_alignment(alignment, ds_new.samples)
             if params.zscore_common:
                 zscore(ds_, chunks_attr=None)
             # replace original dataset with mapped one -- only the reference
@@ -392,13 +505,12 @@ class Hyperalignment(ClassWithCollections):
         #zscore(commonspace, chunks_attr=None)
 
         ndatasets = len(datasets)
-        for loop in xrange(params.level2_niter):
-            # 2nd-level alignment starts from the original/unprojected datasets
-            # again
-            for i, (m, ds_new) in enumerate(zip(mappers, datasets)):
-                if __debug__:
-                    debug('HPAL_', "Level 2 (%i-th iteration): ds #%i" % (loop, i))
 
+        def temp_commonspaces(commonspace):
+            for i in xrange(ndatasets):
+                if __debug__:
+                    debug('HPAL_', "Level 2 (%i-th iteration): ds #%i"
+                          % (loop, i))
                 # Optimization speed up heuristic
                 # Slightly modify the common space towards other feature
                 # spaces and reduce influence of this feature space for the
@@ -408,15 +520,17 @@ class Hyperalignment(ClassWithCollections):
 
                 if params.zscore_common:
                     zscore(temp_commonspace, chunks_attr=None)
-                # assign current common space
-                ds_new.sa[m.get_space()] = temp_commonspace
-                # retrain the mapper for this dataset
-                m.train(ds_new)
-                # remove common space attribute again to save on memory when the
-                # common space is updated for the next iteration
-                del ds_new.sa[m.get_space()]
+                yield temp_commonspace
+
+        for loop in xrange(params.level2_niter):
+            # 2nd-level alignment starts from the original/unprojected datasets
+            # again, all of them aligned with the same common space, so
+            # mapped data is updated only afterwards
+            alignments = self._train_alignments(
+                datasets, temp_commonspaces(commonspace), mappers)
+            for i, (alignment, ds_new) in enumerate(zip(alignments, datasets)):
                 # obtain the 2nd-level projection
-                ds_ =  m.forward(ds_new.samples)
+                ds_ = self._forward_alignment(alignment, ds_new.samples)
                 if params.zscore_common:
                     zscore(ds_, chunks_attr=None)
                 # store for 2nd-level combiner
@@ -438,7 +552,10 @@ class Hyperalignment(ClassWithCollections):
     def _level3(self, datasets):
         params = self.params            # for quicker access ;)
         # create a mapper per dataset
-        mappers = [deepcopy(params.alignment) for ds in datasets]
+        if self._supports_batch():
+            mappers = None
+        else:
+            mappers = [deepcopy(params.alignment) for ds in datasets]
 
         # key different from level-2; the common space is uniform
         #temp_commonspace = commonspace
@@ -449,19 +566,22 @@ class Hyperalignment(ClassWithCollections):
             self.ca.residual_errors = Dataset(samples=residuals)
 
         # start from original input datasets again
-        for i, (m, ds_new) in enumerate(zip(mappers, datasets)):
-            if __debug__:
-                debug('HPAL_', "Level 3: ds #%i" % i)
-
-            # retrain mapper on final common space
-            ds_new.sa[m.get_space()] = self.commonspace
-            m.train(ds_new)
-            # remove common space attribute again to save on memory
-            del ds_new.sa[m.get_space()]
+        if __debug__:
+            debug('HPAL_', "Level 3: %i datasets" % len(datasets))
+        # retrain mappers on final common space
+        alignments = self._train_alignments(
+            datasets, [self.commonspace] * len(datasets), mappers)
 
-            if residuals is not None:
+        if residuals is not None:
+            for i, (alignment, ds_new) in enumerate(zip(alignments, datasets)):
                 # obtain final projection
-                data_mapped = m.forward(ds_new.samples)
+                data_mapped = self._forward_alignment(alignment,
+                                                      ds_new.samples)
                 residuals[0, i] = np.linalg.norm(data_mapped - self.commonspace)
 
-        return mappers
+        if mappers is None:
+            # only now create the mappers
+            return [params.alignment.from_transformation(t)
+                    for t in alignments]
+        # mappers trained in child processes are copies
+        return alignments
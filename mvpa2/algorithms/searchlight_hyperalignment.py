@@ -32,7 +32,7 @@ if externals.exists('h5py'):
     from mvpa2.base.hdf5 import h5save, h5load
 
 if externals.exists('scipy'):
-    from scipy.sparse import coo_matrix, csc_matrix
+    from scipy.sparse import coo_matrix
 
 from mvpa2.support.due import due, Doi
 
@@ -49,6 +49,98 @@ if __debug__:
             debug('SHPAL', "%s" % msg)
 
 
+class _TripletsAccumulator(object):
+    """Collects (row, column, value) triplets of a sparse matrix
+
+    Triplets are appended to preallocated arrays which grow geometrically,
+    and the sparse matrix is constructed only once with duplicate entries
+    summed.  Whenever arrays are about to grow, duplicates accumulated so
+    far are summed first, so overlapping entries do not inflate memory.
+    """
+
+    def __init__(self, dtype, size=1024):
+        self._rows = np.empty(size, dtype=np.int32)
+        self._cols = np.empty(size, dtype=np.int32)
+        self._values = np.empty(size, dtype=dtype)
+        self._n = 0
+
+    def __len__(self):
+        return self._n
+
+    @property
+    def shape(self):
+        """Minimal shape of a matrix holding all the triplets"""
+        if not self._n:
+            return (0, 0)
+        return (self._rows[:self._n].max() + 1,
+                self._cols[:self._n].max() + 1)
+
+    def _reserve(self, n):
+        """Assure there is space for n more triplets"""
+        size = len(self._values)
+        if self._n + n <= size:
+            return
+        # first try to make space by summing duplicates
+        self._compact()
+        if self._n + n <= size // 2:
+            return
+        size = max(2 * size, self._n + n)
+        for attr in ('_rows', '_cols', '_values'):
+            old = getattr(self, attr)
+            new = np.empty(size, dtype=old.dtype)
+            new[:self._n] = old[:self._n]
+            setattr(self, attr, new)
+
+    def _compact(self):
+        """Sum duplicate triplets"""
+        if not self._n:
+            return
+        coo = self.tocsc().tocoo()
+        n = coo.nnz
+        self._rows[:n] = coo.row
+        self._cols[:n] = coo.col
+        self._values[:n] = coo.data
+        self._n = n
+
+    def add(self, rows, cols, values):
+        """Add triplets
+
+        `cols` (or `rows`) could be a scalar to be used for all values.
+        """
+        values = np.asanyarray(values).ravel()
+        n = len(values)
+        self._reserve(n)
+        sl = slice(self._n, self._n + n)
+        self._rows[sl] = rows
+        self._cols[sl] = cols
+        self._values[sl] = values
+        self._n += n
+
+    def add_matrix(self, m):
+        """Add all non-zero elements of a (sparse) matrix"""
+        coo = coo_matrix(m)
+        self.add(coo.row, coo.col, coo.data)
+
+    def tocsc(self, shape=None):
+        """Build CSC matrix with duplicate triplets summed
+
+        Parameters
+        ----------
+        shape : tuple, optional
+          Minimal shape of the matrix.  It is enlarged to hold all the
+          triplets if necessary.
+        """
+        n = self._n
+        if shape is None:
+            shape = self.shape
+        else:
+            shape = tuple(max(s, t) for s, t in zip(shape, self.shape))
+        return coo_matrix((self._values[:n],
+                           (self._rows[:n], self._cols[:n])),
+                          shape=shape,
+                          dtype=self._values.dtype).tocsc()
+
+
 @due.dcite(
     Doi('10.1016/j.neuron.2011.08.026'),
     description="Per-feature measure of maximal correlation to features in other datasets",
@@ -364,8 +456,7 @@ class SearchlightHyperalignment(ClassWithCollections):
         if __debug__:
             debug('SLC', 'Starting computing block for %i elements' % len(block))
         bar = ProgressBar()
-        projections = [csc_matrix((self.nfeatures, self.nfeatures),
-                                  dtype=self.params.dtype)
+        projections = [_TripletsAccumulator(self.params.dtype)
                        for isub in range(self.ndatasets)]
         for i, node_id in enumerate(block):
             # retrieve the feature ids of all features in the ROI from the query
@@ -399,26 +490,19 @@ class SearchlightHyperalignment(ClassWithCollections):
             roi_feature_ids_ref_ds = roi_feature_ids_all[self.params.ref_ds]
             for isub, roi_feature_ids in enumerate(roi_feature_ids_all):
                 if not self.params.combine_neighbormappers:
-                    I = roi_feature_ids
-                    #J = [roi_feature_ids[node_id]] * len(roi_feature_ids)
-                    J = [node_id] * len(roi_feature_ids)
-                    V = hmappers[isub].tolist()
-                    if np.isscalar(V):
-                        V = [V]
+                    projections[isub].add(roi_feature_ids, node_id,
+                                          hmappers[isub])
                 else:
-                    I, J, V = [], [], []
-                    for f2, roi_feature_id_ref_ds in enumerate(roi_feature_ids_ref_ds):
-                        I += roi_feature_ids
-                        J += [roi_feature_id_ref_ds] * len(roi_feature_ids)
-                        V += hmappers[isub][:, f2].tolist()
-                proj = coo_matrix(
-                    (V, (I, J)),
-                    shape=(max(self.nfeatures, max(I) + 1), max(self.nfeatures, max(J) + 1)),
-                    dtype=self.params.dtype)
-                proj = proj.tocsc()
+                    # all elements of the mapper, column after column
+                    projections[isub].add(
+                        np.tile(roi_feature_ids, len(roi_feature_ids_ref_ds)),
+                        np.repeat(roi_feature_ids_ref_ds, len(roi_feature_ids)),
+                        np.asarray(hmappers[isub]).T)
                 # Cleaning up the current subject's projections to free up memory
-                hmappers[isub] = [[] for _ in hmappers]
-                projections[isub] = projections[isub] + proj
+                hmappers[isub] = None
+        # a single sparse matrix per subject for the whole block
+        projections = [p.tocsc((self.nfeatures, self.nfeatures))
+                       for p in projections]
 
         if self.params.results_backend == 'native':
             return projections
@@ -447,7 +531,7 @@ class SearchlightHyperalignment(ClassWithCollections):
                 debug('SLC_', "Loaded results of len=%d from"
                       % len(results_data))
             for isub, res in enumerate(results_data):
-                self.projections[isub] = self.projections[isub] + res
+                self.projections[isub].add_matrix(res)
             return
 
     def __handle_all_results(self, results):
@@ -587,11 +671,10 @@ class SearchlightHyperalignment(ClassWithCollections):
                     deterministic=True)
                 roi_ids = [params.mask_node_ids[sid] for sid in sidx]
 
-        # Initialize projections
+        # Initialize projections, accumulating results of all blocks
         _shpaldebug('Initializing projection matrices')
-        self.projections = [
-            csc_matrix((self.nfeatures, self.nfeatures), dtype=params.dtype)
-            for isub in range(self.ndatasets)]
+        self.projections = [_TripletsAccumulator(params.dtype)
+                            for isub in range(self.ndatasets)]
 
         # compute
         if params.nproc is not None and params.nproc > 1:
@@ -629,6 +712,8 @@ class SearchlightHyperalignment(ClassWithCollections):
         results_ds = self.__handle_all_results(p_results)
         # Dummy iterator for, you know, iteration
         list(results_ds)
+        self.projections = [p.tocsc((self.nfeatures, self.nfeatures))
+                            for p in self.projections]
 
         _shpaldebug('Wrapping projection matrices into StaticProjectionMappers')
         self.projections = [
@@ -447,6 +447,10 @@ class AttrDataset(object):
                 # masks). TODO check in __debug__? or may be just do
                 # enforcing of proper dimensions and order manually?
                 samples = self.samples[np.ix_(*args)]
+        elif getattr(self.samples, 'orthogonal_indexing', False):
+            # container selects along both axes at once, e.g. reading only
+            # the selected block from a file
+            samples = self.samples[args[0], args[1]]
         else:
             # in all other cases we have to do the selection sequentially
             #
@@ -542,7 +546,7 @@ class AttrDataset(object):
         return self.shape[0]
 
     @classmethod
-    def from_hdf5(cls, source, name=None):
+    def from_hdf5(cls, source, name=None, lazy=False):
         """Load a Dataset from HDF5 file
 
         Parameters
@@ -553,6 +557,11 @@ class AttrDataset(object):
           If file contains multiple entries at the 1st level, if
           provided, `name` specifies the group to be loaded as the
           AttrDataset.
+        lazy : bool, optional
+          If True, samples are read from the file only when selected
+          (e.g. ``ds[:10, roi_mask]`` reads just that block), while
+          attributes are loaded right away.  The file then stays open
+          as long as the samples are in use.
 
         Returns
         -------
@@ -567,7 +576,7 @@ class AttrDataset(object):
                 "Missing 'h5py' package -- saving is not possible.")
 
         import h5py
-        from mvpa2.base.hdf5 import hdf2obj
+        from mvpa2.base.hdf5 import hdf2obj, _LAZY_MEMO_KEY
 
         # look if we got an hdf file instance already
         if isinstance(source, h5py.highlevel.File):
@@ -576,6 +585,8 @@ class AttrDataset(object):
         else:
             own_file = True
             hdf = h5py.File(source, 'r')
+        # tracks reconstructed objects, and samples provided lazily
+        memo = {}
 
         if name is not None:
             # some HDF5 subset is requested
@@ -586,7 +597,7 @@ class AttrDataset(object):
 
             # access the group that should contain the dataset
             dsgrp = hdf[name]
-            res = hdf2obj(dsgrp)
+            res = hdf2obj(dsgrp, memo=memo, lazy=lazy)
             if not isinstance(res, AttrDataset):
                 # TODO: unittest before committing
                 raise ValueError("%r in %s contains %s not a dataset.  "
@@ -594,13 +605,13 @@ class AttrDataset(object):
                                  % (name, source, type(res), hdf.keys()))
         else:
             # just consider the whole file
-            res = hdf2obj(hdf)
+            res = hdf2obj(hdf, memo=memo, lazy=lazy)
             if not isinstance(res, AttrDataset):
                 # TODO: unittest before committing
                 raise ValueError("Failed to load a dataset from %s.  "
                                  "Loaded %s instead."
                                  % (source, type(res)))
-        if own_file:
+        if own_file and not memo.get(_LAZY_MEMO_KEY):
             hdf.close()
         return res
 
@@ -1218,7 +1229,8 @@ DAE = DatasetAttributeExtractor
 
 
 @datasetmethod
-def save(dataset, destination, name=None, compression=None):
+def save(dataset, destination, name=None, compression=None,
+         dataset_layout='generic', samples_chunks=None):
     """Save Dataset into HDF5 file
 
     Parameters
@@ -1228,6 +1240,11 @@ def save(dataset, destination, name=None, compression=None):
     name : str, optional
     compression : None or int or {'gzip', 'szip', 'lzf'}, optional
       Level of compression for gzip, or another compression strategy.
+    dataset_layout : {'generic', 'columnar'}, optional
+      How the dataset is stored in the file (see `obj2hdf()`).
+    samples_chunks : {None, 'samples', 'features', True} or tuple, optional
+      Chunking of the samples in the file with 'columnar' `dataset_layout`
+      (see `obj2hdf()`).
     """
     if not externals.exists('h5py'):
         raise RuntimeError("Missing 'h5py' package -- saving is not possible.")
@@ -1243,7 +1260,8 @@ def save(dataset, destination, name=None, compression=None):
         own_file = True
         hdf = h5py.File(destination, 'w')
 
-    obj2hdf(hdf, dataset, name, compression=compression)
+    obj2hdf(hdf, dataset, name, compression=compression,
+            dataset_layout=dataset_layout, samples_chunks=samples_chunks)
 
     # if we opened the file ourselves we close it now
     if own_file:
@@ -62,7 +62,152 @@ class HDF5ConversionError(Exception):
     pass
 
 
-def hdf2obj(hdf, memo=None):
+class H5Samples(object):
+    """Samples container reading the data from an HDF5 dataset on demand.
+
+    It is used as ``samples`` of datasets loaded with ``lazy=True``.
+    Selecting samples and/or features of such a dataset reads only the
+    selected block from the file (via hyperslab selections), and the
+    resultant dataset holds the data in memory.  Conversion into an array
+    reads all the data.
+
+    The underlying HDF5 file is kept open as long as the container
+    exists.
+    """
+
+    # Dataset should pass selections along both axes at once
+    orthogonal_indexing = True
+
+    def __init__(self, hdf):
+        """
+        Parameters
+        ----------
+        hdf : h5py.Dataset
+          HDF5 dataset holding the samples.
+        """
+        self._hdf = hdf
+
+    shape = property(fget=lambda self: self._hdf.shape)
+    dtype = property(fget=lambda self: self._hdf.dtype)
+    ndim = property(fget=lambda self: len(self._hdf.shape))
+    size = property(fget=lambda self: self._hdf.size)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __repr__(self):
+        return '%s(%r)' % (self.__class__.__name__, self._hdf)
+
+    def __array__(self, dtype=None):
+        obj = _hdf_to_ndarray(self._hdf)
+        if dtype is not None:
+            obj = obj.astype(dtype)
+        return obj
+
+    def __deepcopy__(self, memo=None):
+        # deep copy must not share anything, so bring it into memory
+        return self.__array__()
+
+    def view(self):
+        """Return itself"""
+        return self
+
+    def __getitem__(self, args):
+        if not isinstance(args, tuple):
+            args = (args,)
+        if len(args) > self.ndim:
+            raise IndexError("Too many indices (%i) for %i dimensions"
+                             % (len(args), self.ndim))
+        shape = self.shape
+        read, post, squeeze = [], [], []
+        for axis, sel in enumerate(args):
+            n = shape[axis]
+            if isinstance(sel, (int, long, np.integer)):
+                squeeze.append(axis)
+                sel = [sel]
+            if isinstance(sel, slice):
+                if sel.step is None or sel.step > 0:
+                    # HDF5 can handle it directly
+                    read.append(slice(*sel.indices(n)))
+                    post.append(None)
+                    continue
+                sel = np.arange(*sel.indices(n))
+            sel = np.asanyarray(sel)
+            if sel.dtype == np.bool:
+                if len(sel) != n:
+                    raise IndexError("Boolean index of length %i does not "
+                                     "match %i elements" % (len(sel), n))
+                sel = np.nonzero(sel)[0]
+            elif len(sel):
+                sel = np.where(sel < 0, sel + n, sel)
+                if sel.min() < 0 or sel.max() >= n:
+                    raise IndexError("Index out of bounds for axis %i of "
+                                     "size %i" % (axis, n))
+            if not len(sel):
+                read.append(slice(0, 0))
+                post.append(None)
+                continue
+            # HDF5 needs increasing indices, order/repetitions are taken
+            # care of after reading
+            sel_u, inv = np.unique(sel, return_inverse=True)
+            if sel_u[-1] - sel_u[0] + 1 == len(sel_u):
+                read.append(slice(sel_u[0], sel_u[-1] + 1))
+            else:
+                read.append(sel_u)
+            if len(sel_u) == len(sel) and np.all(sel_u == sel):
+                # already ordered as needed
+                inv = None
+            post.append(inv)
+        # h5py allows for a single list of indices only, so read the
+        # block spanning the others and select within it
+        fancy = [i for i, r in enumerate(read) if not isinstance(r, slice)]
+        for axis in fancy[1:]:
+            sel_u = read[axis]
+            read[axis] = slice(sel_u[0], sel_u[-1] + 1)
+            inv = post[axis]
+            post[axis] = sel_u - sel_u[0] if inv is None \
+                         else (sel_u - sel_u[0])[inv]
+        out_shape = tuple(len(xrange(*r.indices(shape[i])))
+                          if isinstance(r, slice) else len(r)
+                          for i, r in enumerate(read)) + shape[len(read):]
+        if 0 in out_shape:
+            obj = np.empty(out_shape, dtype=self.dtype)
+        else:
+            obj = self._hdf[tuple(read)]
+        for axis, p in enumerate(post):
+            if p is not None:
+                obj = obj[(slice(None),) * axis + (p,)]
+        if len(squeeze):
+            obj = obj[tuple(0 if i in squeeze else slice(None)
+                            for i in xrange(len(read)))]
+        return obj
+
+
+def _can_be_read_lazily(hdf):
+    """Whether HDF5 dataset could be used via H5Samples"""
+    return isinstance(hdf, h5py.Dataset) \
+           and len(hdf.shape) >= 2 \
+           and not 'is_a_view' in hdf.attrs \
+           and not 'is_objarray' in hdf.attrs
+
+
+# key in the memo of hdf2obj to list H5Samples created while loading
+_LAZY_MEMO_KEY = '__lazy_samples__'
+
+
+def _lazy_samples(samples_hdf, memo):
+    """Provide samples stored in an HDF5 dataset via `H5Samples`"""
+    if __debug__:
+        debug('HDF5', "Provide samples [%s] lazily" % samples_hdf.name)
+    samples = H5Samples(samples_hdf)
+    if 'objref' in samples_hdf.attrs:
+        memo[samples_hdf.attrs['objref']] = samples
+    # so the caller knows that the file has to remain open
+    memo.setdefault(_LAZY_MEMO_KEY, []).append(samples)
+    return samples
+
+
+def hdf2obj(hdf, memo=None, lazy=False):
     """Convert an HDF5 group definition into an object instance.
 
     Obviously, this function assumes the conventions implemented in the
@@ -76,6 +221,10 @@ def hdf2obj(hdf, memo=None):
     memo : dict
       Dictionary tracking reconstructed objects to prevent recursions (analog to
       deepcopy).
+    lazy : bool
+      If True, samples of datasets are not read, but provided via
+      `H5Samples` which reads only the selected parts of them.  The file
+      has to remain open for that.
 
     Notes
     -----
@@ -144,9 +293,12 @@ def hdf2obj(hdf, memo=None):
                 debug('HDF5', "Found recon info %s.%s"
                               % (mod_name, hdf.attrs['recon']))
 
-        if 'recon' in hdf.attrs:
+        if 'dataset_layout' in hdf.attrs:
+            # Datasets stored by attribute columns
+            obj = _hdf_to_dataset(hdf, memo, lazy=lazy)
+        elif 'recon' in hdf.attrs:
             # Custom objects custom reconstructor
-            obj = _recon_customobj_customrecon(hdf, memo)
+            obj = _recon_customobj_customrecon(hdf, memo, lazy=lazy)
         elif mod_name != '__builtin__':
             # Custom objects default reconstructor
             cls_name = hdf.attrs['class']
@@ -240,7 +392,7 @@ def _update_obj_state_from_hdf(obj, hdf, memo):
             debug('HDF5', "Updated %i state items." % len(state))
 
 
-def _recon_customobj_customrecon(hdf, memo):
+def _recon_customobj_customrecon(hdf, memo, lazy=False):
     """Reconstruct a custom object from HDF using a custom recontructor"""
     # we found something that has some special idea about how it wants
     # to be reconstructed
@@ -279,7 +431,16 @@ def _recon_customobj_customrecon(hdf, memo):
                         obj = None
                 if obj is not None:
                     memo[hdf.attrs['objref']] = obj
-        recon_args = _hdf_tupleitems_to_obj(recon_args_hdf, memo)
+        if lazy and _is_dataset_recon(recon) \
+                and '0' in recon_args_hdf.get('items', {}) \
+                and _can_be_read_lazily(recon_args_hdf['items']['0']):
+            # samples of a dataset come first
+            samples = _lazy_samples(recon_args_hdf['items']['0'], memo)
+            recon_args = _hdf_list_to_obj(recon_args_hdf, memo, skip=(0,))
+            recon_args[0] = samples
+            recon_args = tuple(recon_args)
+        else:
+            recon_args = _hdf_tupleitems_to_obj(recon_args_hdf, memo)
     else:
         recon_args = ()
 
@@ -294,6 +455,12 @@ def _recon_customobj_customrecon(hdf, memo):
     return obj
 
 
+def _is_dataset_recon(recon):
+    """Whether the reconstructor is a dataset class"""
+    from mvpa2.base.dataset import AttrDataset
+    return isinstance(recon, type) and issubclass(recon, AttrDataset)
+
+
 def _import_from_thin_air(mod_name, importee, cls_name=None):
     if cls_name is None:
         cls_name = importee
@@ -429,13 +596,14 @@ def _hdf_list_to_objarray(hdf, memo):
     return obj
 
 
-def _hdf_list_to_obj(hdf, memo, target_container=None):
+def _hdf_list_to_obj(hdf, memo, target_container=None, skip=None):
     """Convert an HDF item sequence into a list
 
     Lists are used for storing also dicts.  To properly reference
     the actual items in memo, target_container could be specified
     to point to the actual data structure to be referenced, which
-    later would get populated with list's items.
+    later would get populated with list's items.  Items with indices
+    listed in `skip` are not loaded and left as None.
     """
     # new-style files have explicit length
     if 'length' in hdf.attrs:
@@ -479,6 +647,8 @@ def _hdf_list_to_obj(hdf, memo, target_container=None):
             memo[objref] = target_container
     # for all expected items
     for i in xrange(length):
+        if skip is not None and i in skip:
+            continue
         if __debug__:
             debug('HDF5', "Item %i" % i)
         str_i = str(i)
@@ -550,6 +720,57 @@ def _hdf_to_ndarray(hdf):
     return obj
 
 
+def _hdf_to_column(hdf, memo):
+    """Read an attribute array stored by `_column_to_hdf()`"""
+    if not isinstance(hdf, h5py.Dataset) or not 'is_column' in hdf.attrs:
+        # stored by the generic serializer
+        return hdf2obj(hdf, memo=memo)
+    if 'column_dtype' in hdf.attrs:
+        # strings stored with variable length
+        if hdf.size:
+            value = hdf[()]
+        else:
+            value = np.empty(hdf.shape, dtype=object)
+        return value.astype(np.dtype(hdf.attrs['column_dtype']))
+    return _hdf_to_ndarray(hdf)
+
+
+def _hdf_to_dataset(hdf, memo, lazy=False):
+    """Reconstruct a dataset stored by `_dataset_to_hdf()`"""
+    from mvpa2.base.collections import ArrayCollectable
+    mod, cls = _import_from_thin_air(hdf.attrs['module'], hdf.attrs['recon'])
+    if __debug__:
+        debug('HDF5', "Load %s with %s layout [%s]"
+                      % (cls.__name__, hdf.attrs['dataset_layout'], hdf.name))
+    # pre-create the instance, so references to it could be resolved
+    # while loading its attributes
+    obj = cls.__new__(cls)
+    if 'objref' in hdf.attrs:
+        memo[hdf.attrs['objref']] = obj
+
+    if 'samples' in hdf:
+        samples_hdf = hdf['samples']
+        if lazy and _can_be_read_lazily(samples_hdf):
+            samples = _lazy_samples(samples_hdf, memo)
+        else:
+            samples = hdf2obj(samples_hdf, memo=memo)
+    else:
+        # samples were already stored elsewhere
+        samples = memo[hdf.attrs['samples']]
+
+    cols = {}
+    for col in ('sa', 'fa'):
+        cols[col] = attrs = {}
+        # load in the order of storage
+        for k in sorted(hdf[col].keys()):
+            col_hdf = hdf[col][k]
+            k = str(k)
+            attrs[k] = ArrayCollectable(_hdf_to_column(col_hdf, memo), name=k)
+    a = hdf2obj(hdf['a'], memo=memo)
+    obj.__init__(samples, sa=cols['sa'], fa=cols['fa'], a=a)
+    return obj
+
+
 def _seqitems_to_hdf(obj, hdf, memo, noid=False, **kwargs):
     """Store a sequence as HDF item list"""
     hdf.attrs.create('length', len(obj))
@@ -560,7 +781,137 @@ def _seqitems_to_hdf(obj, hdf, memo, noid=False, **kwargs):
         obj2hdf(items, item, name=str(i), memo=memo, noid=noid, **kwargs)
 
 
-def obj2hdf(hdf, obj, name=None, memo=None, noid=False, **kwargs):
+# targeted size (in bytes) of a chunk of samples
+_SAMPLES_CHUNK_BYTES = 1024 ** 2
+
+
+def _get_samples_chunks(samples, chunking):
+    """Figure out the HDF5 chunk shape for samples
+
+    For 'samples' (or 'features') chunking, a chunk contains as many complete
+    samples (or features) as fit into `_SAMPLES_CHUNK_BYTES`, but at least
+    one.
+    """
+    if chunking is None or chunking is True or isinstance(chunking, tuple):
+        return chunking
+    if not chunking in ('samples', 'features'):
+        raise ValueError("Unknown chunking %r of samples. Known are "
+                         "'samples', 'features', True, or a tuple."
+                         % (chunking,))
+    shape = samples.shape
+    if not np.prod(shape):
+        # nothing to chunk
+        return None
+    axis = int(chunking == 'features')
+    # size of a single sample (or feature)
+    slab_bytes = samples.dtype.itemsize * int(np.prod(shape)) // shape[axis]
+    chunks = list(shape)
+    chunks[axis] = int(min(shape[axis],
+                           max(1, _SAMPLES_CHUNK_BYTES // slab_bytes)))
+    return tuple(chunks)
+
+
+def _is_native_dtype(dtype):
+    """Whether an array of that dtype is stored as is"""
+    return not dtype.names and (dtype.kind in 'biufc'
+                                or (dtype.kind == 'S' and dtype.itemsize))
+
+
+def _can_store_columnar(obj):
+    """Whether an object is a dataset that could be stored by columns"""
+    from mvpa2.base.dataset import AttrDataset
+    if not isinstance(obj, AttrDataset) \
+            or type(obj).__reduce__ != AttrDataset.__reduce__:
+        # custom reduction has to be respected
+        return False
+    samples = obj.samples
+    if not (isinstance(samples, np.ndarray)
+            or isinstance(samples, H5Samples)) \
+            or not _is_native_dtype(samples.dtype):
+        return False
+    # attribute names become names of HDF5 datasets
+    for k in obj.sa.keys() + obj.fa.keys():
+        if not isinstance(k, basestring) or '/' in k or k == '.':
+            return False
+    return True
+
+
+def _column_to_hdf(hdf, name, value, **kwargs):
+    """Store an attribute array as a single HDF5 dataset
+
+    Strings, also in object arrays, are stored with variable length.
+    Returns False if the array cannot be stored this way.
+    """
+    if not isinstance(value, np.ndarray) or not len(value.shape):
+        return False
+    dtype = value.dtype
+    if _is_native_dtype(dtype):
+        hdf.create_dataset(name, None, None, value, **kwargs)
+        hdf[name].attrs.create('is_column', True)
+        return True
+    if dtype.kind == 'U':
+        vlen = unicode
+    elif dtype.kind == 'O':
+        types = set(type(v) for v in value.flat)
+        if not len(types - set([str])):
+            vlen = str
+        elif types == set([unicode]):
+            vlen = unicode
+        else:
+            return False
+    else:
+        return False
+    if __debug__:
+        debug('HDF5', "Store %s array as variable length %s strings [%s/%s]"
+                      % (dtype, vlen.__name__, hdf.name, name))
+    hdf.create_dataset(name, None, h5py.special_dtype(vlen=vlen),
+                       value.astype(object), **kwargs)
+    hdf[name].attrs.create('is_column', True)
+    hdf[name].attrs.create('column_dtype', dtype.str)
+    return True
+
+
+def _dataset_to_hdf(grp, ds, memo, samples_chunks=None, **kwargs):
+    """Store a dataset with its sample and feature attributes as columns
+
+    Samples go into a single (optionally chunked) HDF5 dataset, and each
+    sample and feature attribute into its own HDF5 dataset, whenever its
+    values could be stored natively.  Other attributes, and all dataset
+    attributes, are stored by `obj2hdf()`.
+    """
+    grp.attrs.create('recon', ds.__class__.__name__)
+    grp.attrs.create('module', ds.__class__.__module__)
+    grp.attrs.create('dataset_layout', 'columnar')
+
+    samples = ds.samples
+    if isinstance(samples, H5Samples):
+        samples = np.asarray(samples)
+    samples_kwargs = kwargs.copy()
+    chunks = _get_samples_chunks(samples, samples_chunks)
+    if chunks is not None:
+        samples_kwargs['chunks'] = chunks
+    obj2hdf(grp, samples, name='samples', memo=memo, **samples_kwargs)
+
+    for col in ('sa', 'fa'):
+        col_grp = grp.create_group(col)
+        collection = getattr(ds, col)
+        # keep the order, so references among attributes could be resolved
+        for k in sorted(collection.keys()):
+            value = collection[k].value
+            if not _column_to_hdf(col_grp, k, value, **kwargs):
+                if __debug__:
+                    debug('HDF5', "Store attribute '%s' generically" % k)
+                obj2hdf(col_grp, value, name=k, memo=memo, noid=True,
+                        dataset_layout='columnar',
+                        samples_chunks=samples_chunks, **kwargs)
+    # need to set noid since the dict is temporary
+    obj2hdf(grp, dict(ds.a), name='a', memo=memo, noid=True,
+            dataset_layout='columnar', samples_chunks=samples_chunks,
+            **kwargs)
+
+
+def obj2hdf(hdf, obj, name=None, memo=None, noid=False,
+            dataset_layout='generic', samples_chunks=None, **kwargs):
     """Store an object instance in an HDF5 group.
 
     A given object instance is (recursively) disassembled into pieces that are
@@ -588,9 +939,32 @@ def obj2hdf(hdf, obj, name=None, memo=None, noid=False, **kwargs):
     noid : bool
       If True, the to be processed object has no usable id. Set if storing
       objects that were created temporarily, e.g. during type conversions.
+    dataset_layout : {'generic', 'columnar'}
+      How datasets are stored.  With 'columnar' the samples and each sample
+      and feature attribute are stored as individual HDF5 datasets (strings
+      with variable length), which is much faster to store and load than
+      the 'generic' disassembling of the dataset, especially for attributes
+      of strings in object arrays.  Files with datasets in 'columnar' layout
+      cannot be loaded by PyMVPA versions which precede it.
+    samples_chunks : {None, 'samples', 'features', True} or tuple
+      Chunking of the samples of datasets in 'columnar' layout (it is an
+      error to provide it for the 'generic' one).  With
+      'samples' (or 'features') chunks are made of complete samples (or
+      features), which makes reading subsets of samples (or features)
+      efficient.  True lets h5py choose the chunk shape, and a tuple
+      defines the chunk shape explicitly.  If None, samples are stored
+      contiguously, unless compression requires chunking.
     **kwargs
-      All additional arguments will be passed to `h5py.Group.create_dataset()`
+      All additional arguments will be passed to `h5py.Group.create_dataset()`,
+      e.g. compression filters (`compression`, `compression_opts`,
+      `shuffle`).
     """
+    if not dataset_layout in ('columnar', 'generic'):
+        raise ValueError("Unknown dataset_layout %r. Known are 'columnar' "
+                         "and 'generic'." % (dataset_layout,))
+    if samples_chunks is not None and dataset_layout != 'columnar':
+        raise ValueError("samples_chunks=%r requires dataset_layout="
+                         "'columnar'" % (samples_chunks,))
     if memo is None:
         # initialize empty recursion tracker
         memo = {}
@@ -611,6 +985,9 @@ def obj2hdf(hdf, obj, name=None, memo=None, noid=False, **kwargs):
             debug('HDF5', "Store '%s' by objref: %i" % (type(obj), obj_id))
         # done
         return
+    if isinstance(obj, H5Samples):
+        # samples provided lazily are stored as the array they provide
+        obj = np.asarray(obj)
 
     #
     # Ugly special case of arrays of objects
@@ -760,6 +1137,11 @@ def obj2hdf(hdf, obj, name=None, memo=None, noid=False, **kwargs):
 
     # TODO: should we confess about a n is_a_view again here similarly to how was done for is_objarray?
 
+    if dataset_layout == 'columnar' and _can_store_columnar(obj):
+        _dataset_to_hdf(grp, obj, memo, samples_chunks=samples_chunks,
+                        **kwargs)
+        return
+
     # standard containers need special treatment
     if not hasattr(obj, '__reduce__'):
         raise HDF5ConversionError("Cannot store class without __reduce__ "
@@ -833,13 +1215,15 @@ def obj2hdf(hdf, obj, name=None, memo=None, noid=False, **kwargs):
                     "Can't obj2hdf lambda functions. Got %r" % (obj,))
             grp.attrs.create('name', oname)
         if isinstance(obj, (list, tuple)):
-            _seqitems_to_hdf(obj, grp, memo, **kwargs)
+            _seqitems_to_hdf(obj, grp, memo, dataset_layout=dataset_layout,
+                             samples_chunks=samples_chunks, **kwargs)
         elif isinstance(obj, dict):
             if __debug__:
                 debug('HDF5', "Store dict as zipped list")
             # need to set noid since outer tuple containers are temporary
             _seqitems_to_hdf(zip(obj.keys(), obj.values()), grp, memo,
-                             noid=True, **kwargs)
+                             noid=True, dataset_layout=dataset_layout,
+                             samples_chunks=samples_chunks, **kwargs)
             grp['items'].attrs.create('__keys_in_tuple__', 1)
 
     else:
@@ -853,7 +1237,9 @@ def obj2hdf(hdf, obj, name=None, memo=None, noid=False, **kwargs):
                           % (pieces[0].__module__, pieces[0].__name__))
 
         args = grp.create_group('rcargs')
-        _seqitems_to_hdf(pieces[1], args, memo, **kwargs)
+        _seqitems_to_hdf(pieces[1], args, memo,
+                         dataset_layout=dataset_layout,
+                         samples_chunks=samples_chunks, **kwargs)
 
     # pull all remaining data from __reduce__
     if pieces is not None and len(pieces) > 2:
@@ -866,6 +1252,7 @@ def obj2hdf(hdf, obj, name=None, memo=None, noid=False, **kwargs):
                 debug('HDF5', "Storing object with None state")
         # need to set noid since state dict is unique to an object
         obj2hdf(grp, state, name='state', memo=memo, noid=True,
+                dataset_layout=dataset_layout, samples_chunks=samples_chunks,
                 **kwargs)
 
 
@@ -891,8 +1278,12 @@ def h5save(filename, data, name=None, mode='w', mkdir=True, **kwargs):
     mkdir : bool, optional
       Create target directory if it does not exist yet.
     **kwargs
-      All additional arguments will be passed to `h5py.Group.create_dataset`.
-      This could, for example, be `compression='gzip'`.
+      All additional arguments will be passed to `obj2hdf()`, e.g.
+      `dataset_layout` or `samples_chunks`, and from there on to
+      `h5py.Group.create_dataset`.  This could, for example, be
+      `compression='gzip'`.  Datasets are stored in the 'generic' layout,
+      unless `dataset_layout='columnar'`, which is faster, but cannot be
+      loaded by previous versions of PyMVPA.
     """
     if mkdir:
         target_dir = osp.dirname(filename)
@@ -907,7 +1298,7 @@ def h5save(filename, data, name=None, mode='w', mkdir=True, **kwargs):
         hdf.close()
 
 
-def h5load(filename, name=None):
+def h5load(filename, name=None, lazy=False):
     """Loads the content of an HDF5 file that has been stored by `h5save()`.
 
     This is a convenience wrapper around `hdf2obj()`. Please see its
@@ -919,6 +1310,12 @@ def h5load(filename, name=None):
       Name of the file to open and load its content.
     name : str
       Name of a specific object to load from the file.
+    lazy : bool
+      If True, samples of datasets are read from the file only when (and
+      as much as) they are selected (see `H5Samples`), while all the
+      attributes are loaded right away.  The file then remains open as
+      long as the samples are in use.  If nothing could be loaded lazily,
+      the file gets closed right away.
 
     Returns
     -------
@@ -926,12 +1323,14 @@ def h5load(filename, name=None):
       An object of whatever has been stored in the file.
     """
     hdf = h5py.File(filename, 'r')
+    # tracks reconstructed objects, and samples provided lazily
+    memo = {}
     try:
         if name is not None:
             if not name in hdf:
                 raise ValueError("No object of name '%s' in file '%s'."
                                  % (name, filename))
-            obj = hdf2obj(hdf[name])
+            obj = hdf2obj(hdf[name], memo=memo, lazy=lazy)
         else:
             if not len(hdf) and not len(hdf.attrs):
                 # there is nothing
@@ -941,19 +1340,22 @@ def h5load(filename, name=None):
                 if isinstance(hdf, h5py.Dataset) \
                         or ('class' in hdf.attrs or 'recon' in hdf.attrs):
                     # this is an object stored at the toplevel
-                    obj = hdf2obj(hdf)
+                    obj = hdf2obj(hdf, memo=memo, lazy=lazy)
                 else:
                     # no object into at the top-level, but maybe in the next one
                     # this would happen for plain mat files with arrays
                     if len(hdf) == 1 and '__unnamed__' in hdf:
                         # just a single with special name -> special case:
                         # return as is
-                        obj = hdf2obj(hdf['__unnamed__'])
+                        obj = hdf2obj(hdf['__unnamed__'], memo=memo, lazy=lazy)
                     else:
                         # otherwise build dict with content
                         obj = {}
                         for k in hdf:
-                            obj[k] = hdf2obj(hdf[k])
-    finally:
+                            obj[k] = hdf2obj(hdf[k], memo=memo, lazy=lazy)
+    except:
+        hdf.close()
+        raise
+    if not memo.get(_LAZY_MEMO_KEY):
         hdf.close()
     return obj
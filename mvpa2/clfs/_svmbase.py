@@ -105,7 +105,14 @@ class _SVM(Classifier):
         # in comparison to how it was before (in yoh/master) by up to 20%... not clear why
         # may be related to 1e-3 default within _svm.py?
         'epsilon': Parameter(5e-5, min=1e-10,
-                  doc='Tolerance of termination criteria. (For nu-SVM default is 0.001)')
+                  doc='Tolerance of termination criteria. (For nu-SVM default is 0.001)'),
+        'warm_start': Parameter(False, constraints='bool',
+                  doc='Either to start training from the solution of the '
+                      'previous training on the same samples (e.g. with '
+                      'some features removed as in RFE). Solution is the '
+                      'same up to the tolerance of termination criteria, '
+                      'and usually takes fewer iterations, which does not '
+                      'necessarily make training faster'),
         }
 
     _KNOWN_PARAMS = ()                  # just a placeholder to please lintian
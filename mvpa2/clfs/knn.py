@@ -52,6 +52,10 @@ class kNN(Classifier):
     choosing a class with minimal mean distance to the corresponding
     k-neighbors.
 
+    Distances are computed for chunks of test samples at a time (see
+    `chunk_size`), so memory consumption stays bounded for large test
+    sets, and votes of all the samples in a chunk are counted at once.
+
     Notes
     -----
     If enabled, kNN stores the votes per class in the 'values' state after
@@ -66,7 +70,7 @@ class kNN(Classifier):
     __tags__ = ['knn', 'non-linear', 'binary', 'multiclass', 'oneclass']
 
     def __init__(self, k=2, dfx=squared_euclidean_distance,
-                 voting='weighted', **kwargs):
+                 voting='weighted', chunk_size=1000, **kwargs):
         """
         Parameters
         ----------
@@ -80,6 +84,10 @@ class kNN(Classifier):
           Possible values are 'majority' (simple majority of classes
           determines vote) and 'weighted' (votes are weighted according to the
           relative frequencies of each class in the training data).
+        chunk_size : int or None
+          Number of test samples to compute distances to the training
+          samples for at once.  If None, distances for all test samples
+          are computed at once.
         **kwargs
           Additional arguments are passed to the base class.
         """
@@ -90,6 +98,7 @@ class kNN(Classifier):
         self.__k = k
         self.__dfx = dfx
         self.__voting = voting
+        self.__chunk_size = chunk_size
         self.__data = None
         self.__weights = None
 
@@ -102,6 +111,8 @@ class kNN(Classifier):
         return super(kNN, self).__repr__(
             ["k=%d" % self.__k, "dfx=%s" % self.__dfx,
              "voting=%s" % repr(self.__voting)]
+            + (["chunk_size=%r" % self.__chunk_size]
+               if self.__chunk_size != 1000 else [])
             + prefixes)
 
 
@@ -119,6 +130,8 @@ class kNN(Classifier):
         labels = data.sa[self.get_space()].value
         uniquelabels = data.sa[self.get_space()].unique
         Nuniquelabels = len(uniquelabels)
+        # indices of the labels of training samples among uniquelabels
+        self.__label_ids = np.unique(labels, return_inverse=True)[1]
 
         if __debug__:
             if str(data.samples.dtype).startswith('uint') \
@@ -140,14 +153,10 @@ class kNN(Classifier):
             weights = \
                 [ 1.0 - ((labels == label).sum() / Nlabels) \
                     for label in uniquelabels ]
-            self.__weights = dict(zip(uniquelabels, weights))
+            self.__weights = np.array(weights)
         else:
             self.__weights = None
 
-        # create dictionary with an item for each condition
-        self.__votes_init = dict(zip(uniquelabels,
-                                     [0] * Nuniquelabels))
-
 
     @accepts_dataset_as_samples
     def _predict(self, data):
@@ -172,74 +181,118 @@ class kNN(Classifier):
                 raise ValueError, "Length of data samples (features) does " \
                                   "not match the classifier."
 
-        # compute the distance matrix between training and test data with
-        # distances stored row-wise, i.e. distances between test sample [0]
-        # and all training samples will end up in row 0
-        dists = self.__dfx(self.__data.samples, data).T
-        if self.ca.is_enabled('distances'):
-            # .sa.copy() now does deepcopying by default
-            self.ca.distances = Dataset(dists, fa=self.__data.sa.copy())
-
-        # determine the k nearest neighbors per test sample
-        knns = dists.argsort(axis=1)[:, :self.__k]
-
-        # predictions and votes for all samples
-        all_votes, predictions = [], []
-        for inns, nns in enumerate(knns):
-            votes = self.__votes_init.copy()
-            # TODO: optimize!
-            for nn in nns:
-                votes[labels[nn]] += 1
-
-            # optionally weight votes
-            if self.__voting == 'majority':
-                pass
-            elif self.__voting == 'weighted':
-                # TODO: optimize!
-                for ul in uniquelabels:
-                    votes[ul] *= self.__weights[ul]
-            else:
-                raise ValueError, "kNN told to perform unknown voting '%s'." \
-                      % self.__voting
-
-            # reverse dictionary items and sort them to get the
-            # winners
-            # It would be more expensive than just to look for
-            # the maximum, but this piece should be the least
-            # cpu-intensive while distances computation should consume
-            # the most. Also it would allow to look and break the ties
-            votes_reversed = sorted([(v, k) for k, v in votes.iteritems()],
-                                    reverse=True)
-            # check for ties
-            max_vote, max_vote_label = votes_reversed[0]
-
-            if len(votes_reversed) > 1 and max_vote == votes_reversed[1][0]:
-                # figure out all ties and break them based on the mean
-                # distance
-                # TODO: theoretically we could break out of the loop earlier
-                ties = [x[1] for x in votes_reversed if x[0] == max_vote]
-
-                # compute mean distances to the corresponding clouds
-                # restrict analysis only to k-nn's
-                nns_labels = labels[nns]
-                nns_dists = dists[inns][nns]
-                ties_dists = [np.mean(nns_dists[nns_labels == t]) for t in ties]
-                max_vote_label = ties[np.argmin(ties_dists)]
-                if __debug__:
-                    debug('KNN',
-                          'Ran into the ties: %s with votes: %s, dists: %s, max_vote %r',
-                          (ties, votes_reversed, ties_dists, max_vote_label))
+        if not self.__voting in ('majority', 'weighted'):
+            raise ValueError, "kNN told to perform unknown voting '%s'." \
+                  % self.__voting
 
+        chunk_size = self.__chunk_size or len(data)
+        store_dists = self.ca.is_enabled('distances')
+        all_dists, all_votes, predictions = [], [], []
+        for start in xrange(0, len(data), chunk_size):
+            votes, chunk_predictions, dists = \
+                   self.__predict_chunk(data[start:start + chunk_size])
             all_votes.append(votes)
-            predictions.append(max_vote_label)
+            predictions += chunk_predictions
+            if store_dists:
+                all_dists.append(dists)
+
+        if store_dists:
+            # .sa.copy() now does deepcopying by default
+            self.ca.distances = Dataset(
+                np.vstack(all_dists) if len(all_dists)
+                else np.zeros((0, len(labels))),
+                fa=self.__data.sa.copy())
+
+        if self.ca.is_enabled('estimates'):
+            # votes per each class for each sample
+            self.ca.estimates = [dict(zip(uniquelabels, votes))
+                                 for votes in np.vstack(all_votes)] \
+                                if len(all_votes) else []
 
         # store the predictions in the state. Relies on State._setitem to do
         # nothing if the relevant state member is not enabled
         self.ca.predictions = predictions
-        self.ca.estimates = all_votes # np.array([r[1] for r in results])
 
         return predictions
 
+
+    def __predict_chunk(self, data):
+        """Predict the class labels for a chunk of test samples
+
+        Returns
+        -------
+        votes : ndarray
+          Votes per each class (columns) for each sample (rows).
+        predictions : list
+          Class labels.
+        dists : ndarray
+          Distances between the test samples (rows) and all training
+          samples (columns).
+        """
+        uniquelabels = self.__data.sa[self.get_space()].unique
+        Nuniquelabels = len(uniquelabels)
+        label_ids = self.__label_ids
+
+        # compute the distance matrix between training and test data with
+        # distances stored row-wise, i.e. distances between test sample [0]
+        # and all training samples will end up in row 0
+        dists = np.asarray(self.__dfx(self.__data.samples, data)).T
+
+        # determine the k nearest neighbors per test sample without sorting
+        # all the distances.  Among equally distant neighbors the ones
+        # earlier in the training data are taken.
+        k = min(self.__k, dists.shape[1])
+        # undefined distances (e.g. correlation with a constant sample) are
+        # the farthest ones, as they would be when sorting
+        sel_dists = np.where(np.isnan(dists), np.inf, dists)
+        kth_dists = np.partition(sel_dists, k - 1, axis=1)[:, k - 1:k]
+        nearer = sel_dists < kth_dists
+        kth = sel_dists == kth_dists
+        nns = nearer | (kth & (np.cumsum(kth, axis=1)
+                               <= k - np.sum(nearer, axis=1)[:, None]))
+        knns = np.nonzero(nns)[1].reshape((len(dists), k))
+        rows = np.arange(len(dists))[:, None]
+        # position of each neighbor's label among (label, sample) pairs
+        knns_pairs = (rows * Nuniquelabels + label_ids[knns]).ravel()
+
+        # count votes for all the samples at once
+        counts = np.bincount(knns_pairs,
+                             minlength=len(dists) * Nuniquelabels
+                             ).reshape((len(dists), Nuniquelabels))
+        # optionally weight votes
+        if self.__voting == 'weighted':
+            votes = counts * self.__weights
+        else:
+            votes = counts
+
+        # find the winners and check for ties
+        winners = np.argmax(votes, axis=1)
+        ties = votes == votes.max(axis=1)[:, None]
+        tied = np.where(np.sum(ties, axis=1) > 1)[0]
+        if len(tied):
+            # break the ties based on the mean distance to the
+            # corresponding k-neighbors of each class
+            tied_pairs = (np.arange(len(tied))[:, None] * Nuniquelabels
+                          + label_ids[knns[tied]]).ravel()
+            nns_dists = np.bincount(
+                tied_pairs, weights=dists[tied[:, None], knns[tied]].ravel(),
+                minlength=len(tied) * Nuniquelabels
+                ).reshape((len(tied), Nuniquelabels))
+            ties_dists = np.where(ties[tied],
+                                  nns_dists / np.maximum(counts[tied], 1),
+                                  np.inf)
+            # among equally distant classes the last one wins
+            winners[tied] = Nuniquelabels - 1 \
+                            - np.argmin(ties_dists[:, ::-1], axis=1)
+            if __debug__:
+                debug('KNN',
+                      'Ran into the ties for %d samples with votes: %s, '
+                      'dists: %s, max_vote %r',
+                      (len(tied), votes[tied], ties_dists,
+                       uniquelabels[winners[tied]]))
+
+        return votes, list(uniquelabels[winners]), dists
+
     def _untrain(self):
         """Reset trained state"""
         self.__data = None
@@ -209,30 +209,124 @@ def seq_to_svm_node(x):
     return data
 
 
+class SVMNodeMatrix(object):
+    """Rows of SVMNodes converted from a 2D array in a single call
+
+    Unlike `seq_to_svm_node` for every row, the whole array is converted
+    within the C extension, and nodes of all rows are allocated as a single
+    block.  Rows could be passed to `SVMModel` prediction methods.
+    """
+
+    def __init__(self, x, precomputed=False):
+        """
+        Parameters
+        ----------
+        x : array
+          2D array (samples x features).  It gets converted into a
+          contiguous float64 array if it is not one already.
+        precomputed : bool
+          If True, `x` is a kernel matrix (samples x training samples) for
+          the PRECOMPUTED kernel, and each row gets prefixed with the serial
+          number of the sample as libsvm requires.
+        """
+        x = np.ascontiguousarray(x, dtype=np.float64)
+        if x.ndim != 2:
+            raise ValueError("SVMNodeMatrix requires a 2D array, got %iD"
+                             % x.ndim)
+        self.shape = x.shape
+        self.precomputed = precomputed
+        self.matrix = svmc.svm_node_matrix_from_array(x, int(precomputed))
+        if self.matrix is None:
+            raise MemoryError("Failed to allocate SVMNodes for %s array"
+                              % (x.shape,))
+
+
+    def __len__(self):
+        return self.shape[0]
+
+
+    def __getitem__(self, i):
+        if not -len(self) <= i < len(self):
+            raise IndexError("SVMNodeMatrix has %i rows" % len(self))
+        return SVMNodeRow(self, i % len(self))
+
+
+    def __iter__(self):
+        for i in xrange(len(self)):
+            yield SVMNodeRow(self, i)
+
+
+    def __del__(self):
+        if svmc is not None and getattr(self, 'matrix', None) is not None:
+            svmc.svm_node_matrix_from_array_destroy(self.matrix)
+        self.matrix = None
+
+
+
+class SVMNodeRow(object):
+    """A row of `SVMNodeMatrix` keeping the whole matrix alive"""
+
+    __slots__ = ['nodes', 'node']
+
+    def __init__(self, nodes, i):
+        self.nodes = nodes
+        self.node = svmc.svm_node_matrix_get(nodes.matrix, i)
+
+
+
+def _get_svm_node(x):
+    """Return SVMNode array for `x` and whether it needs to be destroyed"""
+    if isinstance(x, SVMNodeRow):
+        return x.node, False
+    return seq_to_svm_node(x), True
+
+
 
 class SVMProblem:
-    def __init__(self, y, x):
+    def __init__(self, y, x, precomputed=False):
+        """
+        Parameters
+        ----------
+        y : sequence
+          Labels.
+        x : array or sequence
+          Samples. 2D arrays get converted in a single call (see
+          `SVMNodeMatrix`), while any other sequence gets converted into
+          SVMNodes per sample.
+        precomputed : bool
+          If True, `x` is a kernel matrix of the samples for the
+          PRECOMPUTED kernel.
+        """
         assert len(y) == len(x)
         self.prob = prob = svmc.svm_problem()
         self.size = size = len(y)
+        self.nr_class = len(set(y))
 
         self.y_array = y_array = svmc.new_double(size)
         for i in xrange(size):
             svmc.double_setitem(y_array, i, y[i])
 
-        self.x_matrix = x_matrix = svmc.svm_node_matrix(size)
-        data = [None for i in xrange(size)]
-        maxlen = 0
-        for i in xrange(size):
-            x_i = x[i]
-            lx_i = len(x_i)
-            data[i] = d = seq_to_svm_node(x_i)
-            svmc.svm_node_matrix_set(x_matrix, i, d)
-            if isinstance(x_i, dict):
-                if (lx_i > 0):
-                    maxlen = max(maxlen, max(x_i.keys()))
-            else:
-                maxlen = max(maxlen, lx_i)
+        self.precomputed = precomputed
+        if precomputed or (isinstance(x, np.ndarray) and x.ndim == 2):
+            self.nodes = nodes = SVMNodeMatrix(x, precomputed=precomputed)
+            self.x_matrix = x_matrix = nodes.matrix
+            data = None
+            maxlen = nodes.shape[1]
+        else:
+            self.nodes = None
+            self.x_matrix = x_matrix = svmc.svm_node_matrix(size)
+            data = [None for i in xrange(size)]
+            maxlen = 0
+            for i in xrange(size):
+                x_i = x[i]
+                lx_i = len(x_i)
+                data[i] = d = seq_to_svm_node(x_i)
+                svmc.svm_node_matrix_set(x_matrix, i, d)
+                if isinstance(x_i, dict):
+                    if (lx_i > 0):
+                        maxlen = max(maxlen, max(x_i.keys()))
+                else:
+                    maxlen = max(maxlen, lx_i)
 
         # bind to instance
         self.data = data
@@ -253,16 +347,35 @@ class SVMProblem:
         del self.prob
         if svmc is not None:
             svmc.delete_double(self.y_array)
-        for i in range(self.size):
-            svmc.svm_node_array_destroy(self.data[i])
-        svmc.svm_node_matrix_destroy(self.x_matrix)
+        if self.data is not None:
+            for i in range(self.size):
+                svmc.svm_node_array_destroy(self.data[i])
+            svmc.svm_node_matrix_destroy(self.x_matrix)
+        # otherwise nodes get destroyed along with SVMNodeMatrix
         del self.data
         del self.x_matrix
+        del self.nodes
 
 
 
 class SVMModel:
-    def __init__(self, arg1, arg2=None):
+    def __init__(self, arg1, arg2=None, init_coef=None):
+        """
+        Parameters
+        ----------
+        arg1 : str or SVMProblem
+          Filename to load the model from, or the problem to train on.
+        arg2 : SVMParameter, optional
+          Parameters to train with.
+        init_coef : array, optional
+          Dual coefficients (see `coef`) of a previous solution for the
+          same samples to start C-SVC training from.
+        """
+        self.coef = None
+        """Dual coefficients of all training samples (samples x
+        (classes - 1)) in the layout of `get_sv_coef`, relative to the C
+        of the sample's class.  Available only for C-SVC trained with the
+        bundled libsvm, which supports a warm start."""
         if arg2 == None:
             # create model from file
             filename = arg1
@@ -276,7 +389,20 @@ class SVMModel:
             msg = svmc.svm_check_parameter(prob.prob, param.param)
             if msg:
                 raise ValueError, msg
-            self.model = svmc.svm_train(prob.prob, param.param)
+            if param.svm_type == C_SVC and svmc.svm_has_warm_start():
+                coef = np.zeros((prob.size, max(prob.nr_class - 1, 0)))
+                if init_coef is not None:
+                    init_coef = np.ascontiguousarray(init_coef,
+                                                     dtype=np.float64)
+                    if init_coef.shape != coef.shape:
+                        raise ValueError(
+                            "Dual coefficients to start from must be of %s "
+                            "shape, got %s" % (coef.shape, init_coef.shape))
+                self.model = svmc.svm_train_warm(prob.prob, param.param,
+                                                 init_coef, coef)
+                self.coef = coef
+            else:
+                self.model = svmc.svm_train(prob.prob, param.param)
 
         #setup some classwide variables
         self.nr_class = svmc.svm_get_nr_class(self.model)
@@ -306,12 +432,31 @@ class SVMModel:
 
 
     def predict(self, x):
-        data = seq_to_svm_node(x)
+        data, destroy = _get_svm_node(x)
         ret = svmc.svm_predict(self.model, data)
-        svmc.svm_node_array_destroy(data)
+        if destroy:
+            svmc.svm_node_array_destroy(data)
         return ret
 
 
+    def predict_array(self, x):
+        """Predict all samples at once
+
+        Parameters
+        ----------
+        x : array or SVMNodeMatrix
+          2D array (samples x features) or already converted samples.
+
+        Returns
+        -------
+        array
+          Predictions for all samples.
+        """
+        if not isinstance(x, SVMNodeMatrix):
+            x = SVMNodeMatrix(x)
+        return svmc.svm_predict_matrix(self.model, x.matrix, len(x))
+
+
     ##REF: Name was automagically refactored
     def get_nr_class(self):
         return self.nr_class
@@ -335,12 +480,13 @@ class SVMModel:
     def predict_values_raw(self, x):
         #convert x into SVMNode, allocate a double array for return
         n = self.nr_class*(self.nr_class-1)//2
-        data = seq_to_svm_node(x)
+        data, destroy = _get_svm_node(x)
         dblarr = svmc.new_double(n)
         svmc.svm_predict_values(self.model, data, dblarr)
         ret = double_array_to_list(dblarr, n)
         svmc.delete_double(dblarr)
-        svmc.svm_node_array_destroy(data)
+        if destroy:
+            svmc.svm_node_array_destroy(data)
         return ret
 
 
@@ -376,12 +522,13 @@ class SVMModel:
             raise TypeError, "model does not support probability estimates"
 
         #convert x into SVMNode, alloc a double array to receive probabilities
-        data = seq_to_svm_node(x)
+        data, destroy = _get_svm_node(x)
         dblarr = svmc.new_double(self.nr_class)
         pred = svmc.svm_predict_probability(self.model, data, dblarr)
         pv = double_array_to_list(dblarr, self.nr_class)
         svmc.delete_double(dblarr)
-        svmc.svm_node_array_destroy(data)
+        if destroy:
+            svmc.svm_node_array_destroy(data)
         p = {}
         for i, l in enumerate(self.labels):
             p[l] = pv[i]
@@ -453,6 +600,20 @@ class SVMModel:
                     self.prob.maxlen)
 
 
+    def get_sv_indices(self):
+        """Returns indices of support vectors among the training samples.
+
+        Available only for a precomputed kernel, where libsvm refers to
+        samples by their serial numbers.
+        """
+        if not self.prob.precomputed:
+            raise ValueError("Indices of support vectors are available only "
+                             "for a precomputed kernel")
+        serials = svmc.svm_node_matrix2numpy_array(
+                    self.model.SV, self.get_total_n_sv(), 1)
+        return serials[:, 0].astype(int) - 1
+
+
     ##REF: Name was automagically refactored
     def get_sv_coef(self):
         """Return coefficients for SVs... Needs to be used directly with caution!
@@ -72,7 +72,7 @@ class LinearSVMWeights(Sensitivity):
         #            " classes. Make sure that it is what you intended to do" )
 
         svcoef = np.matrix(model.get_sv_coef())
-        svs = np.matrix(model.get_sv())
+        svs = np.matrix(clf.get_sv())
         rhos = np.asarray(model.get_rho())
 
         if self.params.split_weights:
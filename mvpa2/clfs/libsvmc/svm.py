@@ -23,7 +23,7 @@ from mvpa2.clfs.base import accepts_dataset_as_samples, \
 from mvpa2.clfs._svmbase import _SVM
 
 from mvpa2.clfs.libsvmc import _svm
-from mvpa2.kernels.libsvm import LinearLSKernel
+from mvpa2.kernels.libsvm import LSKernel, LinearLSKernel
 from mvpa2.clfs.libsvmc.sens import LinearSVMWeights
 
 from mvpa2.support.due import due, Doi, BibTeX
@@ -46,6 +46,11 @@ class SVM(_SVM):
     """Support Vector Machine Classifier.
 
     This is a simple interface to the libSVM package.
+
+    Besides kernels computed by libsvm itself (see `mvpa2.kernels.libsvm`),
+    any kernel convertible into a numpy array (e.g. `CachedKernel`) could be
+    used.  Such kernel is computed by PyMVPA and passed to libsvm as a
+    PRECOMPUTED one.
     """
 
     # Since this is internal feature of LibSVM, this conditional attribute is present
@@ -62,7 +67,7 @@ class SVM(_SVM):
     _KNOWN_SENSITIVITIES = {'linear':LinearSVMWeights,
                             }
     _KNOWN_IMPLEMENTATIONS = {
-        'C_SVC' : (_svm.svmc.C_SVC, ('C',),
+        'C_SVC' : (_svm.svmc.C_SVC, ('C', 'warm_start'),
                    ('binary', 'multiclass', 'oneclass'), 'C-SVM classification'),
         'NU_SVC' : (_svm.svmc.NU_SVC, ('nu',),
                     ('binary', 'multiclass', 'oneclass'), 'nu-SVM classification'),
@@ -122,6 +127,14 @@ class SVM(_SVM):
         self.__model = None
         """Holds the trained SVM."""
 
+        self.__warm_start = None
+        """Labels and dual coefficients of the last training to start
+        the next one from (if warm_start is enabled). Survives untraining."""
+
+        self.__traindataset = None
+        """Training dataset if the kernel is precomputed, since it is needed
+        to compute the kernel for prediction."""
+
 
     @due.dcite(
         Doi('10.1145/1961189.1961199'),
@@ -138,13 +151,21 @@ class SVM(_SVM):
         targets_sa_name = self.get_space()    # name of targets sa
         targets_sa = dataset.sa[targets_sa_name] # actual targets sa
 
-        # libsvm needs doubles
-        src = _data2ls(dataset)
+        kernel = self.params.kernel
+        precomputed = not isinstance(kernel, LSKernel)
+        if precomputed:
+            # kernel is computed here and passed to libsvm
+            kernel.compute(dataset)
+            src = kernel.as_raw_np()
+            self.__traindataset = dataset
+        else:
+            # libsvm needs doubles
+            src = _data2ls(dataset)
 
         # libsvm cannot handle literal labels
         labels = self._attrmap.to_numeric(targets_sa.value).tolist()
 
-        svmprob = _svm.SVMProblem(labels, src )
+        svmprob = _svm.SVMProblem(labels, src, precomputed=precomputed)
 
         # Translate few params
         TRANSLATEDICT = {'epsilon': 'eps',
@@ -167,7 +188,8 @@ class SVM(_SVM):
         # **kwargs and create appropriate parameters within .params or
         # .kernel_params
         libsvm_param = _svm.SVMParameter(
-            kernel_type=self.params.kernel.as_raw_ls(),# Just an integer ID
+            # Just an integer ID
+            kernel_type=PRECOMPUTED if precomputed else kernel.as_raw_ls(),
             svm_type=self._svm_type,
             **dict(args))
 
@@ -191,21 +213,42 @@ class SVM(_SVM):
                 libsvm_param._set_parameter('weight_label', uls)
             libsvm_param._set_parameter('C', Cs[0])
 
+        warm_start = 'warm_start' in self.params and self.params.warm_start
+        init_coef = None
+        if warm_start and self.__warm_start is not None:
+            # dual coefficients are reusable only for the same labels
+            warm_labels, warm_coef = self.__warm_start
+            if warm_labels == labels:
+                if __debug__:
+                    debug("SVM_", "Starting training from previous solution")
+                init_coef = warm_coef
+
         try:
-            self.__model = _svm.SVMModel(svmprob, libsvm_param)
+            self.__model = _svm.SVMModel(svmprob, libsvm_param,
+                                         init_coef=init_coef)
         except Exception, e:
             raise FailedToTrainError(str(e))
 
+        if warm_start and self.__model.coef is not None:
+            self.__warm_start = (labels, self.__model.coef)
+        else:
+            self.__warm_start = None
+
 
     @accepts_samples_as_dataset
     def _predict(self, data):
         """Predict values for the data
         """
-        # libsvm needs doubles
-        src = _data2ls(data)
+        if self.__traindataset is not None:
+            kernel = self.params.kernel
+            kernel.compute(data, self.__traindataset)
+            src = _svm.SVMNodeMatrix(kernel.as_raw_np(), precomputed=True)
+        else:
+            # libsvm needs doubles, and all samples get converted at once
+            src = _svm.SVMNodeMatrix(_data2ls(data))
         ca = self.ca
 
-        predictions = [ self.model.predict(p) for p in src ]
+        predictions = self.model.predict_array(src).tolist()
 
         if ca.is_enabled('estimates'):
             if self.__is_regression__:
@@ -279,6 +322,22 @@ class SVM(_SVM):
         return s
 
 
+    def get_sv(self):
+        """Support vectors of the trained model (#SVs x #features)
+
+        For a precomputed kernel they are taken from the training dataset.
+        """
+        if self.__traindataset is None:
+            return self.__model.get_sv()
+        return self.__traindataset.samples[self.__model.get_sv_indices()]
+
+
+    def reset_warm_start(self):
+        """Forget the solution to start the next training from
+        """
+        self.__warm_start = None
+
+
     def _untrain(self):
         """Untrain libsvm's SVM: forget the model
         """
@@ -287,6 +346,7 @@ class SVM(_SVM):
         super(SVM, self)._untrain()
         del self.__model
         self.__model = None
+        self.__traindataset = None
 
     model = property(fget=lambda self: self.__model)
     """Access to the SVM model."""
@@ -279,6 +279,129 @@ void svm_node_matrix_destroy(struct svm_node **matrix)
 	free(matrix);
 }
 
+/* convert a C-contiguous 2D float64 numpy array into a node matrix in a
+ * single pass.  Nodes of all rows are allocated as a single block (starting
+ * at the first row), so the matrix must be freed with
+ * svm_node_matrix_from_array_destroy.  Features get indices 0..cols-1 as
+ * in svm_node_array_set.  If precomputed, the array is a kernel matrix and
+ * every row is prefixed with a node holding the 1-based sample serial
+ * number as libsvm expects for PRECOMPUTED kernel, so columns get indices
+ * 1..cols. Returns NULL if the array is not suitable */
+struct svm_node **svm_node_matrix_from_array(PyObject *samples, int precomputed)
+{
+	if (!PyArray_Check(samples))
+		return NULL;
+	PyArrayObject* a = (PyArrayObject*) samples;
+	if ((PyArray_NDIM(a) != 2) || (PyArray_TYPE(a) != NPY_DOUBLE)
+		|| !PyArray_ISCARRAY_RO(a))
+		return NULL;
+
+	npy_intp rows = PyArray_DIM(a, 0);
+	npy_intp cols = PyArray_DIM(a, 1);
+	int offset = precomputed ? 1 : 0;
+	/* features, optional serial number, and the terminating marker */
+	npy_intp rowlen = cols + offset + 1;
+	const double* data = (const double *)PyArray_DATA(a);
+
+	struct svm_node **matrix = (struct svm_node **)malloc(
+		sizeof(struct svm_node *) * (rows > 0 ? rows : 1));
+	struct svm_node *nodes = (struct svm_node *)malloc(
+		sizeof(struct svm_node) * (rows > 0 ? rows * rowlen : 1));
+	if (!matrix || !nodes)
+	{
+		free(matrix);
+		free(nodes);
+		return NULL;
+	}
+	/* so the block is found for freeing even if there are no rows */
+	matrix[0] = nodes;
+
+	npy_intp i, j;
+	for (i = 0; i < rows; ++i)
+	{
+		struct svm_node *row = nodes + i * rowlen;
+		const double *values = data + i * cols;
+		matrix[i] = row;
+		if (precomputed)
+		{
+			row[0].index = 0;
+			row[0].value = (double)(i + 1);
+		}
+		for (j = 0; j < cols; ++j)
+		{
+			row[j + offset].index = (int)(j + offset);
+			row[j + offset].value = values[j];
+		}
+		row[cols + offset].index = -1;
+		row[cols + offset].value = 0.0;
+	}
+	return matrix;
+}
+
+struct svm_node *svm_node_matrix_get(struct svm_node **matrix, int i)
+{
+	return matrix[i];
+}
+
+void svm_node_matrix_from_array_destroy(struct svm_node **matrix)
+{
+	if (matrix)
+		free(matrix[0]);
+	free(matrix);
+}
+
+/* predict all rows of a node matrix at once */
+PyObject *svm_predict_matrix(const struct svm_model *model,
+							 struct svm_node **matrix, int rows)
+{
+	npy_intp dims[1] = {rows};
+	PyObject* array = PyArray_SimpleNew(1, dims, NPY_DOUBLE);
+	if (!array)
+		return NULL;
+	double* out = (double *)PyArray_DATA((PyArrayObject*) array);
+	int i;
+	for (i = 0; i < rows; ++i)
+		out[i] = svm_predict(model, matrix[i]);
+	return array;
+}
+
+/* whether svm_train_warm is able to start from a previous solution */
+int svm_has_warm_start(void)
+{
+#ifdef LIBSVM_WARM_START
+	return 1;
+#else
+	return 0;
+#endif
+}
+
+/* train the model (see svm_train_warm_start in the bundled libsvm).
+ * init_coef (dual coefficients of a previous solution to start from) and
+ * coef (to receive the ones of the new solution) are None or C-contiguous
+ * float64 arrays of (samples x (classes-1)) shape, which must be ensured by
+ * the caller.  Without support for the warm start in libsvm it is a plain
+ * svm_train and coef remains untouched */
+struct svm_model *svm_train_warm(const struct svm_problem *prob,
+								 const struct svm_parameter *param,
+								 PyObject *init_coef, PyObject *coef)
+{
+#ifdef LIBSVM_WARM_START
+	const double *init_coef_data = NULL;
+	double *coef_data = NULL;
+	if (PyArray_Check(init_coef)
+		&& PyArray_TYPE((PyArrayObject*) init_coef) == NPY_DOUBLE
+		&& PyArray_ISCARRAY_RO((PyArrayObject*) init_coef))
+		init_coef_data = (const double *)PyArray_DATA((PyArrayObject*) init_coef);
+	if (PyArray_Check(coef)
+		&& PyArray_TYPE((PyArrayObject*) coef) == NPY_DOUBLE
+		&& PyArray_ISCARRAY((PyArrayObject*) coef))
+		coef_data = (double *)PyArray_DATA((PyArrayObject*) coef);
+	return svm_train_warm_start(prob, param, init_coef_data, coef_data);
+#else
+	return svm_train(prob, param);
+#endif
+}
+
 void svm_destroy_model_helper(svm_model *model_ptr)
 {
 #if LIBSVM_VERSION >= 300
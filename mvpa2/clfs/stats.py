@@ -20,6 +20,7 @@ from mvpa2.base import externals, warning
 from mvpa2.base.state import ClassWithCollections, ConditionalAttribute
 from mvpa2.generators.permutation import AttributePermutator
 from mvpa2.base.types import is_datasetlike
+from mvpa2.base.dochelpers import _repr_attrs
 from mvpa2.datasets import Dataset
 
 if __debug__:
@@ -120,6 +121,92 @@ class Nonparametric(object):
                          np.vectorize(lambda v: (self._dist_samples >= v).mean()))
 
 
+class NonparametricSet(object):
+    """Set of non-parametric 1d distributions for multiple elements at once.
+
+    Equivalent to a list of `Nonparametric` distributions (which could be
+    obtained by indexing), but keeps all the samples in a single 2D array,
+    so cdf values for all elements get computed in a vectorized fashion
+    instead of looping through the distributions.
+    """
+
+    def __init__(self, dist_samples, correction='clip'):
+        """
+        Parameters
+        ----------
+        dist_samples : ndarray
+          Samples (npermutations x nelements) to be used to assess the
+          distributions of each element.
+        correction : {'clip'} or None, optional
+          See `Nonparametric`.
+        """
+        dist_samples = np.asanyarray(dist_samples)
+        if dist_samples.ndim != 2:
+            raise ValueError("Expected 2D array of samples, got shape %s"
+                             % (dist_samples.shape,))
+        self._dist_samples = dist_samples
+        self._correction = correction
+
+    def __len__(self):
+        return self._dist_samples.shape[1]
+
+    def __getitem__(self, i):
+        return Nonparametric(self._dist_samples[:, i],
+                             correction=self._correction)
+
+    def __iter__(self):
+        for i in xrange(len(self)):
+            yield self[i]
+
+    def __repr__(self):
+        return '%s(%r%s)' % (
+            self.__class__.__name__,
+            self._dist_samples,
+            ('', ', correction=%r' % self._correction)
+              [int(self._correction != 'clip')])
+
+    def _cdf(self, x, operator, chunk_size=64):
+        """Helper function to compute cdf proper or reverse for all elements
+        """
+        samples = self._dist_samples
+        nsamples, nelements = samples.shape
+        x = np.asanyarray(x)
+        if x.shape != (nelements,):
+            raise ValueError("Expected %d values, got shape %s"
+                             % (nelements, x.shape))
+        # Counting is cheaper than sorting all the samples to search
+        # within them.  Go through the samples in chunks, so temporary
+        # boolean array remains small
+        counts = np.zeros(nelements, dtype=int)
+        # NaNs are simply not counted, as in Nonparametric
+        with np.errstate(invalid='ignore'):
+            for start in xrange(0, nsamples, chunk_size):
+                counts += operator(samples[start:start + chunk_size],
+                                   x).sum(axis=0)
+        res = counts / float(nsamples)
+        if self._correction == 'clip':
+            np.clip(res, 1.0/(nsamples+2), (nsamples+1.0)/(nsamples+2), res)
+        elif self._correction is None:
+            pass
+        else:
+            raise ValueError, \
+                  '%r is incorrect value for correction parameter of %s' \
+                  % (self._correction, self.__class__.__name__)
+        return res
+
+    def cdf(self, x):
+        """Returns the cdf values at `x` (one value per element).
+        """
+        return self._cdf(x, np.less_equal)
+
+    def rcdf(self, x):
+        """Returns cdf values of reversed distributions at `x`.
+
+        See `Nonparametric.rcdf`.
+        """
+        return self._cdf(x, np.greater_equal)
+
+
 def _pvalue(x, cdf_func, rcdf_func, tail, return_tails=False, name=None):
     """Helper function to return p-value(x) given cdf and tail
 
@@ -293,6 +380,29 @@ class NullDist(ClassWithCollections):
     tail = property(fget=lambda x:x.__tail, fset=_set_tail)
 
 
+def _measure_permuted(measure, ds, seed=None):
+    """Compute the measure on a permuted dataset
+
+    Returns
+    -------
+    samples, error
+      Samples of the result, or None with the error message if the
+      measure has failed to be evaluated.
+    """
+    # TODO: place exceptions separately so we could avoid circular imports
+    from mvpa2.base.learner import LearnerError
+    if seed is not None:
+        from mvpa2 import seed as seed_
+        seed_(seed)
+    # assume it has `TransferError` interface
+    try:
+        return measure(ds).samples, None
+    except LearnerError, e:
+        # exceptions might not survive pickling on their way back from
+        # a child process
+        return None, str(e)
+
+
 class MCNullDist(NullDist):
     """Null-hypothesis distribution is estimated from randomly permuted data labels.
 
@@ -310,6 +420,13 @@ class MCNullDist(NullDist):
 
     This class also supports `FeaturewiseMeasure`. In that case `cdf()`
     returns an array of featurewise probabilities/frequencies.
+
+    With `nproc` > 1 the measure is computed on the permuted datasets in
+    parallel child processes.  Permutations themselves are still
+    generated in the main process, so they do not depend on `nproc`,
+    whereas each permutation gets its own seed for the random number
+    generators used by the measure.  Results are collected in the order
+    of the permutations.
     """
 
     _DEV_DOC = """
@@ -326,7 +443,7 @@ class MCNullDist(NullDist):
                       'measure has failed to evaluated at them')
 
     def __init__(self, permutator, dist_class=Nonparametric, measure=None,
-                 **kwargs):
+                 nproc=1, **kwargs):
         """Initialize Monte-Carlo Permutation Null-hypothesis testing
 
         Parameters
@@ -338,12 +455,25 @@ class MCNullDist(NullDist):
           using `fit()` method to initialize the instance, and
           provides `cdf(x)` method for estimating value of x in CDF.
           All distributions from SciPy's 'stats' module can be used.
+          `Nonparametric` distributions of all the elements get
+          estimated at once via `NonparametricSet`.
         measure : Measure or None
           Optional measure that is used to compute results on permuted
           data. If None, a measure needs to be passed to ``fit()``.
+        nproc : None or int
+          How many processes to use for computing the measure on permuted
+          datasets.  Requires `pprocess` module for values other than 1.
+          If None -- all available cores are used.
         """
         NullDist.__init__(self, **kwargs)
 
+        if nproc != 1 and not externals.exists('pprocess'):
+            raise RuntimeError("The 'pprocess' module is required for "
+                               "multiprocess permutations. Please either "
+                               "install python-pprocess, or set `nproc` "
+                               "to 1 (got nproc=%s)" % nproc)
+        self.nproc = nproc
+
         self._dist_class = dist_class
         self._dist = []                 # actual distributions
         self._measure = measure
@@ -357,7 +487,8 @@ class MCNullDist(NullDist):
         if self._dist_class != Nonparametric:
             prefixes_.insert(0, 'dist_class=%r' % (self._dist_class,))
         return super(MCNullDist, self).__repr__(
-            prefixes=prefixes_ + prefixes)
+            prefixes=prefixes_ + prefixes
+            + _repr_attrs(self, ['nproc'], default=1))
 
 
     def fit(self, measure, ds):
@@ -372,9 +503,6 @@ class MCNullDist(NullDist):
         ds: `Dataset` which gets permuted and used to compute the
           measure/transfer error multiple times.
         """
-        # TODO: place exceptions separately so we could avoid circular imports
-        from mvpa2.base.learner import LearnerError
-
         # prefer the already assigned measure over anything the was passed to
         # the function.
         # XXX that is a bit awkward but is necessary to keep the code changes
@@ -393,7 +521,30 @@ class MCNullDist(NullDist):
         # null-distribution of transfer errors can be reduced dramatically
         # when the *right* permutations (the ones that matter) are done.
         skipped = 0                     # # of skipped permutations
-        for p, permuted_ds in enumerate(self.__permutator.generate(ds)):
+        nproc = self.nproc
+        if nproc is None:
+            import pprocess
+            nproc = pprocess.get_number_of_cores() or 1
+
+        if nproc > 1:
+            import pprocess
+            if __debug__:
+                debug('STATMC', "Starting off up to %i child processes"
+                      % nproc)
+            # seeds for the children are derived from the current state
+            # of RNG without consuming it, so permutations remain the
+            # same as with nproc=1
+            seeds = np.random.RandomState(np.random.get_state()[1])
+            # Map keeps the results in the order of permutations
+            results = pprocess.Map(limit=nproc)
+            compute = results.manage(pprocess.MakeParallel(_measure_permuted))
+            for permuted_ds in self.__permutator.generate(ds):
+                compute(measure, permuted_ds, seed=seeds.randint(2**31 - 1))
+        else:
+            results = (_measure_permuted(measure, permuted_ds)
+                       for permuted_ds in self.__permutator.generate(ds))
+
+        for p, (res, error) in enumerate(results):
             # new permutation all the time
             # but only permute the training data and keep the testdata constant
             #
@@ -401,19 +552,17 @@ class MCNullDist(NullDist):
                 debug('STATMC', "Doing %i permutations: %i" \
                       % (self.__permutator.count, p+1), cr=True)
 
-            # compute and store the measure of this permutation
-            # assume it has `TransferError` interface
-            try:
-                res = measure(permuted_ds)
-                dist_samples.append(res.samples)
-            except LearnerError, e:
+            # store the measure of this permutation
+            if error is not None:
                 if __debug__:
                     debug('STATMC', " skipped", cr=True)
                 warning('Failed to obtain value from %s due to %s.  Measurement'
                         ' was skipped, which could lead to unstable and/or'
-                        ' incorrect assessment of the null_dist' % (measure, e))
+                        ' incorrect assessment of the null_dist'
+                        % (measure, error))
                 skipped += 1
                 continue
+            dist_samples.append(res)
 
         self.ca.skipped = skipped
 
@@ -443,9 +592,14 @@ class MCNullDist(NullDist):
         if nshape == 1:
             dist_samples = dist_samples[:, np.newaxis]
 
+        dist_samples_rs = dist_samples.reshape((shape[0], -1))
+        if self._dist_class is Nonparametric:
+            # no need for a distribution instance per each element
+            self._dist = NonparametricSet(dist_samples_rs)
+            return
+
         # fit per each element.
         # XXX could be more elegant? may be use np.vectorize?
-        dist_samples_rs = dist_samples.reshape((shape[0], -1))
         dist = []
         for samples in dist_samples_rs.T:
             params = self._dist_class.fit(samples)
@@ -480,7 +634,11 @@ class MCNullDist(NullDist):
                   % (len(self._dist), len(x))
 
         # extract cdf values per each element
-        if cdf_func == 'cdf':
+        if isinstance(self._dist, NonparametricSet):
+            if cdf_func not in ('cdf', 'rcdf'):
+                raise ValueError
+            cdfs = getattr(self._dist, cdf_func)(x)
+        elif cdf_func == 'cdf':
             cdfs = [ dist.cdf(v) for v, dist in zip(x, self._dist) ]
         elif cdf_func == 'rcdf':
             cdfs = [ _auto_rcdf(dist)(v) for v, dist in zip(x, self._dist) ]
@@ -65,6 +65,45 @@ def _p2(x, prec=2, formatting=''):
     return formatting + s
 
 
+def _as_labels_array(x):
+    """1D array of labels, even if labels are sequences themselves"""
+    a = np.asanyarray(x)
+    if a.ndim != 1:
+        a = np.empty(len(x), dtype=object)
+        for i, v in enumerate(x):
+            a[i] = v
+    return a
+
+
+def _count_labels(targets, predictions):
+    """Count occurrences of all (prediction, target) pairs of labels
+
+    Returns
+    -------
+    labels : list
+      Unique labels among `targets` and `predictions`, as provided in them.
+    counts : ndarray
+      Counts of hits with rows -- predictions, columns -- targets, in the
+      order of `labels`.
+    """
+    values = [_as_labels_array(x) for x in (targets, predictions)]
+    if values[0].dtype != values[1].dtype \
+       and not all([v.dtype.kind in 'biuf' for v in values]):
+        # do not let numpy convert e.g. numbers into strings
+        values = [v.astype(object) for v in values]
+    _, first, ids = np.unique(np.concatenate(values),
+                              return_index=True, return_inverse=True)
+    ntargets = len(values[0])
+    labels = [targets[i] if i < ntargets else predictions[i - ntargets]
+              for i in first]
+    nlabels = len(labels)
+    if not nlabels:
+        return labels, np.zeros((0, 0), dtype=int)
+    counts = np.bincount(ids[ntargets:] * nlabels + ids[:ntargets],
+                         minlength=nlabels ** 2).reshape((nlabels, nlabels))
+    return labels, counts
+
+
 
 class SummaryStatistics(object):
     """Basic class to collect targets/predictions and report summary statistics
@@ -101,8 +140,10 @@ class SummaryStatistics(object):
         self._computed = False
         """Flag either it was computed for a given set of data"""
 
-        self.__sets = (sets, [])[int(sets is None)]
+        self.__sets = []
         """Datasets (target, prediction) to compute confusion matrix on"""
+        for set_ in (sets or []):
+            self._add_set(*set_)
 
         self._stats = {}
         """Dictionary to keep statistics. Initialized here to please pylint"""
@@ -144,7 +185,13 @@ class SummaryStatistics(object):
         # targets, since otherwise we are getting doubles for unknown at a
         # given moment labels
         nonetype = type(None)
-        for i in xrange(len(targets)):
+        # elements of arrays of the same (non-object) dtype are all of the
+        # same type already
+        same_types = isinstance(targets, np.ndarray) \
+                     and isinstance(predictions, np.ndarray) \
+                     and targets.dtype == predictions.dtype \
+                     and targets.dtype != np.object_
+        for i in xrange(0 if same_types else len(targets)):
             t1, t2 = type(targets[i]), type(predictions[i])
             # if there were no prediction made - leave None, otherwise
             # convert to appropriate type
@@ -161,10 +208,15 @@ class SummaryStatistics(object):
             # estimates and spit out results)
             estimates = copy.deepcopy(estimates)
 
-        self.__sets.append( (targets, predictions, estimates) )
+        self._add_set(targets, predictions, estimates)
         self._computed = False
 
 
+    def _add_set(self, targets, predictions, estimates=None):
+        """Store a new set (as is)"""
+        self.__sets.append( (targets, predictions, estimates) )
+
+
     ##REF: Name was automagically refactored
     def as_string(self, short=False, header=True, summary=True,
                  description=False):
@@ -231,7 +283,7 @@ class SummaryStatistics(object):
     def _compute(self):
         """Compute basic statistics
         """
-        self._stats = {'# of sets' : len(self.sets)}
+        self._stats = {'# of sets' : self.nsets}
 
 
     @property
@@ -259,6 +311,8 @@ class SummaryStatistics(object):
 
 
     sets = property(lambda self:self.__sets)
+    nsets = property(lambda self:len(self.__sets),
+                     doc="Number of sets which were provided")
 
 
 class ROCCurve(object):
@@ -461,6 +515,12 @@ class ConfusionMatrix(SummaryStatistics):
     as well ROC curve (http://en.wikipedia.org/wiki/ROC_curve)
     plotting and analysis (AUC) in the limited set of problems:
     binary, multiclass 1-vs-all.
+
+    Counts of each added set are kept per set as well as in total, in the
+    order in which labels were encountered, so the matrix is obtained
+    without revisiting the sets.  Storing the sets themselves could be
+    disabled (see `store_sets`) to save memory while accumulating many
+    sets (e.g. in permutation testing).
     """
 
     _STATS_DESCRIPTION = (
@@ -492,7 +552,8 @@ class ConfusionMatrix(SummaryStatistics):
         ) + SummaryStatistics._STATS_DESCRIPTION
 
 
-    def __init__(self, labels=None, labels_map=None, **kwargs):
+    def __init__(self, labels=None, labels_map=None, store_sets=True,
+                 **kwargs):
         """Initialize ConfusionMatrix with optional list of `labels`
 
         Parameters
@@ -502,12 +563,25 @@ class ConfusionMatrix(SummaryStatistics):
         labels_map : None or dict
          Dictionary from original dataset to show mapping into
          numerical labels
+        store_sets : bool
+         Either to store provided sets.  If False, only their counts are
+         kept, thus `sets`, `matrices` and `summaries` are empty and no
+         ROC curve (and AUC) is available.  Adding a `ConfusionMatrix`
+         which does not store its sets also disables storing them.
         targets
          Optional set of targets
         predictions
          Optional set of predictions
          """
 
+        self.__store_sets = store_sets
+        self.__code_labels = []
+        """Labels encountered in the sets, in the order of their codes"""
+        self.__counts = np.zeros((0, 0), dtype=int)
+        """Total counts across all sets (rows/columns -- label codes)"""
+        self.__set_counts = []
+        """Counts for each set"""
+
         SummaryStatistics.__init__(self, **kwargs)
 
         if labels == None:
@@ -523,6 +597,22 @@ class ConfusionMatrix(SummaryStatistics):
         """Resultant confusion matrix"""
 
 
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if not '_ConfusionMatrix__set_counts' in state:
+            # stored by an older version which kept only the sets -- count
+            # them now
+            if __debug__:
+                debug('CM', "Counting sets of %s stored without counts",
+                      (self,))
+            self.__store_sets = True
+            self.__code_labels = []
+            self.__counts = np.zeros((0, 0), dtype=int)
+            self.__set_counts = []
+            for targets, predictions, estimates in self.sets:
+                self.__add_counts(*_count_labels(targets, predictions))
+
+
     def __call__(self, predictions, targets, estimates=None, store=False):
         """Computes confusion matrix (counts)
 
@@ -547,10 +637,10 @@ class ConfusionMatrix(SummaryStatistics):
         if labels is None or not len(labels):
             raise RuntimeError("ConfusionMatrix must have labels assigned prior"
                                "__call__()")
+        set_labels, counts = _count_labels(targets, predictions)
         # verify that we know all the labels
         labels_set = set(labels)
-        if not (labels_set.issuperset(targets)
-                and labels_set.issuperset(predictions)):
+        if not labels_set.issuperset(set_labels):
             raise ValueError("Known labels %r does not include some labels "
                              "found in predictions %r or targets %r provided"
                              % (labels_set, set(predictions), set(targets)))
@@ -559,13 +649,79 @@ class ConfusionMatrix(SummaryStatistics):
         cm = np.zeros( (Nlabels, Nlabels), dtype=int )
 
         rev_map = dict([ (x[1], x[0]) for x in enumerate(labels)])
-        for t,p in zip(targets, predictions):
-            cm[rev_map[p], rev_map[t]] += 1
+        ids = [rev_map[l] for l in set_labels]
+        cm[np.ix_(ids, ids)] = counts
 
         if store:
             self.add(targets=targets, predictions=predictions, estimates=estimates)
         return cm
 
+    def _add_set(self, targets, predictions, estimates=None):
+        """Count the new set (and store it if `store_sets`)"""
+        if self.__store_sets:
+            SummaryStatistics._add_set(self, targets, predictions, estimates)
+        self.__add_counts(*_count_labels(targets, predictions))
+
+
+    def __add_counts(self, labels, counts):
+        """Add `counts` of a set among `labels` to the known counts"""
+        code_labels = self.__code_labels
+        codes = dict([ (x[1], x[0]) for x in enumerate(code_labels)])
+        for l in labels:
+            if not l in codes:
+                codes[l] = len(code_labels)
+                code_labels.append(l)
+        ids = [codes[l] for l in labels]
+        ncodes = len(code_labels)
+        set_counts = np.zeros((ncodes, ncodes), dtype=int)
+        set_counts[np.ix_(ids, ids)] = counts
+        self.__set_counts.append(set_counts)
+        # pad the total counts for the new labels
+        total = np.zeros((ncodes, ncodes), dtype=int)
+        nknown = len(self.__counts)
+        total[:nknown, :nknown] = self.__counts
+        total += set_counts
+        self.__counts = total
+
+
+    def __iadd__(self, other):
+        """Add the counts (and sets) from `other` to the current ones
+        """
+        if not isinstance(other, ConfusionMatrix):
+            return SummaryStatistics.__iadd__(self, other)
+        # need to do shallow copies, or otherwise smth like "cm += cm"
+        # would loop forever
+        code_labels = list(other.__code_labels)
+        set_counts = copy.copy(other.__set_counts)
+        if not other.__store_sets:
+            if self.__store_sets:
+                if __debug__:
+                    debug('CM', "Dropping sets of %s since %s has none",
+                          (self, other))
+                # sets would not be complete anyways
+                SummaryStatistics.reset(self)
+                self.__store_sets = False
+        elif self.__store_sets:
+            for targets, predictions, estimates in copy.copy(other.sets):
+                if estimates is not None:
+                    estimates = copy.deepcopy(estimates)
+                SummaryStatistics._add_set(self, targets, predictions,
+                                           estimates)
+        for counts in set_counts:
+            self.__add_counts(code_labels[:len(counts)], counts)
+        self._computed = False
+        return self
+
+
+    def reset(self):
+        """Cleans summary -- all data/sets are wiped out
+        """
+        SummaryStatistics.reset(self)
+        self.__code_labels = []
+        self.__counts = np.zeros((0, 0), dtype=int)
+        self.__set_counts = []
+
+
     # XXX might want to remove since summaries does the same, just without
     #     supplying labels
     @property
@@ -592,10 +748,7 @@ class ConfusionMatrix(SummaryStatistics):
         # value need to handle it... for now just keep original labels
         try:
             # figure out what labels we have
-            labels = \
-                list(reduce(lambda x, y: x.union(set(y[0]).union(set(y[1]))),
-                            self.sets,
-                            set(self.__labels)))
+            labels = list(set(self.__labels).union(self.__code_labels))
         except:
             labels = self.__labels
 
@@ -637,30 +790,21 @@ class ConfusionMatrix(SummaryStatistics):
             if not self.__labels_in_custom_order:
                 labels.sort()
 
-        Nlabels, Nsets = len(labels), len(self.sets)
+        Nlabels, Nsets = len(labels), self.nsets
 
         if __debug__:
             debug("CM", "Got labels %s" % labels)
 
-        # Create a matrix for all votes
-        mat_all = np.zeros( (Nsets, Nlabels, Nlabels), dtype=int )
-
-        # create total number of samples of each label counts
-        # just for convinience I guess since it can always be
-        # computed from mat_all
-        counts_all = np.zeros( (Nsets, Nlabels) )
-
         # reverse mapping from label into index in the list of labels
         rev_map = dict([ (x[1], x[0]) for x in enumerate(labels)])
-        for iset, set_ in enumerate(self.sets):
-            for t,p in zip(*set_[:2]):
-                mat_all[iset, rev_map[p], rev_map[t]] += 1
-
+        # and index of each label code
+        ids = np.array([rev_map[l] for l in self.__code_labels], dtype=int)
 
         # for now simply compute a sum of votes across different sets
         # we might do something more sophisticated later on, and this setup
         # should easily allow it
-        self.__matrix = np.sum(mat_all, axis=0)
+        self.__matrix = np.zeros( (Nlabels, Nlabels), dtype=int )
+        self.__matrix[np.ix_(ids, ids)] = self.__counts
         self.__Nsamples = np.sum(self.__matrix, axis=0)
         self.__Ncorrect = sum(np.diag(self.__matrix))
 
@@ -707,6 +851,12 @@ class ConfusionMatrix(SummaryStatistics):
             # Lets see if there is possible order effect in accuracy
             # (e.g. it goes down through splits)
 
+            # Create a matrix for all votes
+            mat_all = np.zeros( (Nsets, Nlabels, Nlabels), dtype=int )
+            for m, counts in zip(mat_all, self.__set_counts):
+                ids_ = ids[:len(counts)]
+                m[np.ix_(ids_, ids_)] = counts
+
             # simple linear regression
             ACC_per_set = [np.sum(np.diag(m))/np.sum(m).astype(float)
                            for m in mat_all]
@@ -728,8 +878,11 @@ class ConfusionMatrix(SummaryStatistics):
 
         #
         # ROC computation if available
-        ROC = ROCCurve(labels=labels, sets=self.sets)
-        aucs = ROC.aucs
+        if self.__store_sets:
+            ROC = ROCCurve(labels=labels, sets=self.sets)
+            aucs = ROC.aucs
+        else:
+            aucs = []
         if len(aucs)>0:
             stats['AUC'] = aucs
             if len(aucs) != Nlabels:
@@ -767,7 +920,7 @@ class ConfusionMatrix(SummaryStatistics):
         description : bool
           print verbose description of presented statistics
         """
-        if len(self.sets) == 0:
+        if self.nsets == 0:
             return "Empty"
 
         self.compute()
@@ -1120,6 +1273,9 @@ class ConfusionMatrix(SummaryStatistics):
         return 100.0*self.__Ncorrect/sum(self.__Nsamples)
 
     labels_map = property(fget=get_labels_map, fset=set_labels_map)
+    store_sets = property(fget=lambda self: self.__store_sets)
+    nsets = property(fget=lambda self: len(self.__set_counts),
+                     doc="Number of sets which were provided")
 
 
 class ConfusionMatrixError(object):
@@ -59,12 +59,19 @@ searchlight_opts_grp = ('options for searchlight setup', [
         spatio-temporal searchlights.""")),
     (('--nproc',), dict(type=int, default=1,
         help="""Use the specific number or worker processes for computing.""")),
-    (('--multiproc-backend',), dict(choices=('native', 'hdf5'),
+    (('--multiproc-backend',), dict(choices=('native', 'hdf5', 'memmap'),
         default='native',
         help="""Specifies the way results are provided back from a processing
         block in case of --nproc > 1. 'native' is pickling/unpickling of
         results, while 'hdf5' uses HDF5 based file storage. 'hdf5' might be more
-        time and memory efficient in some cases.""")),
+        time and memory efficient in some cases. 'memmap' writes results
+        of all ROIs straight into a single preallocated memory-mapped file,
+        and requires them to be of the same shape.""")),
+    (('--checkpoint-dir',), dict(metavar='DIR',
+        help="""directory to persist results of the ROIs into as they are
+        computed. If the analysis gets interrupted, rerunning it with the same
+        arguments and the same checkpoint directory would compute only the ROIs
+        which have no results stored yet.""")),
     (('--aggregate-fx',), dict(type=script2obj,
         help="""use a custom result aggregation function for the searchlight
              """)),
@@ -219,6 +226,7 @@ def run(args):
                      roi_ids=roi_ids,
                      nproc=args.nproc,
                      results_backend=args.multiproc_backend,
+                     checkpoint_dir=args.checkpoint_dir,
                      results_fx=aggregate_fx,
                      enable_ca=args.enable_ca,
                      disable_ca=args.disable_ca)
@@ -11,10 +11,13 @@
 __docformat__ = 'restructuredtext'
 
 from mvpa2.base import externals
+from mvpa2.base.dataset import vstack
 from mvpa2.base.dochelpers import _repr_attrs
 from mvpa2.support.copy import copy
 from mvpa2.clfs.transerror import ClassifierError
 from mvpa2.measures.base import Sensitivity
+from mvpa2.kernels.np import LinearKernel, CachedLinearKernel
+from mvpa2.kernels.libsvm import LinearLSKernel
 from mvpa2.featsel.base import IterativeFeatureSelection
 from mvpa2.featsel.helpers import BestDetector, \
                                  NBackHistoryStopCrit, \
@@ -40,6 +43,21 @@ if externals.exists('joblib'):
 if __debug__:
     from mvpa2.base import debug
 
+def _get_warm_start_learners(*nodes):
+    """Learners used by `nodes` (directly or via proxies) which could start
+    training from their previous solution (see `warm_start` parameter of SVMs)
+    """
+    learners = []
+    for node in nodes:
+        while node is not None:
+            params = getattr(node, 'params', None)
+            if params is not None and 'warm_start' in params \
+                   and not node in learners:
+                learners.append(node)
+            node = getattr(node, 'clf', getattr(node, 'measure', None))
+    return learners
+
+
 # TODO: Abs value of sensitivity should be able to rule RFE
 # Often it is what abs value of the sensitivity is what matters.
 # So we should either provide a simple decorator around arbitrary
@@ -56,6 +74,15 @@ class RFE(IterativeFeatureSelection):
     testdatset is computed. This procedure is repeated until a given
     `StoppingCriterion` is reached.
 
+    Since only a fraction of features is removed at each step, classifiers
+    (used by `fmeasure` and `pmeasure` directly or via proxies) which support
+    a warm start (e.g. `LinearCSVMC`) get it enabled during the elimination,
+    so they start training from the solution of the previous step.
+
+    Similarly, for learners with a linear kernel (see `cache_kernel`) the
+    kernel is computed once for all samples and downdated as features get
+    removed, instead of computing it from scratch at every step.
+
     References
     ----------
     Such strategy after
@@ -124,6 +151,8 @@ class RFE(IterativeFeatureSelection):
                  fselector=FractionTailSelector(0.05),
                  update_sensitivity=True,
                  nfeatures_min=0,
+                 cache_kernel=True,
+                 warm_start=False,
                  **kwargs):
         # XXX Allow for multiple stopping criterions, e.g. error not decreasing
         # anymore OR number of features less than threshold
@@ -152,6 +181,21 @@ class RFE(IterativeFeatureSelection):
           recomputed at each selection step.
         nfeatures_min : int
           Number of features for RFE to stop if reached.
+        cache_kernel : bool
+          If True, the kernel of a kernel-based learner with a linear kernel
+          (`LinearKernel`, or `LinearLSKernel` of libsvm's SVM), which
+          `fmeasure` or `pmeasure` train directly or as
+          `Sensitivity`/`ProxyMeasure`, gets replaced with a
+          `CachedLinearKernel` while selecting features.  It is computed once
+          for all samples and downdated for the features removed at every
+          step.
+        warm_start : bool
+          If True, learners with a `warm_start` parameter (C-SVMs of libsvm),
+          which `fmeasure` or `pmeasure` use directly or via proxies, get it
+          enabled while selecting features, so every step starts from the
+          solution of the previous one.  It reduces the number of solver
+          iterations but does not necessarily save time, and with a large C
+          it could even take longer.
         """
         # bases init first
         IterativeFeatureSelection.__init__(self, fmeasure, pmeasure, splitter,
@@ -162,13 +206,50 @@ class RFE(IterativeFeatureSelection):
 
         self._nfeatures_min = nfeatures_min
 
+        self.__cache_kernel = cache_kernel
+        """Flag whether to cache and downdate a linear kernel."""
+
+        self.__warm_start = warm_start
+        """Flag whether learners start from the solution of previous step."""
+
 
     def __repr__(self, prefixes=None):
         if prefixes is None:
             prefixes = []
         return super(RFE, self).__repr__(
             prefixes=prefixes
-            + _repr_attrs(self, ['update_sensitivity'], default=True))
+            + _repr_attrs(self, ['update_sensitivity'], default=True)
+            + _repr_attrs(self, ['cache_kernel'], default=True)
+            + _repr_attrs(self, ['warm_start'], default=False))
+
+
+    def _get_kernel_learners(self):
+        """Return learners whose linear kernel could be cached and downdated
+
+        Only learners which get the data as is, i.e. `fmeasure`/`pmeasure`
+        themselves or trained by them as `Sensitivity` or `ProxyMeasure`, are
+        considered.
+        """
+        if not self.__cache_kernel:
+            return []
+        learners = []
+        for node in (self._fmeasure, self._pmeasure):
+            if isinstance(node, Sensitivity):
+                node = node.clf
+            elif isinstance(node, ProxyMeasure):
+                node = node.measure
+            if not 'kernel-based' in getattr(node, '__tags__', []) \
+               or not 'kernel' in getattr(node, 'params', {}) \
+               or node in learners:
+                continue
+            kernel = node.params.kernel
+            # libsvm computes its kernels internally, but could use a
+            # precomputed one
+            if type(kernel) is LinearKernel \
+               or (type(kernel) is LinearLSKernel
+                   and 'libsvm' in node.__tags__):
+                learners.append(node)
+        return learners
 
     @due.dcite(
         BibTeX("""
@@ -201,6 +282,52 @@ class RFE(IterativeFeatureSelection):
         # get the initial split into train and test
         dataset, testdataset = self._get_traintest_ds(ds)
 
+        if self.__warm_start:
+            learners = [l for l in _get_warm_start_learners(self._fmeasure,
+                                                            self._pmeasure)
+                        if not l.params.warm_start]
+        else:
+            learners = []
+        if __debug__ and learners:
+            debug('RFEC', "Enabling warm start for %s", (learners,))
+        for learner in learners:
+            learner.params.warm_start = True
+
+        klearners = self._get_kernel_learners()
+        kernels = [l.params.kernel for l in klearners]
+        kdataset = ckernel = None
+        if len(klearners):
+            # all samples with unique origids, by which CachedLinearKernel
+            # looks them up, without altering the input dataset
+            if testdataset is None or testdataset is dataset:
+                kdataset = dataset.copy(deep=False)
+            else:
+                kdataset = vstack((dataset, testdataset), a=0)
+            kdataset.init_origids('both')
+            ckernel = CachedLinearKernel()
+            if __debug__:
+                debug('RFEC', "Caching linear kernel of %s on %s",
+                      (klearners, kdataset))
+            ckernel.compute(kdataset)
+            for learner in klearners:
+                learner.params.kernel = ckernel
+        try:
+            self._eliminate(dataset, testdataset, ckernel, kdataset)
+        finally:
+            for learner in learners:
+                learner.params.warm_start = False
+                # solution is of no use outside of this elimination
+                learner.reset_warm_start()
+            for learner, kernel in zip(klearners, kernels):
+                learner.params.kernel = kernel
+
+    def _eliminate(self, dataset, testdataset, ckernel=None, kdataset=None):
+        """Recursively eliminate features (see `_train`)
+
+        If `ckernel` is provided, it is the `CachedLinearKernel` of the
+        learners cached for `kdataset`, which contains all the samples of
+        `dataset` followed by those of `testdataset` (if different).
+        """
         if __debug__:
             debug('RFEC',
                   "Initiating RFE with training on %s and testing using %s",
@@ -232,6 +359,15 @@ class RFE(IterativeFeatureSelection):
         """Same feature selection has to be performs on test dataset as well.
         This will hold the current testdataset."""
 
+        if ckernel is not None:
+            # samples are looked up in the cached kernel by their origids
+            ntrain = len(dataset)
+            wdataset = kdataset[:ntrain]
+            if testdataset is dataset:
+                wtestdataset = wdataset
+            elif testdataset is not None:
+                wtestdataset = kdataset[ntrain:]
+
         step = 0
         """Counter how many selection step where done."""
 
@@ -319,7 +455,13 @@ class RFE(IterativeFeatureSelection):
 
 
             # Create a dataset only with selected features
-            wdataset = wdataset[:, selected_ids]
+            if ckernel is None:
+                wdataset = wdataset[:, selected_ids]
+            else:
+                # downdate the kernel and slice all samples at once
+                ckernel.select_features(kdataset, selected_ids)
+                kdataset = kdataset[:, selected_ids]
+                wdataset = kdataset[:ntrain]
 
             # select corresponding sensitivity values if they are not
             # recomputed
@@ -337,8 +479,14 @@ class RFE(IterativeFeatureSelection):
             #      in lightsvm. Or for god's sake leave-one-out
             #      on a wdataset
             # TODO: document these cases in this class
-            if testdataset is not None:
+            if testdataset is None:
+                pass
+            elif ckernel is None:
                 wtestdataset = wtestdataset[:, selected_ids]
+            elif testdataset is dataset:
+                wtestdataset = wdataset
+            else:
+                wtestdataset = kdataset[ntrain:]
 
             step += 1
 
@@ -386,6 +534,8 @@ class RFE(IterativeFeatureSelection):
 
     nfeatures_min = property(fget=_get_nfeatures_min, fset=_set_nfeatures_min)
     update_sensitivity = property(fget=lambda self: self.__update_sensitivity)
+    cache_kernel = property(fget=lambda self: self.__cache_kernel)
+    warm_start = property(fget=lambda self: self.__warm_start)
 
 def _process_partition(rfe, partition):
     """Helper function to be used to parallelize SplitRFE
@@ -553,6 +703,7 @@ class SplitRFE(RFE):
                   train_pmeasure=self.train_pmeasure,
                   stopping_criterion=None,   # full "track"
                   update_sensitivity=self.update_sensitivity,
+                  cache_kernel=self.cache_kernel,
                   enable_ca=['errors', 'nfeatures'])
 
         errors, nfeatures = [], []
@@ -96,6 +96,11 @@ class Kernel(ClassWithCollections):
     # 'linear', or 'rbf', to help coordinate kernel types across backends
     __kernel_name__ = None
 
+    # Whether the kernel between two samples depends only on these samples,
+    # so it could be computed once for a whole dataset and looked up for any
+    # subsets of it (see `CachedKernel`)
+    __cacheable__ = True
+
     def __init__(self, *args, **kwargs):
         """Base Kernel class has no parameters
         """
@@ -221,6 +226,9 @@ class CustomKernel(NumpyKernel):
     - repr/doc sicne now kernelfunc is not a Parameter
     """
 
+    # arbitrary function might depend on all the data
+    __cacheable__ = False
+
     def __init__(self, kernelfunc=None, *args, **kwargs):
         """Initialize CustomKernel with an arbitrary function.
 
@@ -249,6 +257,8 @@ class PrecomputedKernel(NumpyKernel):
     - repr/doc sicne now matrix is not a Parameter
     """
 
+    __cacheable__ = False
+
     # NB: to avoid storing matrix twice, after compute
     # self.params.matrix = self._k
     def __init__(self, matrix=None, *args, **kwargs):
@@ -285,8 +295,12 @@ class CachedKernel(NumpyKernel):
     a cache usable for compute(d2, d1).
     """
 
-    # TODO: Figure out how to design objects like CrossValidation etc to
-    # precompute this kernel automatically, making it transparent to the user
+    # `RepeatedMeasure` (e.g. `CrossValidation`) precomputes the kernel of
+    # a kernel-based learner automatically via this class (see its
+    # `cache_kernel`)
+
+    # already cached
+    __cacheable__ = False
 
     @property
     def __kernel_name__(self):
@@ -31,6 +31,9 @@ class _svmc(object):
 class LSKernel(Kernel):
     """A Kernel object which dictates how LibSVM will calculate the kernel"""
 
+    # nothing to cache -- it is computed by LibSVM
+    __cacheable__ = False
+
     def __init__(self, *args, **kwargs):
         """Base class for LIBSVM Kernels has no parameters
         """
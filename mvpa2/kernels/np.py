@@ -28,7 +28,7 @@ from mvpa2.base.param import Parameter
 from mvpa2.base.constraints import EnsureFloat, EnsureListOf
 from mvpa2.misc.exceptions import InvalidHyperparameterError
 from mvpa2.clfs.distance import squared_euclidean_distance
-from mvpa2.kernels.base import NumpyKernel
+from mvpa2.kernels.base import NumpyKernel, CachedKernel
 if __debug__:
     from mvpa2.base import debug, warning
 
@@ -36,10 +36,103 @@ if __debug__:
 
 class LinearKernel(NumpyKernel):
     """Simple linear kernel: K(a,b) = a*b.T"""
+    __kernel_name__ = 'linear'
+
     def _compute(self, d1, d2):
         self._k = np.dot(d1, d2.T)
 
 
+class CachedLinearKernel(CachedKernel):
+    """`CachedKernel` of a `LinearKernel` which follows removal of features
+
+    Removal of features from the cached samples is a low-rank downdate of
+    the linear kernel (see `select_features`), so it does not have to be
+    recomputed from scratch whenever some features get removed (e.g. on
+    every step of `RFE`).
+
+    If the dataset it gets cached for carries features' origids, the cache
+    is used only for datasets with the same features, and the kernel is
+    computed directly for any other features.
+    """
+
+    def __init__(self, *args, **kwargs):
+        CachedKernel.__init__(self, LinearKernel(), *args, **kwargs)
+        self._fids = None
+
+
+    def _cache(self, ds1, ds2=None):
+        CachedKernel._cache(self, ds1, ds2)
+        # downdates should not accumulate errors of low precision
+        self._k = self._kfull = np.asarray(self._kfull, dtype=np.float64)
+        self._fids = ds1.fa.origids if 'origids' in ds1.fa else None
+
+
+    def _is_cached_features(self, ds):
+        """Whether the cache is valid for the features of `ds`"""
+        if self._fids is None:
+            return True
+        return 'origids' in ds.fa \
+               and np.array_equal(ds.fa.origids, self._fids)
+
+
+    def compute(self, ds1, ds2=None, force=False):
+        if self._kfull is not None and not force and not (
+                self._is_cached_features(ds1)
+                and (ds2 is None or self._is_cached_features(ds2))):
+            if __debug__:
+                debug('KRN', "Computing %s directly on ds1=%s, ds2=%s since "
+                      "features differ from the cached ones", (self, ds1, ds2))
+            self._recomputed = False
+            self._kernel.compute(ds1, ds2)
+            self._k = self._kernel.as_raw_np()
+            self._kernel.cleanup()
+            return
+        CachedKernel.compute(self, ds1, ds2, force=force)
+
+
+    def select_features(self, ds, ids):
+        """Downdate the cached kernel for selection of features
+
+        Parameters
+        ----------
+        ds : Dataset
+          All the cached samples with the features the kernel is currently
+          cached for.  If the kernel is not cached for them, it gets cached
+          for the selected features of `ds`.
+        ids : sequence of int
+          Indices of features of `ds` to be kept, in the order they would
+          be sliced from `ds`.  The kernel gets downdated for the removed
+          ones, or recomputed on the selected ones if that is cheaper.
+        """
+        removed = np.ones(ds.nfeatures, dtype=bool)
+        removed[ids] = False
+        try:
+            rows = self._lhsids(ds)
+        except (TypeError, KeyError):
+            # not cached at all or for other samples
+            rows = None
+        if rows is None or self._rhsids is not self._lhsids \
+               or len(rows) != len(self._kfull) \
+               or not self._is_cached_features(ds):
+            self._cache(ds[:, ids])
+            return
+        nremoved = np.sum(removed)
+        if 2 * nremoved > ds.nfeatures:
+            # compute on the selected features
+            x = np.asarray(ds.samples[:, ids], dtype=np.float64)
+            k = np.dot(x, x.T)
+        else:
+            x = np.asarray(ds.samples[:, removed], dtype=np.float64)
+            k = self._kfull[np.ix_(rows, rows)] - np.dot(x, x.T)
+        if __debug__:
+            debug('KRN', "Removing %d out of %d features of %s from %s",
+                  (nremoved, ds.nfeatures, ds, self))
+        self._kfull[np.ix_(rows, rows)] = k
+        self._k = self._kfull
+        if self._fids is not None:
+            self._fids = self._fids[ids]
+
+
 class PolyKernel(NumpyKernel):
     """Polynomial kernel: K(a,b) = (gamma*a*b.T+coef0)**degree"""
     gamma = Parameter(1, doc='Gamma scaling coefficient')
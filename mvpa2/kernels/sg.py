@@ -112,6 +112,15 @@ class _BasicSGKernel(SGKernel):
             normalizer_args = []
         self._normalizer_args = normalizer_args
 
+    @property
+    def __cacheable__(self):
+        """Normalizers (e.g. by the average diagonal) might depend on all data
+        """
+        return not self._normalizer_cls \
+               or self._normalizer_cls is getattr(sgk,
+                                                  'IdentityKernelNormalizer',
+                                                  None)
+
     def _compute(self, d1, d2):
         d1 = SGKernel._data2features(d1)
         d2 = SGKernel._data2features(d2)
@@ -200,6 +209,8 @@ class PrecomputedSGKernel(SGKernel):
     # NB: To avoid storing kernel twice, self.params.matrix = self._k once the
     # kernel is 'computed'
 
+    __cacheable__ = False
+
     def __init__(self, matrix=None, **kwargs):
         """Initialize PrecomputedSGKernel
 
@@ -12,6 +12,8 @@ __docformat__ = 'restructuredtext'
 
 import numpy as np
 from mvpa2.base import externals
+from mvpa2.support.copy import deepcopy
+from itertools import izip
 from mvpa2.base.param import Parameter
 from mvpa2.base.constraints import EnsureChoice
 from mvpa2.base.types import is_datasetlike
@@ -22,6 +24,9 @@ if __debug__:
     from mvpa2.base import debug
 
 
+# maximal number of elements in a stack of cross-products decomposed at once
+_BATCH_MAX_SIZE = 2 ** 22
+
 
 class ProcrusteanMapper(ProjectionMapper):
     """Mapper to project from one space to another using Procrustean
@@ -73,141 +78,238 @@ class ProcrusteanMapper(ProjectionMapper):
     def _train(self, source):
         params = self.params
         # Since it is unsupervised, we don't care about labels
-        datas = ()
-        odatas = ()
-        means = ()
-        shapes = ()
-
-        assess_residuals = __debug__ and 'MAP_' in debug.active
-
         target = source.sa[self.get_space()].value
 
-        for i, ds in enumerate((source, target)):
-            if is_datasetlike(ds):
-                data = np.asarray(ds.samples)
+        odatas = [np.asarray(ds.samples) if is_datasetlike(ds) else ds
+                  for ds in (source, target)]
+        sm, tm = odatas[0].shape[1], odatas[1].shape[1]
+
+        if params.oblique:
+            datas, means, norms = self._get_normed(*odatas)
+            sn = len(datas[0])
+            # add new blank dimensions to source space if needed
+            if sm < tm:
+                datas[0] = np.hstack((datas[0], np.zeros((sn, tm - sm))))
+            if sm > tm:
+                datas[1] = np.hstack((datas[1], np.zeros((sn, sm - tm))))
+            source, target = datas
+            # Just do silly linear system of equations ;) or naive
+            # inverse problem
+            if sn == sm and tm == 1:
+                T = np.linalg.solve(source, target)
             else:
-                data = ds
-            if assess_residuals:
-                odatas += (data,)
+                T = np.linalg.lstsq(source, target, rcond=params.oblique_rcond)[0]
+            # select out only relevant dimensions
+            if sm != tm:
+                T = T[:sm, :tm]
+            self._scale = scale = norms[1] / norms[0]
+            # Assign projection
+            if params.scaling:
+                proj = scale * T
+            else:
+                proj = T
+        else:
+            # Orthogonal transformation -- a batch of a single pair
+            cross, means, norms = self._get_batch_cross(*odatas)
+            transformations = [None]
+            self._solve_batch((sm, tm), [(0, cross, means, norms)],
+                              transformations)
+            proj, self._scale = transformations[0][:2]
+        self._proj = proj
+
+        if self._demean:
+            self._offset_out = means[1]
+
+        if __debug__ and 'MAP_' in debug.active:
+            # compute the residuals
+            res_f = self.forward(odatas[0])
+            d_f = np.linalg.norm(odatas[1] - res_f)/np.linalg.norm(odatas[1])
+            res_r = self.reverse(odatas[1])
+            d_r = np.linalg.norm(odatas[0] - res_r)/np.linalg.norm(odatas[0])
+            debug('MAP_', "%s, residuals are forward: %g,"
+                  " reverse: %g" % (repr(self), d_f, d_r))
+
+
+    supports_batch = property(
+        fget=lambda self: not self.params.oblique
+                          and self.params.svd == 'numpy',
+        doc="Whether `get_batch_transformations()` could be used")
+
+
+    def _get_normed(self, source, target):
+        """Demeaned and normalized source/target data, with their means and norms
+        """
+        datas, means, norms = [], [], []
+        for data in (source, target):
+            data = np.asarray(data)
             if self._demean:
-                if i == 0:
-                    mean = self._offset_in
-                else:
-                    mean = data.mean(axis=0)
+                mean = data.mean(axis=0)
                 data = data - mean
             else:
                 # no demeaning === zero means
                 mean = np.zeros(shape=data.shape[1:])
-            means += (mean,)
-            datas += (data,)
-            shapes += (data.shape,)
-
-        # shortcuts for sizes
-        sn, sm = shapes[0]
-        tn, tm = shapes[1]
-
-        # Check the sizes
+            # Sums of squares
+            ssq = np.sum(data ** 2, axis=0)
+            # XXX check for being invariant?
+            #     needs to be tuned up properly and not raise but handle
+            if np.all(ssq <= np.abs((np.finfo(data.dtype).eps
+                                     * len(data) * mean) ** 2)):
+                raise ValueError, \
+                      "For now do not handle invariant in time datasets"
+            norm = np.sqrt(np.sum(ssq))
+            datas.append(data / norm)
+            means.append(mean)
+            norms.append(norm)
+        (sn, sm), (tn, tm) = datas[0].shape, datas[1].shape
         if sn != tn:
             raise ValueError, "Data for both spaces should have the same " \
                   "number of samples. Got %d in source and %d in target space" \
                   % (sn, tn)
+        if sm > tm and not self.params.reduction:
+            raise ValueError, "reduction=False, so mapping from " \
+                  "higher dimensionality " \
+                  "source space is not supported. Source space had %d " \
+                  "while target %d dimensions (features)" % (sm, tm)
+        return datas, means, norms
 
-        # Sums of squares
-        ssqs = [np.sum(d**2, axis=0) for d in datas]
-
-        # XXX check for being invariant?
-        #     needs to be tuned up properly and not raise but handle
-        for i in xrange(2):
-            if np.all(ssqs[i] <= np.abs((np.finfo(datas[i].dtype).eps
-                                       * sn * means[i] )**2)):
-                raise ValueError, "For now do not handle invariant in time datasets"
 
-        norms = [ np.sqrt(np.sum(ssq)) for ssq in ssqs ]
-        normed = [ data/norm for (data, norm) in zip(datas, norms) ]
+    def _get_batch_cross(self, source, target):
+        """Cross-product of demeaned and normalized source/target data"""
+        datas, means, norms = self._get_normed(source, target)
+        sm, tm = datas[0].shape[1], datas[1].shape[1]
+        # blank dimensions are added as needed
+        dtype = np.result_type(*datas)
+        if sm != tm:
+            # as if stacked with (double) zeros
+            dtype = np.result_type(dtype, np.float64)
+        cross = np.zeros((max(sm, tm),) * 2, dtype=dtype)
+        cross[:tm, :sm] = np.dot(datas[1].T, datas[0])
+        return cross, means, norms
 
-        # add new blank dimensions to source space if needed
-        if sm < tm:
-            normed[0] = np.hstack( (normed[0], np.zeros((sn, tm-sm))) )
 
-        if sm > tm:
-            if params.reduction:
-                normed[1] = np.hstack( (normed[1], np.zeros((sn, sm-tm))) )
-            else:
-                raise ValueError, "reduction=False, so mapping from " \
-                      "higher dimensionality " \
-                      "source space is not supported. Source space had %d " \
-                      "while target %d dimensions (features)" % (sm, tm)
-
-        source, target = normed
-        if params.oblique:
-            # Just do silly linear system of equations ;) or naive
-            # inverse problem
-            if sn == sm and tm == 1:
-                T = np.linalg.solve(source, target)
-            else:
-                T = np.linalg.lstsq(source, target, rcond=params.oblique_rcond)[0]
-            ss = 1.0
+    def _solve_batch(self, shape, batch, transformations):
+        """Decompose a stack of cross-products and store transformations"""
+        params = self.params
+        sm, tm = shape
+        if __debug__:
+            debug('MAP', "Computing %i Procrustean transformations %i->%i"
+                  % (len(batch), sm, tm))
+        crosses = np.array([b[1] for b in batch])
+        if params.svd == 'numpy':
+            # all at once
+            U, s, Vh = np.linalg.svd(crosses, full_matrices=False)
         else:
-            # Orthogonal transformation
-            # figure out optimal rotation
-            if params.svd == 'numpy':
-                U, s, Vh = np.linalg.svd(np.dot(target.T, source),
-                               full_matrices=False)
-            elif params.svd == 'scipy':
+            if params.svd == 'scipy':
                 # would raise exception if not present
                 externals.exists('scipy', raise_=True)
-                import scipy
-                U, s, Vh = scipy.linalg.svd(np.dot(target.T, source),
-                               full_matrices=False)
+                import scipy.linalg
+                svd = lambda x: scipy.linalg.svd(x, full_matrices=False)
             elif params.svd == 'dgesvd':
                 from mvpa2.support.lapack_svd import svd as dgesvd
-                U, s, Vh = dgesvd(np.dot(target.T, source),
-                                    full_matrices=True, algo='svd')
+                svd = lambda x: dgesvd(x, full_matrices=True, algo='svd')
             else:
                 raise ValueError('Unknown type of svd %r'%(params.svd))
-            T = np.dot(Vh.T, U.T)
-
-            if not params.reflection:
-                # then we need to assure that it is only rotation
-                # "recipe" from
-                # http://en.wikipedia.org/wiki/Orthogonal_Procrustes_problem
-                # for more and info and original references, see
-                # http://dx.doi.org/10.1007%2FBF02289451
-                nsv = len(s)
-                s[:-1] = 1
-                s[-1] = np.linalg.det(T)
-                T = np.dot(U[:, :nsv] * s, Vh)
-
-            # figure out scale and final translation
-            # XXX with reflection False -- not sure if here or there or anywhere...
-            ss = sum(s)
-
-        # if we were to collect standardized distance
-        # std_d = 1 - sD**2
-
-        # select out only relevant dimensions
-        if sm != tm:
-            T = T[:sm, :tm]
+            U, s, Vh = [np.array(x) for x in zip(*[svd(c) for c in crosses])]
+        T = np.array([np.dot(vh.T, u.T) for u, vh in zip(U, Vh)])
+        if not params.reflection:
+            # then we need to assure that it is only rotation
+            # "recipe" from
+            # http://en.wikipedia.org/wiki/Orthogonal_Procrustes_problem
+            # for more and info and original references, see
+            # http://dx.doi.org/10.1007%2FBF02289451
+            nsv = s.shape[1]
+            s[:, :-1] = 1
+            s[:, -1] = np.linalg.det(T)
+            T = np.array([np.dot(u[:, :nsv] * s_, vh)
+                          for u, s_, vh in zip(U, s, Vh)])
+        # figure out scale and final translation
+        # XXX with reflection False -- not sure if here or there or anywhere...
+        ss = np.sum(s, axis=1)
+        for j, (i, cross, means, norms) in enumerate(batch):
+            scale = ss[j] * norms[1] / norms[0]
+            proj = T[j][:sm, :tm]
+            if params.scaling:
+                proj = scale * proj
+            if self._demean:
+                offsets = tuple(means)
+            else:
+                offsets = (None, None)
+            transformations[i] = (proj, scale) + offsets
 
-        self._scale = scale = ss * norms[1] / norms[0]
-        # Assign projection
-        if self.params.scaling:
-            proj = scale * T
-        else:
-            proj = T
-        self._proj = proj
 
-        if self._demean:
-            self._offset_out = means[1]
+    def get_batch_transformations(self, sources, targets):
+        """Estimate transformations of multiple source/target pairs at once.
 
-        if __debug__ and 'MAP_' in debug.active:
-            # compute the residuals
-            res_f = self.forward(odatas[0])
-            d_f = np.linalg.norm(odatas[1] - res_f)/np.linalg.norm(odatas[1])
-            res_r = self.reverse(odatas[1])
-            d_r = np.linalg.norm(odatas[0] - res_r)/np.linalg.norm(odatas[0])
-            debug('MAP_', "%s, residuals are forward: %g,"
-                  " reverse: %g" % (repr(self), d_f, d_r))
+        The result is identical to training a copy of this mapper on each
+        source with the corresponding target, but no mapper is created, and
+        the cross-products of pairs of the same dimensionality are
+        decomposed together by the stacked SVD.  Only orthogonal
+        transformations with 'numpy' SVD are supported (see
+        `supports_batch`).
+
+        Parameters
+        ----------
+        sources : sequence of arrays
+          Data in the source spaces (samples x features).
+        targets : iterable of arrays
+          Data in the corresponding target spaces.  Targets are consumed
+          one at a time, so it could be a generator.
+
+        Returns
+        -------
+        list of tuples
+          ``(proj, scale, offset_in, offset_out)`` per each pair to be used
+          with `forward_transformation()` or `from_transformation()`.
+        """
+        if not self.supports_batch:
+            raise ValueError("Batch estimation is supported only for "
+                             "oblique=False and svd='numpy'")
+        transformations = []
+        # batches of cross-products per dimensionality
+        pending = {}
+        for i, (source, target) in enumerate(izip(sources, targets)):
+            cross, means, norms = self._get_batch_cross(source, target)
+            shape = (np.shape(source)[1], np.shape(target)[1])
+            batch = pending.setdefault(shape, [])
+            batch.append((i, cross, means, norms))
+            transformations.append(None)
+            if len(batch) * cross.size >= _BATCH_MAX_SIZE:
+                self._solve_batch(shape, pending.pop(shape), transformations)
+        if len(transformations) != len(sources):
+            raise ValueError("Got fewer targets (%i) than sources (%i)"
+                             % (len(transformations), len(sources)))
+        for shape, batch in pending.iteritems():
+            self._solve_batch(shape, batch, transformations)
+        return transformations
+
+
+    @staticmethod
+    def forward_transformation(data, transformation):
+        """Project data with a transformation from `get_batch_transformations()`
+        """
+        proj, scale, offset_in, offset_out = transformation
+        if offset_in is not None:
+            data = data - offset_in
+        res = np.dot(data, proj)
+        if offset_out is not None:
+            res += offset_out
+        return res
+
+
+    def from_transformation(self, transformation):
+        """Copy of this mapper trained with a precomputed transformation
+
+        Parameters
+        ----------
+        transformation : tuple
+          As returned by `get_batch_transformations()`.
+        """
+        mapper = deepcopy(self)
+        mapper._proj, mapper._scale, mapper._offset_in, mapper._offset_out \
+            = transformation
+        mapper._recon = None
+        mapper._set_trained()
+        return mapper
 
 
     def _compute_recon(self):
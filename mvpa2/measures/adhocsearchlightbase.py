@@ -40,6 +40,10 @@ if externals.exists('scipy'):
 
 __all__ = [ "SimpleStatSearchlight" ]
 
+# Maximal number of elements in per-feature terms of multiple splits
+# to be summed within ROIs at once
+_FUSED_TERMS_MAX_SIZE = 2**24
+
 def lastdim_columnsums_fancy_indexing(a, inds, out):
     for i, inds_ in enumerate(inds):
         out[..., i] = a[..., inds_].sum(axis=-1)
@@ -102,7 +106,9 @@ def lastdim_columnsums_spmatrix(a, inds, out):
         inds_s = inds_to_coo(inds, shape=(n_cols, n_sums))
 
     ar = a.reshape((-1, a.shape[-1]))
-    sums = np.asarray((sps.csr_matrix(ar) * inds_s).todense())
+    # sparse * dense product gives dense result directly, without
+    # converting (dense) data into sparse representation first
+    sums = np.asarray(inds_s.T.tocsr() * ar.T).T
     out[:] = sums.reshape(in_shape+(n_sums,))
 
 
@@ -144,7 +150,12 @@ class SimpleStatBaseSearchlight(BaseSearchlight):
         ----------
         generator : `Generator`
           Some `Generator` to prepare partitions for cross-validation.
-          It must not change "targets", thus e.g. no AttributePermutator's
+          It might alter "targets" (e.g. `ChainNode` of a partitioner and
+          an `AttributePermutator`), in which case every permuted
+          partition gets scored within the same pass, sharing the
+          statistics per each block of samples.  Results (and
+          ``cvfolds``) then correspond to the generated partitions in
+          their order.
         errorfx : func, optional
           Functor that computes a scalar error value from the vectors of
           desired and predicted values (e.g. subclass of `ErrorFunction`).
@@ -188,6 +199,7 @@ class SimpleStatBaseSearchlight(BaseSearchlight):
                   "autodetection) is supported by GNBSearchlight"
 
         self.__pb = None            # statistics per each block/label
+        self.__pt = None            # totals per each label
         self.__reuse_neighbors = reuse_neighbors
 
         # Storage to be used for neighborhood information
@@ -210,7 +222,7 @@ class SimpleStatBaseSearchlight(BaseSearchlight):
 
     def _untrain(self):
         super(SimpleStatBaseSearchlight, self)._untrain()
-        self.__pb = None
+        self.__pb = self.__pt = None
 
 
     def _compute_pb_stats(self, labels_numeric,
@@ -250,6 +262,18 @@ class SimpleStatBaseSearchlight(BaseSearchlight):
         # additional silly tests for paranoid
         assert(pb.labels.dtype.kind == 'i')
 
+        # totals per each label, so training statistics of a split
+        # could be obtained by subtracting the (usually few) blocks left
+        # out instead of summing all the blocks of the training
+        pt = self.__pt = _STATS()
+        ulabels_numeric = self._ulabels_numeric
+        pt.sums = np.array([pb.sums[pb.labels == l].sum(axis=0)
+                            for l in ulabels_numeric])
+        pt.sums2 = np.array([pb.sums2[pb.labels == l].sum(axis=0)
+                             for l in ulabels_numeric])
+        pt.nsamples = np.array([pb.nsamples[pb.labels == l].sum()
+                                for l in ulabels_numeric])
+
 
     def _compute_pl_stats(self, sis, pl):
         """
@@ -265,20 +289,32 @@ class SimpleStatBaseSearchlight(BaseSearchlight):
         """
         # local binding
         pb = self.__pb
+        pt = self.__pt
 
         # convert to blocks training split
         bis = np.unique(self.__sample2block[sis])
+        # if the split covers most of the blocks (e.g. training in
+        # leave-one-chunk-out), subtract the rest from the totals
+        subtract = pt is not None and 2 * len(bis) > len(pb.labels)
+        if subtract:
+            bis = np.setdiff1d(np.arange(len(pb.labels)), bis)
 
         # Let's collect stats summaries
         nsamples = 0
         for il, l in enumerate(self._ulabels_numeric):
             bis_il = bis[pb.labels[bis] == l]
-            pl.nsamples[il] = N_float = \
-                                     float(np.sum(pb.nsamples[bis_il]))
+            N_float = float(np.sum(pb.nsamples[bis_il]))
+            if subtract:
+                N_float = pt.nsamples[il] - N_float
+            pl.nsamples[il] = N_float
             nsamples += N_float
             if N_float == 0.0:
                 pl.variances[il] = pl.sums[il] \
                     = pl.means[il] = pl.sums2[il] = 0.
+            elif subtract:
+                pl.sums[il] = pt.sums[il] - np.sum(pb.sums[bis_il], axis=0)
+                pl.means[il] = pl.sums[il] / N_float
+                pl.sums2[il] = pt.sums2[il] - np.sum(pb.sums2[bis_il], axis=0)
             else:
                 pl.sums[il] = np.sum(pb.sums[bis_il], axis=0)
                 pl.means[il] = pl.sums[il] / N_float
@@ -294,6 +330,38 @@ class SimpleStatBaseSearchlight(BaseSearchlight):
         return nsamples, non0labels
 
 
+    def _get_split_terms(self, split, X, training_sis, testing_sis,
+                         labels_numeric):
+        """Compute per-feature terms of a split which get summed within ROIs
+
+        Returns
+        -------
+        None or (terms, finalize)
+          `terms` is an array with features along the last dimension.
+          `finalize` is a callable which given the sums of `terms` within
+          ROIs (last dimension replaced by ROIs) returns targets and
+          predictions.  None if predictions for the split cannot be
+          expressed via such sums, so `_sl_call_on_a_split` must take care.
+        """
+        raise NotImplementedError("Must be implemented in derived classes")
+
+
+    def _sl_call_on_a_split(self,
+                            split, X,
+                            training_sis, testing_sis,
+                            nroi_fids, roi_fids,
+                            indexsum_fx,
+                            labels_numeric,
+                            ):
+        """Compute targets and predictions for a single split
+        """
+        terms, finalize = self._get_split_terms(
+            split, X, training_sis, testing_sis, labels_numeric)
+        sums = np.zeros(terms.shape[:-1] + (nroi_fids,))
+        indexsum_fx(terms, roi_fids, out=sums)
+        return finalize(sums)
+
+
     def _sl_call(self, dataset, roi_ids, nproc):
         """Call to SimpleStatBaseSearchlight
         """
@@ -374,13 +442,22 @@ class SimpleStatBaseSearchlight(BaseSearchlight):
             if generator \
             else [dataset_indicies]
 
-        if __debug__:
-            for p in partitions:
+        # Generator might alter the targets (e.g. permutators), so
+        # collect labels as seen by each partition
+        partitions_labels_numeric = []
+        for p in partitions:
+            if __debug__:
                 assert(p.shape[1] == 1)
-                if not (np.all(p.sa[targets_sa_name].value == labels[p.samples[:, 0]])):
-                    raise NotImplementedError(
-                        "%s does not yet support partitioners altering the targets "
-                        "(e.g. permutators)" % self.__class__)
+            p_labels = p.sa[targets_sa_name].value
+            if np.all(p_labels == labels[p.samples[:, 0]]):
+                partitions_labels_numeric.append(labels_numeric)
+            else:
+                p_labels_numeric = labels_numeric.copy()
+                p_labels_numeric[p.samples[:, 0]] = \
+                    [label2index[l] for l in p_labels]
+                partitions_labels_numeric.append(p_labels_numeric)
+        permuted = any(l is not labels_numeric
+                       for l in partitions_labels_numeric)
 
         nsplits = len(partitions)
         # ATM we need to keep the splits instead since they are used
@@ -398,9 +475,17 @@ class SimpleStatBaseSearchlight(BaseSearchlight):
         # array of indicies for label, split1, split2, ...
         # through which we will pass later on to figure out
         # unique combinations
-        combinations = np.ones((nsamples, 1+nsplits), dtype=int)*-1
+        # If labels were altered, blocks must be homogeneous in the labels
+        # of every split as well, so those get added as columns after
+        # the splits.  Statistics per block do not depend on the labels,
+        # and are shared among all the splits
+        combinations = np.ones((nsamples, 1 + nsplits * (1 + permuted)),
+                               dtype=int)*-1
         # labels
         combinations[:, 0] = labels_numeric
+        if permuted:
+            combinations[:, 1+nsplits:] = \
+                np.array(partitions_labels_numeric).T
         for ipartition, (split1, split2) in enumerate(splits):
             combinations[split1.samples[:, 0], 1+ipartition] = 1
             combinations[split2.samples[:, 0], 1+ipartition] = 2
@@ -420,6 +505,9 @@ class SimpleStatBaseSearchlight(BaseSearchlight):
         # Indices for samples to point to their block
         self.__sample2block = sample2block = \
             np.array([description2block[d] for d in descriptions])
+        if permuted:
+            # labels of the blocks for each split
+            splits_block_labels = np.array(udescriptions)[:, 1+nsplits:].T
 
         # 3. Compute statistics per each block
         #
@@ -428,6 +516,9 @@ class SimpleStatBaseSearchlight(BaseSearchlight):
                   'Phase 3. Computing statistics for %i blocks' % (nblocks,))
 
         self._compute_pb_stats(labels_numeric, X, (nblocks,) + s_shape)
+        if permuted:
+            # totals per label differ among splits, so of no use
+            self.__pt = None
 
         # derived classes might decide differently on what they
         # actually need, so defer reserving the space and computing
@@ -446,15 +537,17 @@ class SimpleStatBaseSearchlight(BaseSearchlight):
 
         # 4. Lets deduce all neighbors... might need to be RF into the
         #    parallel part later on
-        # TODO: needs OPT since this is the step consuming 50% of time
-        #       or more allow to cache them entirely so this would
-        #       not be an unnecessary burden during permutation testing
+        # Query engine provides all neighborhoods at once in compressed
+        # sparse row format, and reuse_neighbors allows to cache them
+        # entirely so this would not be an unnecessary burden during
+        # permutation testing
         if not self.reuse_neighbors or self.__roi_fids is None:
             if __debug__:
                 debug('SLC',
                       'Phase 4. Deducing neighbors information for %i ROIs'
                       % (nrois,))
-            roi_fids = [qe.query_byid(f) for f in roi_ids]
+            roi_indptr, roi_indices = qe.query_byid_batch(roi_ids)
+            roi_fids = np.split(roi_indices, roi_indptr[1:-1])
 
         else:
             if __debug__:
@@ -494,9 +587,11 @@ class SimpleStatBaseSearchlight(BaseSearchlight):
                           'Phase 4b. Converting neighbors to sparse matrix '
                           'representation')
                 # convert to "sparse representation" where column j contains
-                # 1s only at the roi_fids[j] indices
-                roi_fids = inds_to_coo(roi_fids,
-                                       shape=(dataset.nfeatures, nroi_fids))
+                # 1s only at the roi_fids[j] indices, which is exactly what
+                # the compressed representation of neighbors provides
+                roi_fids = sps.csc_matrix(
+                    (np.ones(len(roi_indices)), roi_indices, roi_indptr),
+                    shape=(dataset.nfeatures, nroi_fids))
             indexsum_fx = lastdim_columnsums_spmatrix
         elif indexsum == 'fancy':
             indexsum_fx = lastdim_columnsums_fancy_indexing
@@ -513,29 +608,8 @@ class SimpleStatBaseSearchlight(BaseSearchlight):
             debug('SLC', 'Phase 5. Major loop' )
 
 
-        for isplit, split in enumerate(splits):
-            if __debug__:
-                debug('SLC', ' Split %i out of %i' % (isplit+1, nsplits))
-            # figure out for a given splits the blocks we want to work
-            # with
-            # sample_indicies
-            training_sis = split[0].samples[:, 0]
-            testing_sis = split[1].samples[:, 0]
-
-            # That is the GNB specificity
-            targets, predictions = self._sl_call_on_a_split(
-                split, X,               # X2 might light to go
-                training_sis, testing_sis,
-                ## training_nsamples,      # GO? == np.sum(pl.nsamples)
-                ## training_non0labels,
-                ## pl.sums, pl.means, pl.sums2, pl.variances,
-                # passing nroi_fids as well since in 'sparse' way it has no 'length'
-                nroi_fids, roi_fids,
-                indexsum_fx,
-                labels_numeric,
-                )
-
-            # assess the errors
+        def assess(isplit, targets, predictions):
+            """Assess the errors and collect results for a split"""
             if __debug__:
                 debug('SLC', "  Assessing accuracies")
 
@@ -543,7 +617,7 @@ class SimpleStatBaseSearchlight(BaseSearchlight):
                 results[isplit, :] = \
                     (predictions != targets[:, None]).sum(axis=0) \
                     / float(len(targets))
-                all_cvfolds += [isplit]
+                all_cvfolds.append(isplit)
             elif errorfx:
                 # somewhat silly but a way which allows to use pre-crafted
                 # error functions without a chance to screw up
@@ -551,17 +625,75 @@ class SimpleStatBaseSearchlight(BaseSearchlight):
                     np.array([errorfx(fpredictions, targets)
                               for fpredictions in predictions.T]))
                 results.append(result)
-                all_cvfolds += [isplit] * result.shape[0]
+                all_cvfolds.extend([isplit] * result.shape[0])
 
             else:
                 # and if no errorfx -- we just need to assign original
                 # labels to the predictions BUT keep in mind that it is a matrix
                 results.append(assign_ulabels(predictions))
-                all_targets += [ulabels[i] for i in targets]
-                all_cvfolds += [isplit] * len(targets)
+                all_targets.extend([ulabels[i] for i in targets])
+                all_cvfolds.extend([isplit] * len(targets))
+
+        # With sparse matrices, per-feature terms of multiple splits get
+        # stacked, so sums within all ROIs are obtained in a single product
+        pending = []
+        def flush_pending():
+            if not len(pending):
+                return
+            if __debug__:
+                debug('SLC', "  Summing within ROIs for %i splits"
+                      % len(pending))
+            terms = np.vstack([t.reshape((-1, t.shape[-1]))
+                               for _, t, _ in pending])
+            sums = np.empty((len(terms), nroi_fids))
+            indexsum_fx(terms, roi_fids, out=sums)
+            offset = 0
+            for isplit, t, finalize in pending:
+                n = t.size // t.shape[-1]
+                assess(isplit, *finalize(
+                    sums[offset:offset + n].reshape(t.shape[:-1] + (nroi_fids,))))
+                offset += n
+            del pending[:]
+
+        for isplit, split in enumerate(splits):
+            if __debug__:
+                debug('SLC', ' Split %i out of %i' % (isplit+1, nsplits))
+            # figure out for a given splits the blocks we want to work
+            # with
+            # sample_indicies
+            training_sis = split[0].samples[:, 0]
+            testing_sis = split[1].samples[:, 0]
+            split_labels_numeric = partitions_labels_numeric[isplit]
+            if permuted:
+                self.__pb.labels = splits_block_labels[isplit]
+
+            if indexsum == 'sparse':
+                split_terms = self._get_split_terms(
+                    split, X, training_sis, testing_sis, split_labels_numeric)
+                if split_terms is not None:
+                    pending.append((isplit,) + tuple(split_terms))
+                    if sum(t.size for _, t, _ in pending) \
+                           > _FUSED_TERMS_MAX_SIZE:
+                        flush_pending()
+                    continue
+                # keep the order of the results
+                flush_pending()
+
+            # That is the GNB specificity
+            targets, predictions = self._sl_call_on_a_split(
+                split, X,               # X2 might light to go
+                training_sis, testing_sis,
+                # passing nroi_fids as well since in 'sparse' way it has no 'length'
+                nroi_fids, roi_fids,
+                indexsum_fx,
+                split_labels_numeric,
+                )
+            assess(isplit, targets, predictions)
 
             pass  # end of the split loop
 
+        flush_pending()
+
         if isinstance(results, list):
             # we have just collected them, now they need to be vstacked
             results = np.vstack(results)
@@ -19,7 +19,10 @@ has to be in some iterable container.
 
 __docformat__ = 'restructuredtext'
 
+from itertools import chain, imap, izip
+
 import numpy as np
+import mvpa2
 import mvpa2.support.copy as copy
 
 from mvpa2.base.node import Node
@@ -34,9 +37,12 @@ from mvpa2.base.dochelpers import enhanced_doc_string, _str, _repr_attrs
 from mvpa2.base import externals, warning
 from mvpa2.clfs.stats import auto_null_dist
 from mvpa2.base.dataset import AttrDataset, vstack, hstack
+from mvpa2.support.utils import dump_to_tempfile, load_from_tempfile
 from mvpa2.datasets import Dataset
 from mvpa2.mappers.fx import BinaryFxNode
 from mvpa2.generators.splitters import Splitter
+from mvpa2.generators.partition import Partitioner
+from mvpa2.kernels.base import CachedKernel
 
 if __debug__:
     from mvpa2.base import debug
@@ -263,6 +269,8 @@ class RepeatedMeasure(Measure):
                  generator=None,
                  callback=None,
                  concat_as='samples',
+                 cache_kernel=True,
+                 nproc=1,
                  **kwargs):
         """
         Parameters
@@ -285,13 +293,47 @@ class RepeatedMeasure(Measure):
           By default, results are 'vstacked' as multiple samples in the output
           dataset. Setting this argument to 'features' will change this to
           'hstacking' along the feature axis.
+        cache_kernel : bool, optional
+          If the node is a kernel-based learner (or a `TransferMeasure` of
+          such learner), and datasets are generated by a `Partitioner`, then
+          the kernel matrix of all samples of the input dataset is computed
+          only once.  In each run the learner looks up the relevant part of
+          it via a `CachedKernel`.  It is done only if the learner's kernel
+          is cacheable, i.e. the kernel between two samples does not depend
+          on the other samples.
+        nproc : None or int, optional
+          How many processes to use for running the node on the generated
+          datasets.  With more than one, all datasets are generated first
+          and the node runs on each of them in a forked child process,
+          which gets the datasets (and the precomputed kernel) as shared
+          read-only memory.  Results and the node's conditional attributes
+          are collected in the order of the generated datasets, so the
+          output is the same as of a single process run of a deterministic
+          node.  The node runs on the last dataset in this process, so it
+          is left in the same state (e.g. a trained learner) as after a
+          single process run.  `callback` is not supported.  Requires
+          `pprocess` module.  If None -- all available cores are used.
         """
         Measure.__init__(self, **kwargs)
 
+        if nproc != 1:
+            if not externals.exists('pprocess'):
+                raise RuntimeError("The 'pprocess' module is required for "
+                                   "running %s in multiple processes. Please "
+                                   "either install python-pprocess, or set "
+                                   "`nproc` to 1 (got nproc=%s)"
+                                   % (self.__class__.__name__, nproc))
+            if callback is not None:
+                raise ValueError("callback cannot be used with nproc != 1 "
+                                 "since the node does not run in this "
+                                 "process (got nproc=%s)" % nproc)
+
         self._node = node
         self._generator = generator
         self._callback = callback
         self._concat_as = concat_as
+        self._cache_kernel = cache_kernel
+        self._nproc = nproc
 
     def __repr__(self, prefixes=None, exclude=None):
         if prefixes is None:
@@ -303,10 +345,59 @@ class RepeatedMeasure(Measure):
             + _repr_attrs(self, [x for x in ['node', 'generator', 'callback']
                                  if not x in exclude])
             + _repr_attrs(self, ['concat_as'], default='samples')
+            + _repr_attrs(self, ['cache_kernel'], default=True)
+            + _repr_attrs(self, ['nproc'], default=1)
             )
 
 
+    def _get_kernel_learner(self):
+        """Return learner whose kernel could be computed once for all runs
+
+        Returns None if there is no such learner or caching is disabled.
+        """
+        if not self._cache_kernel:
+            return None
+        # any other generator might alter the samples
+        if not (self._generator is None
+                or isinstance(self._generator, Partitioner)):
+            return None
+        learner = self._node
+        if isinstance(learner, TransferMeasure):
+            if type(learner.splitter) is not Splitter:
+                return None
+            learner = learner.measure
+        if not 'kernel-based' in getattr(learner, '__tags__', []) \
+           or not 'kernel' in getattr(learner, 'params', {}):
+            return None
+        kernel = learner.params.kernel
+        if kernel is None or not kernel.__cacheable__:
+            return None
+        return learner
+
+
     def _call(self, ds):
+        learner = self._get_kernel_learner()
+        if learner is None:
+            return self._call_repeatedly(ds)
+
+        kernel = learner.params.kernel
+        # do not alter the input dataset while assigning unique origids, by
+        # which the CachedKernel looks up samples
+        ds = ds.copy(deep=False)
+        ds.init_origids('samples')
+        ckernel = CachedKernel(kernel=kernel)
+        if __debug__:
+            debug('REPM', "Precomputing kernel %s of %s on %s",
+                  (kernel, learner, ds))
+        ckernel.compute(ds)
+        learner.params.kernel = ckernel
+        try:
+            return self._call_repeatedly(ds)
+        finally:
+            learner.params.kernel = kernel
+
+
+    def _call_repeatedly(self, ds):
         # local binding
         generator = self._generator
         node = self._node
@@ -324,17 +415,10 @@ class RepeatedMeasure(Measure):
 
         # run the node an all generated datasets
         results = []
-        for i, sds in enumerate(generator.generate(ds)
-                                if generator
-                                else [ds]):
-            if __debug__:
-                debug('REPM', "%d-th iteration of %s on %s",
-                      (i, self, sds))
+        for i, (sds, result) in enumerate(self._iter_repetitions(ds)):
             if ca.is_enabled("datasets"):
                 # store dataset in ca
                 ca.datasets.append(sds)
-            # run the beast
-            result = node(sds)
             # callback
             if self._callback is not None:
                 self._callback(data=sds, node=node, result=result)
@@ -372,6 +456,76 @@ class RepeatedMeasure(Measure):
         return results
 
 
+    def _iter_repetitions(self, ds):
+        """Run the node on all generated datasets
+
+        Yields each generated dataset along with the result of the node on
+        it.  Whenever a result is yielded, the node's conditional
+        attributes are those of the corresponding run.
+        """
+        node = self._node
+        sdss = self._generator.generate(ds) if self._generator else [ds]
+        nproc = self._nproc
+        if nproc is None:
+            import pprocess
+            nproc = pprocess.get_number_of_cores() or 1
+        if nproc > 1:
+            sdss = list(sdss)
+            nproc = min(nproc, len(sdss))
+        if nproc <= 1:
+            for i, sds in enumerate(sdss):
+                if __debug__:
+                    debug('REPM', "%d-th iteration of %s on %s",
+                          (i, self, sds))
+                # run the beast
+                yield sds, node(sds)
+            return
+
+        import pprocess
+        if __debug__:
+            debug('REPM', "Starting off %i child processes for %i "
+                  "iterations of %s", (nproc, len(sdss), self))
+        # Map keeps the results in the order of the datasets
+        p_results = pprocess.Map(limit=nproc)
+        compute = p_results.manage(
+            pprocess.MakeParallel(self._proc_repetition_file))
+        for i, sds in enumerate(sdss[:-1]):
+            # children are forked, so they get the datasets without copying
+            compute(i, sds, seed=mvpa2.get_random_seed())
+        # the last one runs here while the children are busy, so the node
+        # is left in the same state as after running in a single process
+        if __debug__:
+            debug('REPM', "%d-th iteration of %s on %s",
+                  (len(sdss) - 1, self, sdss[-1]))
+        last_result = node(sdss[-1])
+        last_ca = dict((k, node.ca[k].value) for k in node.ca.which_set())
+        runs = chain(imap(load_from_tempfile, p_results),
+                     [(last_result, last_ca)])
+        for sds, (result, node_ca) in izip(sdss, runs):
+            # expose conditional attributes of the run
+            node.ca.reset()
+            for k, v in node_ca.iteritems():
+                node.ca[k].value = v
+            yield sds, result
+
+
+    def _proc_repetition_file(self, i, ds, seed=None):
+        """Run the node in a child process and store results into a file
+
+        Transfer of large results through pprocess' channels is very slow,
+        so only the name of the temporary file is sent back.
+        """
+        if seed is not None:
+            # do not let all the children reuse the same RNG state
+            mvpa2.seed(seed)
+        if __debug__:
+            debug('REPM', "%d-th iteration of %s on %s", (i, self, ds))
+        node = self._node
+        result = node(ds)
+        node_ca = dict((k, node.ca[k].value) for k in node.ca.which_set())
+        return dump_to_tempfile((result, node_ca), prefix='tmprepm')
+
+
     def _repetition_postcall(self, ds, node, result):
         """Post-processing handler for each repetition.
 
@@ -404,6 +558,8 @@ class RepeatedMeasure(Measure):
     generator = property(fget=lambda self: self._generator)
     callback = property(fget=lambda self: self._callback)
     concat_as = property(fget=lambda self: self._concat_as)
+    cache_kernel = property(fget=lambda self: self._cache_kernel)
+    nproc = property(fget=lambda self: self._nproc)
 
 
 class CrossValidation(RepeatedMeasure):
@@ -89,14 +89,9 @@ class GNBSearchlight(SimpleStatBaseSearchlight):
         pl.nsamples = np.zeros(shape[:1] + (1,)*(len(shape)-1))
 
 
-    def _sl_call_on_a_split(self,
-                            split, X,
-                            training_sis, testing_sis,
-                            nroi_fids, roi_fids,
-                            indexsum_fx,
-                            labels_numeric,
-                            ):
-        """Call to GNBSearchlight
+    def _get_split_terms(self, split, X, training_sis, testing_sis,
+                         labels_numeric):
+        """Per-feature log-probabilities of testing samples for GNBSearchlight
         """
         # Local bindings
         gnb = self.gnb
@@ -149,24 +144,18 @@ class GNBSearchlight(SimpleStatBaseSearchlight):
         ## First we need to reshape to get class x samples x features
         lprob_csf = lprob_csfs.reshape(lprob_csfs.shape[:2] + (-1,))
 
-        ## Now we come to naive part which requires looping
-        ## through all spheres
-        if __debug__:
-            debug('SLC', "  Doing 'Searchlight'")
-        # resultant logprobs for each class x sample x roi
-        lprob_cs_sl = np.zeros(lprob_csfs.shape[:2] + (nroi_fids,))
-        indexsum_fx(lprob_csf, roi_fids, out=lprob_cs_sl)
-
-        lprob_cs_sl += logpriors
-        lprob_cs_cp_sl = lprob_cs_sl
-        # for each of the ROIs take the class with maximal (log)probability
-        predictions = lprob_cs_cp_sl.argmax(axis=0)
-        # no need to map back [self.ulabels[c] for c in winners]
-        #predictions = winners
-
         targets = labels_numeric[testing_sis]
 
-        return targets, predictions
+        def finalize(lprob_cs_sl):
+            """Given logprobs for each class x sample x roi"""
+            lprob_cs_sl += logpriors
+            # for each of the ROIs take the class with maximal (log)probability
+            predictions = lprob_cs_sl.argmax(axis=0)
+            # no need to map back [self.ulabels[c] for c in winners]
+            return targets, predictions
+
+        # the naive part -- summing within all spheres -- is up to the caller
+        return lprob_csf, finalize
 
     gnb = property(fget=lambda self: self._gnb)
 
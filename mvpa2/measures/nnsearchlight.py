@@ -94,19 +94,10 @@ class M1NNSearchlight(SimpleStatBaseSearchlight):
             pl.nsamples = np.zeros(shape[:1] + (1,)*(len(shape)-1))
 
 
-    def _sl_call_on_a_split(self,
-                            split, X,
-                            training_sis, testing_sis,
-                            nroi_fids, roi_fids,
-                            indexsum_fx,
-                            labels_numeric,
-                            ):
-        """Call to M1NNSearchlight
+    def _compute_split_stats(self, training_sis, testing_sis,
+                             labels_numeric):
+        """Compute per label statistics of training and testing samples
         """
-        # Local bindings
-        knn = self.knn
-        params = knn.params
-
         pl_train = self.__pl_train
         pl_test  = self.__pl_test
 
@@ -121,19 +112,55 @@ class M1NNSearchlight(SimpleStatBaseSearchlight):
         assert(len(np.unique(labels_numeric)) == nlabels)
         assert(training_non0labels == slice(None)) # not sure/tested if we can handle this one
         assert(testing_non0labels == slice(None)) # not sure/tested if we can handle this one
+        return pl_train, pl_test
+
+
+    def _get_split_terms(self, split, X, training_sis, testing_sis,
+                         labels_numeric):
+        """Per-feature squared differences between the means for M1NN
+        """
+        if self._distance != 'euclidean':
+            # correlations are not sums of per-feature terms
+            return None
+
+        pl_train, pl_test = self._compute_split_stats(
+            training_sis, testing_sis, labels_numeric)
 
         # squared distances between the means...
 
         # hm, but we need for each combination of labels
         # so we keep 0th dimension corresponding to test "samples/labels"
+        diff_pl_pl = pl_test.means[:, None] - pl_train.means[None,:]
+        diff_pl_pl2 = np.square(diff_pl_pl)
+
+        targets = np.asanyarray(self._ulabels_numeric)
+
+        def finalize(dist_pl_pl2_sl):
+            # predictions are just the labels with minimal distance
+            return targets, np.argmin(dist_pl_pl2_sl, axis=1)
+
+        return diff_pl_pl2, finalize
+
+
+    def _sl_call_on_a_split(self,
+                            split, X,
+                            training_sis, testing_sis,
+                            nroi_fids, roi_fids,
+                            indexsum_fx,
+                            labels_numeric,
+                            ):
+        """Call to M1NNSearchlight
+        """
         if self._distance == 'euclidean':
-            diff_pl_pl = pl_test.means[:, None] - pl_train.means[None,:]
-            diff_pl_pl2 = np.square(diff_pl_pl)
+            return super(M1NNSearchlight, self)._sl_call_on_a_split(
+                split, X, training_sis, testing_sis, nroi_fids, roi_fids,
+                indexsum_fx, labels_numeric)
+
+        pl_train, pl_test = self._compute_split_stats(
+            training_sis, testing_sis, labels_numeric)
+        nlabels = len(pl_train.nsamples)
 
-            # XXX OPT: is it worth may be reserving the space beforehand?
-            dist_pl_pl2_sl = np.zeros(diff_pl_pl2.shape[:-1] + (nroi_fids,))
-            indexsum_fx(diff_pl_pl2, roi_fids, out=dist_pl_pl2_sl)
-        elif self._distance == 'correlation':
+        if self._distance == 'correlation':
             roi_nfids = np.array(map(len, roi_fids))  #  # voxels in each ROI
 
             # estimate the means of each of the searchlight within each condition
@@ -0,0 +1,334 @@
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the PyMVPA package for the
+#   copyright and license terms.
+#
+### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""An efficient implementation of searchlight for RSA.
+"""
+
+__docformat__ = 'restructuredtext'
+
+from itertools import combinations
+
+import numpy as np
+
+from mvpa2.base import externals
+from mvpa2.base.dochelpers import borrowkwargs, _repr_attrs
+from mvpa2.base.constraints import EnsureChoice
+from mvpa2.datasets.base import Dataset
+from mvpa2.misc.neighborhood import IndexQueryEngine, Sphere
+from mvpa2.measures.searchlight import BaseSearchlight
+from mvpa2.measures.adhocsearchlightbase import _FUSED_TERMS_MAX_SIZE
+
+if externals.exists('scipy', raise_=True):
+    import scipy.sparse as sps
+    from scipy.special import betainc
+    from scipy.stats import rankdata
+
+if __debug__:
+    from mvpa2.base import debug
+    import time as time
+
+__all__ = [ "RSASearchlight", 'sphere_rsasearchlight' ]
+
+
+def _rankdata_columns(a):
+    """Rank values within each column, ties get their average rank
+
+    Same as applying `scipy.stats.rankdata` to every column of `a`.
+    """
+    n, ncols = a.shape
+    order = np.argsort(a, axis=0, kind='mergesort')
+    cols = np.arange(ncols)
+    sa = a[order, cols]
+    # ids of the groups of tied values, unique across columns
+    starts = np.ones(sa.shape, dtype=bool)
+    starts[1:] = sa[1:] != sa[:-1]
+    groups = np.cumsum(starts.T.ravel()).reshape(ncols, n).T - 1
+    # average (1-based) position within each group
+    positions = np.repeat(np.arange(1, n + 1, dtype=float)[:, None],
+                          ncols, axis=1)
+    ngroups = groups[-1, -1] + 1
+    avg = np.bincount(groups.ravel(), weights=positions.ravel(),
+                      minlength=ngroups) \
+          / np.bincount(groups.ravel(), minlength=ngroups)
+    ranks = np.empty(a.shape)
+    ranks[order, cols] = avg[groups]
+    return ranks
+
+
+class RSASearchlight(BaseSearchlight):
+    """Efficient implementation of a representational similarity `Searchlight`.
+
+    Provides the same results as a
+    :class:`~mvpa2.measures.searchlight.Searchlight` with a
+    :class:`~mvpa2.measures.rsa.PDist` (without a ``target_dsm``) or a
+    :class:`~mvpa2.measures.rsa.PDistTargetSimilarity` measure using
+    correlation distance.  Instead of computing dissimilarity matrices
+    for each ROI in turn, the necessary sums of products of each pair of
+    samples are computed per feature, and summed within many ROIs at
+    once via a sparse matrix product.  Correlations with the target
+    dissimilarity matrix are then computed for those ROIs together, so
+    only their correlations are kept in memory.
+
+    Results are a dataset with one feature per ROI.  Without a target the
+    samples are the pairwise correlation distances (with a ``pairs``
+    sample attribute, as for ``PDist``).  Otherwise there is one sample
+    per metric (``rho`` and, unless ``corrcoef_only``, ``p``) identified
+    by a ``metrics`` sample attribute.
+    """
+
+    # TODO: implement parallelization and then uncomment
+    __init__doc__exclude__ = ['nproc']
+
+    @borrowkwargs(BaseSearchlight, '__init__')
+    def __init__(self, queryengine, target_dsm=None, center_data=False,
+                 comparison_metric='pearson', corrcoef_only=False,
+                 **kwargs):
+        """Initialize a RSASearchlight
+
+        Parameters
+        ----------
+        target_dsm : array (length N*(N-1)/2), optional
+          Target dissimilarity matrix.  If None, dissimilarity matrices of
+          all ROIs are returned.
+        center_data : bool, optional
+          If True then center each column of the data matrix by subtracting
+          the column mean from each element.
+        comparison_metric : ('pearson', 'spearman'), optional
+          Similarity measure to be used for comparing dataset DSMs with the
+          target DSM.
+        corrcoef_only : bool, optional
+          If True, return only the correlation coefficient (rho), otherwise
+          return rho and probability, p.
+        """
+        # init base class first
+        BaseSearchlight.__init__(self, queryengine, **kwargs)
+
+        if not self.nproc in (None, 1):
+            raise NotImplementedError, "For now only nproc=1 (or None for " \
+                  "autodetection) is supported by RSASearchlight"
+
+        self._comparison_metric = \
+            EnsureChoice('pearson', 'spearman')(comparison_metric)
+        self._target_dsm = target_dsm
+        self._center_data = center_data
+        self._corrcoef_only = corrcoef_only
+
+
+    def __repr__(self, prefixes=None):
+        if prefixes is None:
+            prefixes = []
+        return super(RSASearchlight, self).__repr__(
+            prefixes=prefixes
+            + _repr_attrs(self, ['target_dsm'])
+            + _repr_attrs(self, ['center_data', 'corrcoef_only'],
+                          default=False)
+            + _repr_attrs(self, ['comparison_metric'], default='pearson')
+            )
+
+
+    def _get_dsms(self, X, roi_fids):
+        """Correlation distances of all pairs of samples within all ROIs
+
+        Parameters
+        ----------
+        X : 2D-array
+          Samples x features, standardized across all features (see
+          `_sl_call`).
+        roi_fids : sparse matrix
+          Features x ROIs, with 1s at the features of each ROI.
+
+        Returns
+        -------
+        2D-array
+          Pairs x ROIs, with pairs ordered as by ``pdist``.
+        """
+        nsamples, nfeatures = X.shape
+        nrois = roi_fids.shape[1]
+        roi_sizes = np.asarray(roi_fids.sum(axis=0)).ravel()
+        sum_fx = roi_fids.T.tocsr()
+
+        # per sample sums and sums of squares within each ROI
+        sums = np.asarray(sum_fx * X.T)
+        sums2 = np.asarray(sum_fx * (X ** 2).T)
+        variances = sums2 - sums ** 2 / roi_sizes[:, None]
+
+        # sums of products for all pairs, in blocks of pairs as the
+        # per-feature products could take a lot of memory
+        pairs_i, pairs_j = np.triu_indices(nsamples, 1)
+        npairs = len(pairs_i)
+        pairs_block = max(1, _FUSED_TERMS_MAX_SIZE // max(nfeatures, 1))
+        dsms = np.empty((npairs, nrois))
+        for start in xrange(0, npairs, pairs_block):
+            if __debug__:
+                debug('SLC', "  Summing products within ROIs for pairs "
+                      "%i-%i out of %i" % (start + 1,
+                                           min(start + pairs_block, npairs),
+                                           npairs))
+            bi = pairs_i[start:start + pairs_block]
+            bj = pairs_j[start:start + pairs_block]
+            dsms[start:start + pairs_block] = \
+                np.asarray(sum_fx * (X[bi] * X[bj]).T).T
+        # covariances -> correlations -> distances
+        dsms -= (sums[:, pairs_i] * sums[:, pairs_j] / roi_sizes[:, None]).T
+        norms = np.sqrt(variances[:, pairs_i] * variances[:, pairs_j]).T
+        norms[norms == 0] = np.nan
+        dsms /= norms
+        return 1. - dsms
+
+
+    def _compare_dsms(self, dsms):
+        """Correlate DSMs of all ROIs with the target DSM
+
+        Returns
+        -------
+        (rho, p)
+          Arrays with one value per ROI.
+        """
+        target_dsm = np.asanyarray(self._target_dsm, dtype=float)
+        if len(target_dsm) != len(dsms):
+            raise ValueError("Target DSM of length %i does not match the "
+                             "%i pairs of samples" % (len(target_dsm), len(dsms)))
+        if self._comparison_metric == 'spearman':
+            target_dsm = rankdata(target_dsm)
+            dsms = _rankdata_columns(dsms)
+        # the same what pearsonr does, just for all ROIs at once
+        tm = target_dsm - target_dsm.mean()
+        dm = dsms - dsms.mean(axis=0)
+        rho = np.dot(tm, dm) \
+              / (np.sqrt(np.sum(tm ** 2)) * np.sqrt(np.sum(dm ** 2, axis=0)))
+        rho = np.clip(rho, -1., 1.)
+        if self._corrcoef_only:
+            return rho, None
+        df = len(target_dsm) - 2
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t_squared = rho ** 2 * (df / ((1.0 - rho) * (1.0 + rho)))
+            p = betainc(0.5 * df, 0.5,
+                        np.clip(df / (df + t_squared), 0., 1.))
+        p[np.abs(rho) == 1.] = 0.
+        return rho, p
+
+
+    def _sl_call(self, dataset, roi_ids, nproc):
+        """Call to RSASearchlight
+        """
+        # Local bindings
+        qe = self.queryengine
+
+        if __debug__:
+            time_start = time.time()
+
+        X = dataset.samples
+        if len(X.shape) != 2:
+            raise ValueError(
+                  'Unlike a measure, %s (for now) operates on already '
+                  'flattened datasets' % (self.__class__.__name__))
+        X = np.asanyarray(X, dtype=float)
+        if self._center_data:
+            X = X - np.mean(X, axis=0)
+        nrois = len(roi_ids)
+
+        if __debug__:
+            debug('SLC', 'Phase 1. Deducing neighbors information for %i ROIs'
+                  % (nrois,))
+        roi_indptr, roi_indices = qe.query_byid_batch(roi_ids)
+        roi_fids = sps.csc_matrix(
+            (np.ones(len(roi_indices)), roi_indices, roi_indptr),
+            shape=(dataset.nfeatures, nrois))
+
+        if self.ca.is_enabled('roi_feature_ids'):
+            self.ca.roi_feature_ids = np.split(roi_indices, roi_indptr[1:-1])
+        if self.ca.is_enabled('roi_sizes'):
+            self.ca.roi_sizes = list(np.diff(roi_indptr))
+        if self.ca.is_enabled('roi_center_ids'):
+            self.ca.roi_center_ids = list(roi_ids)
+
+        # correlations between samples are invariant to shifting and
+        # scaling of each sample, so standardize all samples across all
+        # features once -- the sums of products become better conditioned
+        X = X - X.mean(axis=1)[:, None]
+        scale = np.sqrt((X ** 2).mean(axis=1))
+        scale[scale == 0] = 1.
+        X /= scale[:, None]
+
+        # DSMs of all ROIs could take a lot of memory, so they are computed
+        # (and compared with the target) in blocks of ROIs
+        npairs = len(X) * (len(X) - 1) // 2
+        rois_block = max(1, _FUSED_TERMS_MAX_SIZE // max(npairs, 1))
+        if self._target_dsm is None:
+            dsms = np.empty((npairs, nrois))
+        else:
+            rho = np.empty(nrois)
+            p = None if self._corrcoef_only else np.empty(nrois)
+        for start in xrange(0, nrois, rois_block):
+            block = slice(start, min(start + rois_block, nrois))
+            if __debug__:
+                debug('SLC', 'Phase 2. Computing DSMs for %i samples within '
+                      'ROIs %i-%i out of %i'
+                      % (len(X), start + 1, block.stop, nrois))
+            with np.errstate(invalid='ignore'):
+                block_dsms = self._get_dsms(X, roi_fids[:, block])
+            if self._target_dsm is None:
+                dsms[:, block] = block_dsms
+                continue
+            if __debug__:
+                debug('SLC', 'Phase 3. Comparing DSMs with the target DSM '
+                      'using %s correlation' % self._comparison_metric)
+            rho[block], block_p = self._compare_dsms(block_dsms)
+            if p is not None:
+                p[block] = block_p
+
+        if self._target_dsm is None:
+            out = Dataset(dsms, sa=dict(pairs=list(combinations(range(len(X)), 2))))
+        else:
+            if p is None:
+                out = Dataset(rho[None], sa=dict(metrics=['rho']))
+            else:
+                out = Dataset(np.vstack((rho, p)), sa=dict(metrics=['rho', 'p']))
+
+        if __debug__:
+            debug('SLC', "%s._call() is done in %.3g sec" %
+                  (self.__class__.__name__, time.time() - time_start))
+
+        out.fa['center_ids'] = roi_ids
+        return out
+
+    target_dsm = property(fget=lambda self: self._target_dsm)
+    center_data = property(fget=lambda self: self._center_data)
+    comparison_metric = property(fget=lambda self: self._comparison_metric)
+    corrcoef_only = property(fget=lambda self: self._corrcoef_only)
+
+
+@borrowkwargs(RSASearchlight, '__init__', exclude=['roi_ids', 'queryengine'])
+def sphere_rsasearchlight(target_dsm=None, radius=1, center_ids=None,
+                          space='voxel_indices', *args, **kwargs):
+    """Creates a `RSASearchlight` to compute (and compare with a target)
+    correlation distance DSMs on all possible spheres of a certain size
+    within a dataset.
+
+    Parameters
+    ----------
+    radius : float
+      All features within this radius around the center will be part
+      of a sphere.
+    center_ids : list of int
+      List of feature ids (not coordinates) the shall serve as sphere
+      centers. By default all features will be used (it is passed
+      roi_ids argument for Searchlight).
+    space : str
+      Name of a feature attribute of the input dataset that defines the spatial
+      coordinates of all features.
+    **kwargs
+      In addition this class supports all keyword arguments of
+      :class:`~mvpa2.measures.rsasearchlight.RSASearchlight`.
+    """
+    # build a matching query engine from the arguments
+    kwa = {space: Sphere(radius)}
+    qe = IndexQueryEngine(**kwa)
+    # init the searchlight with the queryengine
+    return RSASearchlight(qe, target_dsm=target_dsm,
+                          roi_ids=center_ids, *args, **kwargs)
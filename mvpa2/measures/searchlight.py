@@ -14,8 +14,11 @@ if __debug__:
     from mvpa2.base import debug
 
 import numpy as np
-import tempfile, os
+import tempfile, os, glob
+import re
 import time
+import itertools
+import hashlib
 
 import mvpa2
 from mvpa2.base import externals, warning
@@ -203,6 +206,14 @@ class Searchlight(BaseSearchlight):
     interest, which is ran at each spatial location.
     """
 
+    block_timings = ConditionalAttribute(enabled=False,
+        doc="Start and stop times (relative to the beginning of the "
+            "computation) and number of ROIs for each processed block.")
+
+    workers_utilization = ConditionalAttribute(enabled=False,
+        doc="Fraction of the total computation time each worker (i.e. one "
+            "of nproc slots) was busy processing blocks.")
+
     @staticmethod
     def _concat_results(sl=None, dataset=None, roi_ids=None, results=None):
         """The simplest implementation for collecting the results --
@@ -271,6 +282,10 @@ class Searchlight(BaseSearchlight):
                  results_fx=None,
                  tmp_prefix='tmpsl',
                  nblocks=None,
+                 dataset_backend='native',
+                 scheduling='static',
+                 checkpoint_dir=None,
+                 checkpoint_every=100,
                  **kwargs):
         """
         Parameters
@@ -288,11 +303,20 @@ class Searchlight(BaseSearchlight):
           Called with all the results computed in a block for possible
           post-processing which needs to be done in parallel instead of serial
           aggregation in results_fx.
-        results_backend : ('native', 'hdf5'), optional
+        results_backend : ('native', 'hdf5', 'memmap'), optional
           Specifies the way results are provided back from a processing block
           in case of nproc > 1. 'native' is pickling/unpickling of results by
           pprocess, while 'hdf5' would use h5save/h5load functionality.
           'hdf5' might be more time and memory efficient in some cases.
+          'memmap' streams samples of the results, as soon as they are
+          computed, into a preallocated memory-mapped temporary file (see
+          `tmp_prefix`) indexed by the position of the ROI center in
+          `roi_ids`, and the resultant dataset simply wraps that storage.
+          It requires the results of all ROIs to be of the same shape and
+          non-object dtype.  `results_fx` receives results without samples
+          (nsamples == 0), the samples are assigned afterwards.  'memmap' is
+          available only on POSIX systems, since the temporary file gets
+          removed while the resultant dataset still maps it.
         results_fx : callable, optional
           Function to process/combine results of each searchlight
           block run.  By default it would simply append them all into
@@ -301,11 +325,40 @@ class Searchlight(BaseSearchlight):
           care of assigning roi_* ca's
         tmp_prefix : str, optional
           If specified -- serves as a prefix for temporary files storage
-          if results_backend == 'hdf5'.  Thus can specify the directory to use
+          if results_backend is 'hdf5' or 'memmap', or dataset_backend is
+          'memmap'.  Thus can specify the directory to use
           (trailing file path separator is not added automagically).
         nblocks : None or int
           Into how many blocks to split the computation (could be larger than
           nproc).  If None -- nproc is used.
+        dataset_backend : ('native', 'memmap'), optional
+          Specifies the way the dataset is provided to processing blocks
+          in case of nproc > 1.  'native' hands the dataset as is to the
+          child processes, while 'memmap' places samples and feature
+          attributes once into memory-mapped temporary files (see
+          `tmp_prefix`), so all children share the same (file-backed)
+          pages regardless of nproc.  Object feature attributes are
+          provided as is.
+        scheduling : ('static', 'dynamic'), optional
+          How to split ROIs into blocks in case of nproc > 1.  'static'
+          splits `roi_ids` into `nblocks` consecutive blocks of equal
+          number of ROIs.  'dynamic' orders ROIs by their estimated cost
+          (size of the ROI as reported by the query engine) and splits them
+          into `nblocks` (by default 10 times nproc) smaller blocks, so the
+          most expensive ones get dispatched first while the remaining
+          cheap ones keep all the processes busy until the end.
+        checkpoint_dir : None or str, optional
+          If specified, results of the ROIs get persisted (using h5save)
+          into this directory as they are computed.  Running the same
+          searchlight on the same dataset again with the same
+          `checkpoint_dir` (e.g. after the computation got interrupted)
+          would skip ROIs which already have their results stored.  Running
+          a different measure, query engine or dataset with the same
+          `checkpoint_dir` raises ValueError.
+        checkpoint_every : int, optional
+          Number of ROIs within a processing block after computing which
+          their results get persisted into `checkpoint_dir`.  Results get
+          persisted at the end of each block regardless.
         **kwargs
           In addition this class supports all keyword arguments of its
           base-class :class:`~mvpa2.measures.searchlight.BaseSearchlight`.
@@ -317,10 +370,31 @@ class Searchlight(BaseSearchlight):
         if self.results_backend == 'hdf5':
             # Assure having hdf5
             externals.exists('h5py', raise_=True)
+        elif not self.results_backend in ('native', 'memmap'):
+            raise ValueError("Unknown results_backend %r. Known are 'native', "
+                             "'hdf5' and 'memmap'" % results_backend)
+        elif self.results_backend == 'memmap' and os.name != 'posix':
+            # the storage file is removed right away while the results still
+            # map it, which is not possible elsewhere
+            raise ValueError("results_backend='memmap' is supported only on "
+                             "POSIX systems")
         self.results_fx = Searchlight._concat_results \
                           if results_fx is None else results_fx
         self.tmp_prefix = tmp_prefix
         self.nblocks = nblocks
+        self.__results_sink = None
+        if checkpoint_dir is not None:
+            externals.exists('h5py', raise_=True)
+        self.checkpoint_dir = checkpoint_dir
+        self.checkpoint_every = checkpoint_every
+        self.dataset_backend = dataset_backend.lower()
+        if not self.dataset_backend in ('native', 'memmap'):
+            raise ValueError("Unknown dataset_backend %r. Known are 'native' "
+                             "and 'memmap'" % dataset_backend)
+        self.scheduling = scheduling.lower()
+        if not self.scheduling in ('static', 'dynamic'):
+            raise ValueError("Unknown scheduling %r. Known are 'static' "
+                             "and 'dynamic'" % scheduling)
         if isinstance(add_center_fa, str):
             self.__add_center_fa = add_center_fa
         elif add_center_fa:
@@ -338,20 +412,120 @@ class Searchlight(BaseSearchlight):
             + _repr_attrs(self, ['results_postproc_fx'])
             + _repr_attrs(self, ['results_backend'], default='native')
             + _repr_attrs(self, ['results_fx', 'nblocks'])
+            + _repr_attrs(self, ['dataset_backend'], default='native')
+            + _repr_attrs(self, ['scheduling'], default='static')
+            + _repr_attrs(self, ['checkpoint_dir'])
+            + _repr_attrs(self, ['checkpoint_every'], default=100)
             )
 
 
     def _sl_call(self, dataset, roi_ids, nproc):
         """Classical generic searchlight implementation
         """
-        assert(self.results_backend in ('native', 'hdf5'))
-        # compute
-        if nproc is not None and nproc > 1:
-            # split all target ROIs centers into `nproc` equally sized blocks
+        assert(self.results_backend in ('native', 'hdf5', 'memmap'))
+        # files to be removed whenever all the results are collected
+        tmp_files = []
+        self.__block_timings = []
+        self.__start_time = time.time()
+        try:
+            results, nproc_needed = self.__compute(dataset, roi_ids, nproc,
+                                                   tmp_files)
+            # Finally collect and possibly process results.
+            # In case of pprocess.Map it allows to process results as they
+            # become available
+            result_ds = self.results_fx(sl=self,
+                                        dataset=dataset,
+                                        roi_ids=roi_ids,
+                                        results=results)
+            if self.results_backend == 'memmap':
+                result_ds = self.__results_sink.wrap(result_ds)
+        finally:
+            # results storage remains available through the mapping (POSIX
+            # only, see __init__)
+            self.__results_sink = None
+            for f in tmp_files:
+                if __debug__:
+                    debug('SLC_', "Removing %s" % f)
+                os.unlink(f)
+
+        self.__charge_timings(nproc_needed)
+
+        # Assure having a dataset (for paranoid ones)
+        if not is_datasetlike(result_ds):
+            try:
+                result_a = np.atleast_1d(result_ds)
+            except ValueError, e:
+                if 'setting an array element with a sequence' in str(e):
+                    # try forcing object array.  Happens with
+                    # test_custom_results_fx_logic on numpy 1.4.1 on Debian
+                    # squeeze
+                    result_a = np.array(result_ds, dtype=object)
+                else:
+                    raise
+            result_ds = Dataset(result_a)
+
+        return result_ds
+
+
+    def __compute(self, dataset, roi_ids, nproc, tmp_files):
+        """Dispatch computation of all ROIs into processing blocks
+
+        Returns
+        -------
+        generator, int
+          Generator of the results for each block, and number of processes
+          used.
+        """
+        all_roi_ids = roi_ids
+        # results (and their ROIs) obtained before the ROIs get dispatched
+        # into blocks
+        pre_ids, pre_results = [], []
+        if self.checkpoint_dir is not None:
+            pre_ids, restored = self.__restore_checkpoints(dataset, roi_ids)
+            if len(pre_ids):
+                if self.results_postproc_fx:
+                    restored = self.results_postproc_fx(restored)
+                pre_results = [restored]
+                pre_ids_set = set(pre_ids)
+                roi_ids = [r for r in roi_ids if not r in pre_ids_set]
+        if self.results_backend == 'memmap':
+            if not len(pre_ids):
+                # compute the first ROI to figure out the layout of the
+                # results storage and let all subsequent blocks write into it
+                probe = self._proc_block_timed(roi_ids[:1], dataset,
+                                               self.__datameasure)
+                self.__block_timings.append(probe[1])
+                pre_ids, pre_results = list(roi_ids[:1]), [probe[0]]
+                roi_ids = roi_ids[1:]
+            sink = _MemmapResultsSink(
+                tempfile.mktemp(prefix=self.tmp_prefix, suffix='-results.dat'),
+                pre_results[0], all_roi_ids)
+            tmp_files.append(sink.filename)
+            pre_results = [sink.store(pre_ids, pre_results[0])]
+            self.__results_sink = sink
+
+        # ids of the ROIs in the order they get dispatched
+        dispatched_ids = roi_ids
+
+        if not len(roi_ids):
+            nproc_needed = 1
+            p_results = []
+        elif nproc is not None and nproc > 1:
             nproc_needed = min(len(roi_ids), nproc)
-            nblocks = nproc_needed \
-                      if self.nblocks is None else self.nblocks
-            roi_blocks = np.array_split(roi_ids, nblocks)
+            if self.scheduling == 'dynamic':
+                # split all target ROIs centers, sorted by decreasing cost,
+                # into smaller blocks to be dispatched in that order
+                nblocks = min(len(roi_ids), nproc_needed * 10) \
+                          if self.nblocks is None else self.nblocks
+                dispatched_ids = np.asanyarray(roi_ids)[
+                                    self._get_roi_order(roi_ids)]
+                roi_blocks = np.array_split(dispatched_ids, nblocks)
+            else:
+                # split all target ROIs centers into `nproc` equally sized
+                # blocks
+                nblocks = nproc_needed \
+                          if self.nblocks is None else self.nblocks
+                roi_blocks = np.array_split(roi_ids, nblocks)
 
             # the next block sets up the infrastructure for parallel computing
             # this can easily be changed into a ParallelPython loop, if we
@@ -361,43 +535,54 @@ class Searchlight(BaseSearchlight):
             if __debug__:
                 debug('SLC', "Starting off %s child processes for nblocks=%i"
                       % (nproc_needed, nblocks))
+            if self.dataset_backend == 'memmap':
+                # place the data once into files, so all the children would
+                # share the same pages instead of duplicating them
+                proc_ds, ds_files = _memmap_dataset(dataset, self.tmp_prefix)
+                tmp_files.extend(ds_files)
+            else:
+                proc_ds = dataset
             compute = p_results.manage(
-                        pprocess.MakeParallel(self._proc_block))
+                        pprocess.MakeParallel(self._proc_block_timed))
             for iblock, block in enumerate(roi_blocks):
                 # should we maybe deepcopy the measure to have a unique and
                 # independent one per process?
                 seed = mvpa2.get_random_seed()
-                compute(block, dataset, copy.copy(self.__datameasure),
+                compute(block, proc_ds, copy.copy(self.__datameasure),
                         seed=seed, iblock=iblock)
         else:
             # otherwise collect the results in an 1-item list
+            nproc_needed = 1
             p_results = [
-                    self._proc_block(roi_ids, dataset, self.__datameasure)]
-
-        # Finally collect and possibly process results
-        # p_results here is either a generator from pprocess.Map or a list.
-        # In case of a generator it allows to process results as they become
-        # available
-        result_ds = self.results_fx(sl=self,
-                                    dataset=dataset,
-                                    roi_ids=roi_ids,
-                                    results=self.__handle_all_results(p_results))
+                    self._proc_block_timed(roi_ids, dataset,
+                                           self.__datameasure)]
+
+        # p_results here is either a pprocess.Map or a list
+        results = self.__handle_all_results(p_results)
+        if len(pre_results):
+            results = itertools.chain(pre_results, results)
+        stream_ids = list(pre_ids) + list(dispatched_ids)
+        if not np.array_equal(stream_ids, all_roi_ids):
+            positions = dict((r, i) for i, r in enumerate(all_roi_ids))
+            results = self.__reorder_results(
+                results, [positions[r] for r in stream_ids])
+        return results, nproc_needed
+
+
+    def _get_roi_order(self, roi_ids):
+        """Order of ROIs by decreasing estimated cost (i.e. ROI size)
+        """
+        indptr, _ = self._queryengine.query_byid_batch(roi_ids)
+        # stable sort to retain original order among equally sized ROIs
+        return np.argsort(-np.diff(indptr), kind='mergesort')
 
-        # Assure having a dataset (for paranoid ones)
-        if not is_datasetlike(result_ds):
-            try:
-                result_a = np.atleast_1d(result_ds)
-            except ValueError, e:
-                if 'setting an array element with a sequence' in str(e):
-                    # try forcing object array.  Happens with
-                    # test_custom_results_fx_logic on numpy 1.4.1 on Debian
-                    # squeeze
-                    result_a = np.array(result_ds, dtype=object)
-                else:
-                    raise
-            result_ds = Dataset(result_a)
 
-        return result_ds
+    def _proc_block_timed(self, block, *args, **kwargs):
+        """Run `_proc_block` and provide its results along with its timing
+        """
+        start = time.time()
+        results = self._proc_block(block, *args, **kwargs)
+        return results, (start, time.time(), len(block))
 
 
     def _proc_block(self, block, ds, measure, seed=None, iblock='main'):
@@ -429,11 +614,14 @@ class Searchlight(BaseSearchlight):
 
         assure_dataset = any([store_roi_feature_ids,
                               store_roi_sizes,
-                              store_roi_center_ids])
+                              store_roi_center_ids,
+                              self.results_backend == 'memmap'])
 
         # put rois around all features in the dataset and compute the
         # measure within them
         bar = ProgressBar()
+        # number of results already persisted into checkpoint_dir
+        nstored = 0
 
         for i, f in enumerate(block):
             # retrieve the feature ids of all features in the ROI from the query
@@ -482,6 +670,11 @@ class Searchlight(BaseSearchlight):
                 res.a['roi_center_ids'] = f
             results.append(res)
 
+            if self.checkpoint_dir is not None \
+                   and len(results) - nstored >= self.checkpoint_every:
+                self.__checkpoint(block[nstored:i + 1], results[nstored:])
+                nstored = len(results)
+
             if __debug__:
                 msg = 'ROI %i (%i/%i), %i features' % \
                             (f + 1, i + 1, len(block), roi.nfeatures)
@@ -491,6 +684,9 @@ class Searchlight(BaseSearchlight):
             # just to get to new line
             debug('SLC', '')
 
+        if self.checkpoint_dir is not None and len(results) > nstored:
+            self.__checkpoint(block[nstored:], results[nstored:])
+
         if self.results_postproc_fx:
             if __debug__:
                 debug('SLC', "Post-processing %d results in proc_block using %s"
@@ -508,6 +704,10 @@ class Searchlight(BaseSearchlight):
             if __debug__:
                 debug('SLC_', "Results stored")
             results = results_file
+        elif self.results_backend == 'memmap':
+            # no sink yet while computing the first ROI
+            if self.__results_sink is not None:
+                results = self.__results_sink.store(block, results)
         else:
             raise RuntimeError("Must not reach this point")
         return results
@@ -537,15 +737,249 @@ class Searchlight(BaseSearchlight):
         """Helper generator to decorate passing the results out to
         results_fx
         """
-        for r in results:
+        for r, timing in results:
+            self.__block_timings.append(timing)
             yield self.__handle_results(r)
 
+    def __reorder_results(self, results, roi_order):
+        """Helper generator to pass results out in the original ROIs order
+
+        Since blocks were dispatched in the order of the ROIs cost, or some
+        results were restored from checkpoints, all the results need to be
+        collected first.
+        """
+        results = sum(results, [])
+        if len(results) != len(roi_order):
+            raise RuntimeError(
+                "Got %d results for %d ROIs. With scheduling='dynamic' or "
+                "resumed checkpoints results_postproc_fx must retain a result "
+                "per each ROI"
+                % (len(results), len(roi_order)))
+        ordered = [None] * len(results)
+        for i, r in zip(roi_order, results):
+            ordered[i] = r
+        yield ordered
+
+    def __get_checkpoint_signature(self, dataset):
+        """Digest of the measure, query engine and dataset
+        """
+        def _strip_ids(r):
+            # addresses of the objects differ between the runs
+            return re.sub(' at 0x[0-9a-fA-F]+', '', r)
+
+        def _update_array(h, a):
+            a = np.asanyarray(a)
+            h.update(str(a.shape) + str(a.dtype))
+            if a.dtype == object:
+                h.update(repr(a.tolist()))
+            else:
+                h.update(np.ascontiguousarray(a).tostring())
+
+        h = hashlib.md5()
+        h.update(_strip_ids(repr(self.__datameasure)))
+        h.update(_strip_ids(repr(self._queryengine)))
+        _update_array(h, dataset.samples)
+        for col in (dataset.sa, dataset.fa):
+            for k in sorted(col.keys()):
+                h.update(k)
+                _update_array(h, col[k].value)
+        return h.hexdigest()
+
+    def __restore_checkpoints(self, dataset, roi_ids):
+        """Load results for ROIs from checkpoint_dir
+
+        Verifies (or records) the signature of the computation first.
+
+        Returns
+        -------
+        list, list
+          ROI ids (in the order of `roi_ids`) which had results stored, and
+          their results.
+        """
+        signature = self.__get_checkpoint_signature(dataset)
+        signature_file = os.path.join(self.checkpoint_dir, 'signature')
+        if os.path.exists(signature_file):
+            stored_signature = open(signature_file).read().strip()
+            if stored_signature != signature:
+                raise ValueError(
+                    "Checkpoint directory %s contains results of a different "
+                    "measure, query engine or dataset. Specify another "
+                    "checkpoint_dir" % self.checkpoint_dir)
+        else:
+            if not os.path.exists(self.checkpoint_dir):
+                os.makedirs(self.checkpoint_dir)
+            open(signature_file, 'w').write(signature + '\n')
+
+        stored = {}
+        for f in sorted(glob.glob(os.path.join(self.checkpoint_dir,
+                                               'roi*.hdf5'))):
+            checkpoint = h5load(f)
+            for roi_id, res in zip(checkpoint['roi_ids'],
+                                   checkpoint['results']):
+                stored[roi_id] = res
+        ids = [r for r in roi_ids if r in stored]
+        if __debug__:
+            debug('SLC', "Restored results for %d out of %d ROIs from %s"
+                  % (len(ids), len(roi_ids), self.checkpoint_dir))
+        return ids, [stored[r] for r in ids]
+
+    def __checkpoint(self, roi_ids, results):
+        """Persist results for ROIs into checkpoint_dir
+        """
+        filename = os.path.join(self.checkpoint_dir, 'roi%s-%d.hdf5'
+                                % (roi_ids[0], len(roi_ids)))
+        if __debug__:
+            debug('SLC_', "Storing results for %d ROIs into %s"
+                  % (len(roi_ids), filename))
+        # store under a temporary name first, so an interruption would
+        # not leave a partial checkpoint behind
+        h5save(filename + '.partial',
+               {'roi_ids': np.asarray(roi_ids), 'results': results})
+        os.rename(filename + '.partial', filename)
+
+    def __charge_timings(self, nworkers):
+        """Assign ca's describing how busy the workers were
+        """
+        ca = self.ca
+        if not (ca.is_enabled('block_timings')
+                or ca.is_enabled('workers_utilization')):
+            return
+        timings = np.array(self.__block_timings, dtype=float).reshape(-1, 3)
+        timings[:, :2] -= self.__start_time
+        ca.block_timings = timings
+        # assign blocks to the workers in the order they were started:
+        # a block occupies the worker which was freed up first
+        busy = np.zeros(nworkers)
+        freed = np.zeros(nworkers)
+        for start, stop, _ in timings[np.argsort(timings[:, 0])]:
+            iworker = np.argmin(freed)
+            freed[iworker] = stop
+            busy[iworker] += stop - start
+        total = time.time() - self.__start_time
+        ca.workers_utilization = busy / total if total > 0 else busy
+
 
     datameasure = property(fget=lambda self: self.__datameasure,
                            fset=__set_datameasure)
     add_center_fa = property(fget=lambda self: self.__add_center_fa)
 
 
+class _MemmapResultsSink(object):
+    """Preallocated memory-mapped storage for per-ROI searchlight results
+
+    Samples of the result for each ROI are stored into the columns
+    corresponding to the position of its center within `roi_ids`, so blocks
+    could write their results independently of each other.  Since
+    processing blocks are forked, they all write into the same mapping.
+    """
+
+    def __init__(self, filename, probe, roi_ids):
+        """
+        Parameters
+        ----------
+        filename : str
+          File to store the results into.
+        probe : list of Dataset
+          Results for the first ROI, which define shape and dtype of the
+          results for all ROIs.
+        roi_ids : list of int
+          Centers of all ROIs.
+        """
+        probe = probe[0]
+        if probe.samples.dtype == object:
+            raise ValueError("Results of object dtype cannot be stored with "
+                             "results_backend='memmap'")
+        self.filename = filename
+        self._shape = probe.shape
+        self._positions = dict((r, i) for i, r in enumerate(roi_ids))
+        self._sa = probe.sa.copy(deep=True)
+        if __debug__:
+            debug('SLC', "Allocating results storage for %d ROIs in %s"
+                  % (len(roi_ids), filename))
+        self._storage = np.memmap(
+                filename, dtype=probe.samples.dtype, mode='w+',
+                shape=(self._shape[0], len(roi_ids) * self._shape[1]))
+
+    def store(self, block, results):
+        """Store samples of the results for ROIs in the `block`
+
+        Returns
+        -------
+        list of Dataset
+          Results without samples.
+        """
+        if len(results) != len(block):
+            raise ValueError(
+                "Got %d results for %d ROIs. With results_backend='memmap' "
+                "there must be a result per each ROI"
+                % (len(results), len(block)))
+        nf = self._shape[1]
+        stripped = []
+        for roi_id, res in zip(block, results):
+            if res.shape != self._shape:
+                raise ValueError(
+                    "Results for ROI %s are of shape %s, whenever "
+                    "results_backend='memmap' requires all of them to be of "
+                    "shape %s" % (roi_id, res.shape, self._shape))
+            i = self._positions[roi_id] * nf
+            self._storage[:, i:i + nf] = res.samples
+            stripped.append(res.__class__(
+                    np.empty((0, nf), dtype=self._storage.dtype),
+                    fa=res.fa, a=res.a))
+        self._storage.flush()
+        return stripped
+
+    def wrap(self, ds):
+        """Provide a dataset with the stored samples for the stripped `ds`
+        """
+        if not is_datasetlike(ds) or ds.shape != (0, self._storage.shape[1]):
+            # custom results_fx made something else out of it
+            return ds
+        return ds.__class__(self._storage, sa=self._sa, fa=ds.fa, a=ds.a)
+
+
+def _memmap_dataset(ds, prefix):
+    """Provide a shallow copy of a dataset with data in memory-mapped files
+
+    Samples and feature attributes are stored into temporary files and
+    mapped back in copy-on-write mode, so any in-place modification within
+    a measure would not propagate into the files or other processes.
+    Object arrays cannot be memory-mapped and are left as is.
+
+    Returns
+    -------
+    Dataset, list of str
+      The copy of the dataset and filenames of the created files, which
+      the caller is responsible to remove.
+    """
+    filenames = []
+
+    def _memmap(a, suffix):
+        a = np.asanyarray(a)
+        if a.dtype == object or not a.size:
+            return a
+        filename = tempfile.mktemp(prefix=prefix, suffix=suffix)
+        filenames.append(filename)
+        mm = np.memmap(filename, dtype=a.dtype, mode='w+', shape=a.shape)
+        mm[...] = a
+        mm.flush()
+        del mm
+        return np.memmap(filename, dtype=a.dtype, mode='c', shape=a.shape)
+
+    mds = ds.copy(deep=False)
+    try:
+        mds.samples = _memmap(ds.samples, '-samples.dat')
+        for k in ds.fa.keys():
+            mds.fa[k] = _memmap(ds.fa[k].value, '-fa_%s.dat' % k)
+    except:
+        for f in filenames:
+            os.unlink(f)
+        raise
+    if __debug__:
+        debug('SLC', "Memory-mapped dataset into %d files" % len(filenames))
+    return mds, filenames
+
+
 @borrowkwargs(Searchlight, '__init__', exclude=['roi_ids', 'queryengine'])
 def sphere_searchlight(datameasure, radius=1, center_ids=None,
                        space='voxel_indices', **kwargs):
@@ -11,10 +11,14 @@
 import numpy as np
 from numpy import array
 import sys
+import os
+import re
 import itertools
+import hashlib
+import cPickle
 
-from mvpa2.base import warning
-from mvpa2.base.types import is_sequence_type
+from mvpa2.base import warning, externals
+from mvpa2.base.types import is_sequence_type, is_datasetlike
 from mvpa2.base.dochelpers import borrowkwargs, borrowdoc, _repr_attrs, _repr
 from mvpa2.clfs.distance import cartesian_distance
 
@@ -23,6 +27,24 @@ from mvpa2.misc.support import idhash as idhash_
 if __debug__:
     from mvpa2.base import debug
 
+
+def _neighbors_to_csr(neighbors):
+    """Convert a sequence of neighborhoods into compressed sparse row format
+
+    Returns
+    -------
+    indptr, indices : ndarray
+      Neighbors of i-th neighborhood are ``indices[indptr[i]:indptr[i+1]]``.
+    """
+    indptr = np.zeros(len(neighbors) + 1, dtype=int)
+    indptr[1:] = np.cumsum([len(n) for n in neighbors])
+    if indptr[-1]:
+        indices = np.hstack(neighbors).astype(int)
+    else:
+        indices = np.zeros(0, dtype=int)
+    return indptr, indices
+
+
 class IdentityNeighborhood(object):
     """Trivial neighborhood.
 
@@ -169,6 +191,88 @@ class Sphere(object):
                       <= self._radius])
 
 
+    def _assure_increments(self, ndim):
+        """Compute increments for a given dimensionality unless cached
+        """
+        if self._increments is None  or self._increments_ndim != ndim:
+            if __debug__:
+                debug('NBH',
+                      "Recomputing neighborhood increments for %dD Sphere"
+                      % ndim)
+            self._increments = self._get_increments(ndim)
+            self._increments_ndim = ndim
+
+
+    def query_volume(self, coordinates, volume, sort=True, chunk_size=2**20):
+        """Look up neighborhoods of many coordinates within a volume at once
+
+        Instead of generating coordinates of each neighborhood separately,
+        increments of the sphere are added to all coordinates in a
+        vectorized fashion, and the resultant coordinates are looked up in
+        the `volume`.
+
+        Parameters
+        ----------
+        coordinates : ndarray
+          Integer coordinates (ncoordinates x ndim) of the centers, or a 1D
+          array of scalar coordinates, all within the extent of `volume`.
+        volume : ndarray
+          ndim-dimensional array with non-negative ids (e.g. feature ids) for
+          known coordinates and negative values everywhere else.
+        sort : bool, optional
+          Either to sort ids within each neighborhood.  Otherwise they are
+          in the order of the increments.
+        chunk_size : int, optional
+          Maximal number of candidate coordinates to consider at once, which
+          bounds the memory footprint.
+
+        Returns
+        -------
+        indptr, indices : ndarray
+          Compressed sparse row representation of the neighborhoods: ids of
+          the neighbors of ``coordinates[i]`` are
+          ``indices[indptr[i]:indptr[i+1]]``.
+        """
+        coordinates = np.asanyarray(coordinates)
+        if coordinates.ndim == 1:
+            coordinates = coordinates[:, None]
+        if coordinates.dtype.char not in np.typecodes['AllInteger']:
+            raise ValueError("Sphere must be queried with integer coordinates, "
+                             "you gave %s" % coordinates.dtype)
+        ncoords, ndim = coordinates.shape
+        if volume.ndim != ndim:
+            raise ValueError("Dimensionality mismatch: coordinates are %iD "
+                             "while volume is %iD" % (ndim, volume.ndim))
+        self._assure_increments(ndim)
+        increments = self._increments
+        if not len(increments):
+            return np.zeros(ncoords + 1, dtype=int), np.zeros(0, dtype=int)
+
+        extent = np.array(volume.shape)
+        step = max(1, chunk_size // len(increments))
+        counts, indices = [], []
+        for start in xrange(0, ncoords, step):
+            candidates = coordinates[start:start + step, None, :] + increments
+            inside = np.all((candidates >= 0) & (candidates < extent), axis=-1)
+            # point outside candidates to the origin to look them up safely
+            candidates[~inside] = 0
+            ids = volume[tuple(np.rollaxis(candidates, -1))]
+            ids[~inside] = -1
+            if sort:
+                # unknown ones (negative) go first and get filtered out below
+                ids.sort(axis=1)
+            known = ids >= 0
+            counts.append(known.sum(axis=1))
+            indices.append(ids[known])
+        indptr = np.zeros(ncoords + 1, dtype=int)
+        if ncoords:
+            indptr[1:] = np.cumsum(np.hstack(counts))
+            indices = np.hstack(indices).astype(int)
+        else:
+            indices = np.zeros(0, dtype=int)
+        return indptr, indices
+
+
     def train(self, dataset):
         # XXX YOH:  yeap -- BUT if you care about my note above on extracting
         #     somehow sizes -- some dataset.a might come handy may be?
@@ -204,13 +308,7 @@ class Sphere(object):
             coordinate = coordinate[None]
         # XXX This might go into _train ...
         ndim = len(coordinate)
-        if self._increments is None  or self._increments_ndim != ndim:
-            if __debug__:
-                debug('NBH',
-                      "Recomputing neighborhood increments for %dD Sphere"
-                      % ndim)
-            self._increments = self._get_increments(ndim)
-            self._increments_ndim = ndim
+        self._assure_increments(ndim)
 
         if __debug__:
             if coordinate.dtype.char not in np.typecodes['AllInteger']:
@@ -368,6 +466,28 @@ class QueryEngineInterface(object):
         """
         raise NotImplementedError
 
+
+    def query_byid_batch(self, fids):
+        """Return feature ids of neighbors for a sequence of feature ids
+
+        Generic implementation simply queries each feature id in turn,
+        derived classes might provide more efficient implementations.
+
+        Returns
+        -------
+        indptr, indices : ndarray
+          Compressed sparse row representation of the neighborhoods: feature
+          ids of the neighbors of ``fids[i]`` are
+          ``indices[indptr[i]:indptr[i+1]]``.
+        """
+        neighbors = []
+        for fid in fids:
+            roi = self.query_byid(fid)
+            if is_datasetlike(roi):
+                roi = roi.samples[0]
+            neighbors.append(roi)
+        return _neighbors_to_csr(neighbors)
+
     #
     # aliases
     #
@@ -473,6 +593,10 @@ class IndexQueryEngine(QueryEngine):
         """Actual searcharray"""
         self.sorted = sorted
         """Either to sort the query results"""
+        self._volume = None
+        """Dense lookup volume of feature ids for batch queries"""
+        self._volume_origin = None
+        """Coordinate corresponding to the origin of the lookup volume"""
 
 
     def __repr__(self, prefixes=None):
@@ -484,6 +608,8 @@ class IndexQueryEngine(QueryEngine):
 
 
     def _train(self, dataset):
+        # forget lookup volume for the previous dataset
+        self._volume = self._volume_origin = None
         # local binding
         qattrs = self._queryattrs
         # in addition to the base class functionality we need to store the
@@ -594,6 +720,57 @@ class IndexQueryEngine(QueryEngine):
             return res
 
 
+    def _get_volume(self):
+        """Dense lookup volume of feature ids, if batch queries are feasible
+
+        It is feasible if there is a single space with integer coordinates
+        and a query object capable of querying a volume (e.g. `Sphere`), and
+        the volume is not too sparse.
+
+        Returns
+        -------
+        ndarray or None
+        """
+        if self._volume is None:
+            if len(self._spaceorder) != 1:
+                return None
+            space = self._spaceorder[0]
+            if not hasattr(self._queryobjs[space], 'query_volume'):
+                return None
+            coords = np.asanyarray(self._queryattrs[space])
+            if coords.dtype.char not in np.typecodes['AllInteger'] \
+                   or not coords.ndim in (1, 2) or not len(coords):
+                return None
+            if coords.ndim == 1:
+                coords = coords[:, None]
+            origin = coords.min(axis=0)
+            extent = coords.max(axis=0) - origin + 1
+            # do not waste memory on very sparse spaces
+            if np.prod(extent) > max(100 * len(coords), 2**20):
+                return None
+            if __debug__:
+                debug('NBH', "Creating lookup volume of shape %s for batch "
+                      "queries of %s" % (tuple(extent), self))
+            volume = np.empty(extent, dtype=int)
+            volume.fill(-1)
+            volume[tuple((coords - origin).T)] = np.arange(len(coords))
+            self._volume, self._volume_origin = volume, origin
+        return self._volume
+
+
+    @borrowdoc(QueryEngineInterface)
+    def query_byid_batch(self, fids):
+        volume = self._get_volume()
+        if volume is None:
+            return super(IndexQueryEngine, self).query_byid_batch(fids)
+        space = self._spaceorder[0]
+        coords = self._queryattrs[space][np.asanyarray(fids, dtype=int)]
+        if coords.ndim == 1:
+            coords = coords[:, None]
+        return self._queryobjs[space].query_volume(
+            coords - self._volume_origin, volume, sort=self.sorted)
+
+
 class CachedQueryEngine(QueryEngineInterface):
     """Provides caching facility for query engines.
 
@@ -613,17 +790,39 @@ class CachedQueryEngine(QueryEngineInterface):
 
     :func:`query` relies on hashid of the queries, so there might be a
     collision! Thus consider it EXPERIMENTAL for now.
+
+    If `cache_dir` is given, all neighborhoods are computed once and
+    stored (in CSR form) in an HDF5 file within that directory.  The
+    file is keyed by the content of the dataset's feature attributes
+    and the state of the underlying query engine, so subsequent
+    sessions (e.g. running a searchlight with the same surfaces or
+    volume mask again) load the neighborhoods instead of recomputing
+    them.  Underlying query engine then gets trained only if
+    :meth:`query` is used.  Query engines returning datasets (e.g.
+    with `add_fa`) cannot be cached on disk.
     """
 
-    def __init__(self, queryengine):
+    def __init__(self, queryengine, cache_dir=None):
         """
         Parameters
         ----------
         queryengine : QueryEngine
           Results of which engine to cache
+        cache_dir : str or None
+          Directory to persistently store the neighborhoods in.  Requires
+          h5py.
         """
         super(CachedQueryEngine, self).__init__()
+        if cache_dir is not None:
+            externals.exists('h5py', raise_=True)
         self._queryengine = queryengine
+        self._cache_dir = cache_dir
+        self._csr = None
+        """(id -> row, indptr, indices) of the neighborhoods loaded from
+        cache_dir"""
+        self._train_dataset = None
+        """Dataset to train underlying engine on, if it becomes necessary
+        """
         self._trained_ds_fa_hash = None
         """Will give information about either dataset's FA were changed
         """
@@ -635,7 +834,8 @@ class CachedQueryEngine(QueryEngineInterface):
             prefixes = []
         return super(CachedQueryEngine, self).__repr__(
             prefixes=prefixes
-            + _repr_attrs(self, ['queryengine']))
+            + _repr_attrs(self, ['queryengine'])
+            + _repr_attrs(self, ['cache_dir']))
 
 
     def train(self, dataset):
@@ -653,9 +853,12 @@ class CachedQueryEngine(QueryEngineInterface):
         if self._trained_ds_fa_hash is None:
             # First time is called
             self._trained_ds_fa_hash = ds_fa_hash
+            self._lookup = {}           # generic lookup
+            if self._cache_dir is not None:
+                self._train_persistent(dataset)
+                return
             self._queryengine.train(dataset)     # train the queryengine
             self._lookup_ids = [None] * dataset.nfeatures # lookup for query_byid
-            self._lookup = {}           # generic lookup
             self.ids = self.queryengine.ids # used in GNBSearchlight??
         elif self._trained_ds_fa_hash != ds_fa_hash:
             raise ValueError, \
@@ -670,15 +873,98 @@ class CachedQueryEngine(QueryEngineInterface):
         """Forgetting that CachedQueryEngine was already trained
         """
         self._trained_ds_fa_hash = None
+        self._csr = None
+        self._train_dataset = None
 
+    def _get_cache_key(self, dataset):
+        """Digest of dataset's feature attributes and the query engine
+        """
+        h = hashlib.md5()
+        for k in sorted(dataset.fa.keys()):
+            a = np.asanyarray(dataset.fa[k].value)
+            h.update(k + str(a.shape) + str(a.dtype))
+            if a.dtype == object:
+                h.update(repr(a.tolist()))
+            else:
+                h.update(np.ascontiguousarray(a).tostring())
+        try:
+            # covers the full state, e.g. all the vertices of the surfaces
+            h.update(cPickle.dumps(self._queryengine, 2))
+        except Exception:
+            # repr truncates large arrays, but addresses at least are
+            # guaranteed to differ between sessions, so strip those
+            h.update(re.sub(' at 0x[0-9a-fA-F]+', '',
+                            repr(self._queryengine)))
+        return h.hexdigest()
+
+    def _train_persistent(self, dataset):
+        """Load the neighborhoods from cache_dir or compute and store them
+        """
+        from mvpa2.base.hdf5 import h5save, h5load
+        filename = os.path.join(self._cache_dir,
+                                '%s.hdf5' % self._get_cache_key(dataset))
+        if os.path.exists(filename):
+            if __debug__:
+                debug('NBH', 'Loading neighborhoods from %s' % filename)
+            cache = h5load(filename)
+            # train underlying engine only if query() gets called
+            self._train_dataset = dataset
+        else:
+            self._queryengine.train(dataset)
+            ids = list(self._queryengine.ids)
+            if len(ids) and is_datasetlike(self._queryengine.query_byid(ids[0])):
+                raise ValueError(
+                    "%s returns datasets, which cannot be stored in "
+                    "cache_dir. Use CachedQueryEngine without cache_dir."
+                    % self._queryengine)
+            indptr, indices = self._queryengine.query_byid_batch(ids)
+            cache = dict(ids=np.asarray(ids, dtype=int),
+                         indptr=indptr, indices=indices)
+            if __debug__:
+                debug('NBH', 'Storing neighborhoods of %d ids in %s'
+                      % (len(ids), filename))
+            # write under another name first, so interrupted session
+            # does not leave a broken cache behind
+            h5save(filename + '.partial', cache, compression='gzip')
+            os.rename(filename + '.partial', filename)
+        ids = cache['ids'].tolist()
+        self._csr = (dict((fid, i) for i, fid in enumerate(ids)),
+                     cache['indptr'], cache['indices'])
+        self.ids = ids
 
     @borrowdoc(QueryEngineInterface)
     def query_byid(self, fid):
+        if self._csr is not None:
+            pos, indptr, indices = self._csr
+            i = pos[fid]
+            return indices[indptr[i]:indptr[i + 1]].tolist()
         v = self._lookup_ids[fid]
         if v is None:
             self._lookup_ids[fid] = v = self._queryengine.query_byid(fid)
         return v
 
+    @borrowdoc(QueryEngineInterface)
+    def query_byid_batch(self, fids):
+        if self._csr is not None:
+            pos, indptr, indices = self._csr
+            rows = np.array([pos[f] for f in fids], dtype=int)
+            lengths = indptr[rows + 1] - indptr[rows]
+            batch_indptr = np.zeros(len(rows) + 1, dtype=int)
+            batch_indptr[1:] = np.cumsum(lengths)
+            if not len(rows) or not batch_indptr[-1]:
+                return batch_indptr, np.zeros(0, dtype=int)
+            # positions of all requested elements within indices
+            offsets = np.repeat(indptr[rows] - batch_indptr[:-1], lengths)
+            return batch_indptr, \
+                   indices[np.arange(batch_indptr[-1]) + offsets]
+        lookup_ids = self._lookup_ids
+        missing = [f for f in fids if lookup_ids[f] is None]
+        if len(missing):
+            indptr, indices = self._queryengine.query_byid_batch(missing)
+            for i, f in enumerate(missing):
+                lookup_ids[f] = indices[indptr[i]:indptr[i + 1]].tolist()
+        return _neighbors_to_csr([lookup_ids[f] for f in fids])
+
     @borrowdoc(QueryEngineInterface)
     def query(self, **kwargs):
         def to_hashable(x):
@@ -716,6 +1002,10 @@ class CachedQueryEngine(QueryEngineInterface):
         k = to_hashable(kwargs)
         v = self._lookup.get(k, None)
         if v is None:
+            if self._train_dataset is not None:
+                # neighborhoods were loaded from cache_dir
+                self._queryengine.train(self._train_dataset)
+                self._train_dataset = None
             self._lookup[k] = v = self._queryengine.query(**kwargs)
         return v
 
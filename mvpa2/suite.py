@@ -235,6 +235,7 @@ if externals.exists("scipy"):
     from mvpa2.support.scipy.stats import scipy
     from mvpa2.measures.corrcoef import *
     from mvpa2.measures.rsa import *
+    from mvpa2.measures.rsasearchlight import *
     from mvpa2.clfs.ridge import *
     from mvpa2.clfs.plr import *
     from mvpa2.misc.stats import *
@@ -11,7 +11,10 @@
 
 __docformat__ = 'restructuredtext'
 
+import os
+import tempfile
 import warnings
+import cPickle
 
 from mvpa2.base import externals, warning, cfg
 
@@ -19,6 +22,36 @@ if __debug__:
     from mvpa2.base import debug
 
 
+def dump_to_tempfile(obj, prefix='tmp'):
+    """Pickle an object into a new temporary file and return its name
+
+    Useful to pass large results from a child process (e.g. of pprocess,
+    where the transfer through the channels is very slow), which then sends
+    back only the file name.  See `load_from_tempfile()`.
+
+    Parameters
+    ----------
+    obj : object
+      Anything which could be pickled.
+    prefix : str, optional
+      Prefix for the name of the temporary file.
+    """
+    fd, filename = tempfile.mkstemp(prefix=prefix, suffix='.pickle')
+    with os.fdopen(fd, 'wb') as f:
+        cPickle.dump(obj, f, cPickle.HIGHEST_PROTOCOL)
+    return filename
+
+
+def load_from_tempfile(filename):
+    """Load an object stored by `dump_to_tempfile()` and remove the file
+    """
+    try:
+        with open(filename, 'rb') as f:
+            return cPickle.load(f)
+    finally:
+        os.unlink(filename)
+
+
 class deprecated(object):
     """Decorator to mark a function or class as deprecated.
 
@@ -144,6 +144,104 @@ class CrossValidationTests(unittest.TestCase):
         res = cv(ds)
         assert_array_equal(res, [[1]])  # failed perfectly ;-)
 
+    def test_cv_cached_kernel(self):
+        from mvpa2.base.param import Parameter
+        from mvpa2.kernels.base import CustomKernel, CachedKernel
+        from mvpa2.kernels.np import RbfKernel
+        from mvpa2.generators.resampling import Balancer
+
+        class CountingKernel(RbfKernel):
+            def __init__(self, **kwargs):
+                RbfKernel.__init__(self, **kwargs)
+                self.shapes = []
+
+            def _compute(self, d1, d2):
+                self.shapes.append((len(d1), len(d2)))
+                RbfKernel._compute(self, d1, d2)
+
+        class KernelMeans(Classifier):
+            """Predicts the target with the largest mean kernel"""
+            __tags__ = ['kernel-based']
+            kernel = Parameter(None, doc='Kernel object')
+
+            def _train(self, ds_):
+                self._train_ds = ds_
+
+            def _predict(self, ds_):
+                k = self.params.kernel.computed(self._train_ds, ds_).as_raw_np()
+                targets = self._train_ds.targets
+                labels = np.unique(targets)
+                means = [k[targets == l].mean(axis=0) for l in labels]
+                return labels[np.argmax(means, axis=0)]
+
+        ds = get_mv_pattern(3)
+        sa_keys = sorted(ds.sa.keys())
+        results = {}
+        for cache_kernel in (False, True):
+            kernel = CountingKernel(sigma=2.0)
+            clf = KernelMeans(kernel=kernel)
+            cv = CrossValidation(clf, NFoldPartitioner(),
+                                 cache_kernel=cache_kernel)
+            results[cache_kernel] = cv(ds)
+            # original kernel is restored
+            ok_(clf.params.kernel is kernel)
+            if cache_kernel:
+                # computed only once for all samples
+                assert_equal(kernel.shapes, [(len(ds), len(ds))])
+            else:
+                assert_equal(len(kernel.shapes), 6)
+        assert_array_almost_equal(results[True], results[False])
+        # input dataset was not altered
+        assert_equal(sorted(ds.sa.keys()), sa_keys)
+        ok_(not 'magic_id' in ds.a)
+
+        # no caching whenever kernel values might depend on other samples
+        kernel = CustomKernel(kernelfunc=lambda a, b: np.dot(a, b.T))
+        clf = KernelMeans(kernel=kernel)
+        cv = CrossValidation(clf, NFoldPartitioner())
+        ok_(cv._get_kernel_learner() is None)
+        clf.params.kernel = CachedKernel(kernel=CountingKernel())
+        ok_(cv._get_kernel_learner() is None)
+        # or generated samples might differ from the input ones
+        clf.params.kernel = CountingKernel()
+        ok_(cv._get_kernel_learner() is clf)
+        cv = CrossValidation(clf, ChainNode([NFoldPartitioner(),
+                                             Balancer(attr='targets')],
+                                            space='partitions'))
+        ok_(cv._get_kernel_learner() is None)
+
+    def test_cv_nproc(self):
+        skip_if_no_external('pprocess')
+        ds = get_mv_pattern(3)
+        results, stats, training_stats, last_stats = {}, {}, {}, {}
+        last_predictions, last_estimates = {}, {}
+        for nproc in (1, 2):
+            clf = sample_clf_lin.clone()
+            clf.ca.enable('estimates')
+            cv = CrossValidation(clf, NFoldPartitioner(), nproc=nproc,
+                                 enable_ca=['stats', 'training_stats',
+                                            'datasets'])
+            results[nproc] = cv(ds)
+            stats[nproc] = cv.ca.stats.matrix
+            training_stats[nproc] = cv.ca.training_stats.matrix
+            assert_equal(len(cv.ca.datasets), 6)
+            # conditional attributes of the last fold are exposed as usual
+            last_stats[nproc] = cv.transfermeasure.ca.stats.matrix
+            # and the learner is left trained on it
+            last_estimates[nproc] = cv.learner.ca.estimates
+            ok_(cv.learner.trained)
+            last_predictions[nproc] = cv.learner.predict(ds.samples)
+        assert_array_equal(results[1], results[2])
+        assert_array_equal(results[1].sa.cvfolds, results[2].sa.cvfolds)
+        assert_array_equal(stats[1], stats[2])
+        assert_array_equal(training_stats[1], training_stats[2])
+        assert_array_equal(last_stats[1], last_stats[2])
+        assert_array_equal(last_predictions[1], last_predictions[2])
+        assert_array_equal(last_estimates[1], last_estimates[2])
+        assert_raises(ValueError, CrossValidation, sample_clf_lin,
+                      NFoldPartitioner(), nproc=2, callback=lambda **kw: None)
+
+
 
 def suite():  # pragma: no cover
     return unittest.makeSuite(CrossValidationTests)
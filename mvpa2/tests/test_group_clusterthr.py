@@ -140,6 +140,69 @@ def test_cluster_count():
                            gct.get_cluster_sizes(ds))
 
 
+def test_bootstrap_topk():
+    data = np.random.randn(50, 30)
+    bcombos = np.random.randint(len(data), size=(200, 5))
+    means = np.array([np.mean(data[s], axis=0) for s in bcombos])
+    assert_array_almost_equal(gct._get_bootstrap_means(data, bcombos), means)
+    # streaming in blocks yields the exact thresholds
+    thr = gct.get_thresholding_map(means, p=0.05)
+    for blocksize in (7, 200):
+        vals, ids = gct._get_bootstrap_topk(data, bcombos, 10, blocksize)
+        assert_equal(vals.shape, (10, data.shape[1]))
+        assert_array_almost_equal(vals.min(axis=0), thr)
+        # ids point to the bootstrap samples the values came from
+        assert_array_almost_equal(vals, means[ids, np.arange(data.shape[1])])
+    # partial estimates can be merged
+    parts = [gct._get_bootstrap_topk(data, bcombos[s:s + 100], 10, 30, s)
+             for s in (0, 100)]
+    mvals, mids = gct._merge_topk(np.vstack([p[0] for p in parts]),
+                                  np.vstack([p[1] for p in parts]), 10)
+    assert_array_almost_equal(mvals.min(axis=0), thr)
+    assert_array_almost_equal(mvals, means[mids, np.arange(data.shape[1])])
+    # super-threshold maps assembled from feature lists
+    clmaps = means > thr
+    assert_equal(
+        gct._get_null_cluster_sizes([np.where(m)[0] for m in clmaps if m.any()],
+                                    data.shape[1], gct.IdentityMapper()),
+        gct.get_cluster_sizes(clmaps[clmaps.any(axis=1)]))
+
+
+def test_graph_cluster_sizes():
+    from mvpa2.misc.neighborhood import IndexQueryEngine, Sphere
+    from mvpa2.support.nibabel import surf
+    # face-connectivity on a grid matches volumetric labeling
+    maps = np.random.randn(20, 4, 5, 6) > 1
+    ds = dataset_wizard(maps)
+    ds.fa['voxel_indices'] = np.array(
+        np.unravel_index(np.arange(ds.nfeatures), maps.shape[1:])).T
+    adj = gct._get_feature_adjacency(
+        IndexQueryEngine(voxel_indices=Sphere(1)), ds)
+    assert_equal(adj.shape, (ds.nfeatures, ds.nfeatures))
+    assert_equal(gct.get_cluster_sizes(ds, adjacency=adj),
+                 gct.get_cluster_sizes(ds))
+    for m in ds.samples:
+        labels, num = gct._get_graph_cluster_labels(m, adj)
+        vlabels, vnum = measurements.label(m.reshape(maps.shape[1:]))
+        assert_equal(num, vnum)
+        # same partition of the features
+        assert_equal(len(set(zip(labels, vlabels.ravel()))), num + (not m.all()))
+    # surface: a strip of nodes is one cluster, isolated nodes are not joined
+    plane = surf.generate_plane((0, 0, 0), (1, 0, 0), (0, 1, 0), 5, 5)
+    sds = Dataset(np.zeros((1, plane.nvertices), dtype=bool))
+    sds.samples[0, :5] = True
+    sds.samples[0, -1] = True
+    adj = gct._get_feature_adjacency(plane, sds)
+    assert_equal(gct.get_cluster_sizes(sds, adjacency=adj), Counter({5: 1, 1: 1}))
+    # features are assigned to nodes if possible
+    sds.fa['node_indices'] = np.arange(plane.nvertices)[::-1]
+    adj = gct._get_feature_adjacency(plane, sds)
+    assert_equal(gct.get_cluster_sizes(sds, adjacency=adj), Counter({5: 1, 1: 1}))
+    # invalid input
+    assert_raises(ValueError, gct._get_feature_adjacency, adj[:3], sds)
+    assert_raises(ValueError, gct._get_feature_adjacency, 'whatever', sds)
+
+
 # run same test with parallel and serial execution
 @sweepargs(n_proc=[1, 2])
 def test_group_clusterthreshold_simple(n_proc):
@@ -24,7 +24,8 @@ import sys
 import tempfile
 
 from mvpa2.base.dataset import AttrDataset, save
-from mvpa2.base.hdf5 import h5save, h5load, obj2hdf, HDF5ConversionError
+from mvpa2.base.hdf5 import h5save, h5load, obj2hdf, HDF5ConversionError, \
+     H5Samples
 from mvpa2.base.dochelpers import safe_str
 from mvpa2.datasets.sources import load_example_fmri_dataset
 from mvpa2.mappers.fx import mean_sample
@@ -73,6 +74,161 @@ def test_h5py_datasets():
                 assert_equal(repr(ds.a.mapper), repr(ds2.a.mapper))
 
 
+@with_tempfile(suffix='.hdf5')
+def test_h5load_lazy(fname):
+    ds = datasets['3dsmall'].copy()
+    ds.sa['extra'] = np.arange(len(ds))
+    h5save(fname, ds)
+    for lds in (h5load(fname, lazy=True),
+                AttrDataset.from_hdf5(fname, lazy=True)):
+        assert_true(isinstance(lds.samples, H5Samples))
+        assert_equal(lds.shape, ds.shape)
+        assert_equal(lds.samples.dtype, ds.samples.dtype)
+        # attributes are there right away
+        assert_array_equal(lds.sa.extra, ds.sa.extra)
+        assert_array_equal(lds.fa.myspace, ds.fa.myspace)
+        mask = np.arange(ds.nfeatures) % 3 == 1
+        for sel in ((slice(None),),
+                    (slice(2, 10),),
+                    (slice(None, None, -2),),
+                    ([5, 1, 1, 7], [3, 0, 2]),
+                    (slice(1, 20, 3), mask),
+                    ([4, 2, 3], slice(5, 15)),
+                    (ds.sa.extra > 10, [8, 9, 10]),
+                    (7, -1),
+                    ([], slice(None)),
+                    ):
+            sub = lds[sel]
+            ref = ds[sel]
+            assert_true(isinstance(sub.samples, np.ndarray))
+            assert_array_equal(sub.samples, ref.samples)
+            assert_array_equal(sub.sa.extra, ref.sa.extra)
+            assert_array_equal(sub.fa.myspace, ref.fa.myspace)
+        # and access to all the data
+        assert_array_equal(np.asarray(lds), ds.samples)
+        assert_array_equal(lds.copy(deep=True).samples, ds.samples)
+        assert_true(isinstance(lds.copy(deep=False).samples, H5Samples))
+        assert_array_equal(lds.samples[3], ds.samples[3])
+        assert_raises(IndexError, lds.samples.__getitem__, (100, 0))
+    del lds, sub
+    # nothing to be loaded lazily -- the file gets closed right away
+    closed = []
+    h5py_File = h5py.File
+    class _File(h5py_File):
+        def close(self):
+            closed.append(self.filename)
+            h5py_File.close(self)
+    h5py.File = _File
+    try:
+        for obj in (ds.samples, {'a': ds.sa.extra, 'b': 'nothing'}):
+            h5save(fname, obj)
+            del closed[:]
+            h5load(fname, lazy=True)
+            assert_equal(closed, [fname])
+        # but remains open for lazily loaded samples
+        h5save(fname, ds)
+        del closed[:]
+        lds = h5load(fname, lazy=True)
+        assert_equal(closed, [])
+        del lds
+    finally:
+        h5py.File = h5py_File
+
+
+@sweepargs(layout=('columnar', 'generic'))
+@with_tempfile(suffix='.hdf5')
+def test_h5save_dataset_layout(fname, layout):
+    ds = datasets['3dsmall'].copy()
+    n = len(ds)
+    ds.sa['labels'] = np.array(['l%i' % (i % 3) for i in xrange(n)],
+                               dtype=object)
+    ds.sa['names'] = np.array([u'n\xe4%i' % i for i in xrange(n)])
+    ds.sa['mixed'] = np.array([i % 2 and 'a' or None for i in xrange(n)],
+                              dtype=object)
+    ds.sa['flags'] = np.arange(n) % 2 == 0
+    ds.fa['ids'] = np.array(['f%i' % i for i in xrange(ds.nfeatures)])
+    ds.a['extra'] = {'some': [1, 2]}
+    h5save(fname, [ds, ds], dataset_layout=layout)
+    for ds_ in h5load(fname):
+        assert_datasets_equal(ds, ds_)
+        for k in ds.sa.keys():
+            assert_equal(ds.sa[k].value.dtype, ds_.sa[k].value.dtype)
+        assert_equal(type(ds_.sa.labels[0]), str)
+        assert_true(isinstance(ds_.sa.names[0], unicode))
+        assert_equal(ds_.a.extra, {'some': [1, 2]})
+    # the same dataset is restored only once
+    dss = h5load(fname)
+    assert_true(dss[0] is dss[1])
+
+    hdf = h5py.File(fname, 'r')
+    try:
+        grp = hdf['items']['0']
+        assert_equal(layout == 'columnar', 'dataset_layout' in grp.attrs)
+        if layout == 'columnar':
+            # strings are stored in a single HDF5 dataset
+            assert_true(isinstance(grp['sa']['labels'], h5py.Dataset))
+            assert_true(isinstance(grp['sa']['names'], h5py.Dataset))
+            assert_true(isinstance(grp['fa']['ids'], h5py.Dataset))
+            # which cannot be done for this one
+            assert_true(isinstance(grp['sa']['mixed'], h5py.Group))
+    finally:
+        hdf.close()
+
+
+@with_tempfile(suffix='.hdf5')
+@with_tempfile(suffix='_copy.hdf5')
+def test_h5save_samples_chunks(fname, fname_copy):
+    ds = AttrDataset(np.random.normal(size=(300, 2000)),
+                     sa={'targets': np.arange(300) % 4})
+    ds.fa['voxel'] = np.arange(ds.nfeatures)
+    for chunking, target in (('samples', (65, 2000)),
+                             ('features', (300, 436)),
+                             ((10, 10), (10, 10)),
+                             (None, None)):
+        h5save(fname, ds, dataset_layout='columnar', samples_chunks=chunking,
+               compression='gzip')
+        hdf = h5py.File(fname, 'r')
+        try:
+            samples = hdf['samples']
+            if target is None:
+                # chunked by h5py due to compression
+                assert_true(samples.chunks is not None)
+            else:
+                assert_equal(samples.chunks, target)
+            assert_equal(samples.compression, 'gzip')
+            assert_equal(hdf['sa']['targets'].compression, 'gzip')
+        finally:
+            hdf.close()
+        assert_datasets_equal(h5load(fname), ds)
+        lds = h5load(fname, lazy=True)
+        assert_array_equal(lds[:, [4, 1]].samples, ds.samples[:, [4, 1]])
+        # closes the file
+        del lds
+    # contiguous storage
+    h5save(fname, ds, dataset_layout='columnar')
+    hdf = h5py.File(fname, 'r')
+    try:
+        assert_equal(hdf['samples'].chunks, None)
+    finally:
+        hdf.close()
+    # and lazily loaded dataset could be stored again
+    ds.save(fname, dataset_layout='columnar', samples_chunks='features')
+    h5save(fname_copy, h5load(fname, lazy=True))
+    assert_datasets_equal(h5load(fname_copy), ds)
+    # in the generic layout by default, which is readable by previous
+    # versions, and has no chunking of samples
+    hdf = h5py.File(fname_copy, 'r')
+    try:
+        assert_false('dataset_layout' in hdf.attrs)
+    finally:
+        hdf.close()
+    assert_raises(ValueError, h5save, fname, ds, samples_chunks='samples')
+    assert_raises(ValueError, ds.save, fname, samples_chunks='samples')
+    assert_raises(ValueError, h5save, fname, ds, dataset_layout='columnar',
+                  samples_chunks='voxels')
+    assert_raises(ValueError, h5save, fname, ds, dataset_layout='rows')
+
+
 def test_h5py_dataset_typecheck():
     ds = datasets['uni2small']
 
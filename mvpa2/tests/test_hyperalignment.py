@@ -192,6 +192,66 @@ class HyperAlignmentTests(unittest.TestCase):
             corr = np.corrcoef(ds_test_a[2], ds_test_a[1])[0, 1]
             assert(corr < 0.99)
 
+    @sweepargs(level2_niter=(0, 2))
+    @reseed_rng()
+    def test_batch_vs_mappers(self, level2_niter):
+        skip_if_no_external('scipy')
+        from mvpa2.mappers.procrustean import ProcrusteanMapper
+        ds = datasets['uni4large']
+        # datasets of different dimensionality
+        dss = [random_affine_transformation(ds[:, :nf])
+               for nf in (6, 6, 5, 6)]
+        ha = Hyperalignment(level2_niter=level2_niter)
+        assert_true(ha._supports_batch())
+        # scipy's SVD could not be stacked so mappers are trained one by one
+        ha_mappers = Hyperalignment(
+            level2_niter=level2_niter,
+            alignment=ProcrusteanMapper(space='commonspace', svd='scipy'))
+        assert_false(ha_mappers._supports_batch())
+        for h in (ha, ha_mappers):
+            h.ca.enable(['training_residual_errors', 'residual_errors'])
+        mappers = ha(dss)
+        mappers_ = ha_mappers(dss)
+        for m, m_, sd in zip(mappers, mappers_, dss):
+            assert_true(isinstance(m, ProcrusteanMapper))
+            assert_array_almost_equal(m.proj, m_.proj)
+            assert_array_almost_equal(m.forward(sd), m_.forward(sd))
+        assert_array_almost_equal(ha.ca.training_residual_errors.samples,
+                                  ha_mappers.ca.training_residual_errors.samples)
+        assert_array_almost_equal(ha.ca.residual_errors.samples,
+                                  ha_mappers.ca.residual_errors.samples)
+
+    @sweepargs(svd=('numpy', 'scipy'))
+    @reseed_rng()
+    def test_nproc(self, svd):
+        skip_if_no_external('pprocess')
+        if svd == 'scipy':
+            skip_if_no_external('scipy')
+        from mvpa2.mappers.procrustean import ProcrusteanMapper
+        ds = datasets['uni4large']
+        dss = [random_affine_transformation(ds) for i in xrange(5)]
+        results = []
+        for nproc in (1, 2, 3):
+            ha = Hyperalignment(
+                level2_niter=2, nproc=nproc,
+                alignment=ProcrusteanMapper(space='commonspace', svd=svd))
+            ha.ca.enable(['training_residual_errors', 'residual_errors'])
+            mappers = ha(dss)
+            results.append((ha, mappers))
+        ha1, mappers1 = results[0]
+        for ha, mappers in results[1:]:
+            # must be bit-for-bit identical to the serial run
+            assert_array_equal(ha.commonspace, ha1.commonspace)
+            assert_array_equal(ha.ca.training_residual_errors.samples,
+                               ha1.ca.training_residual_errors.samples)
+            assert_array_equal(ha.ca.residual_errors.samples,
+                               ha1.ca.residual_errors.samples)
+            assert_equal(len(mappers), len(dss))
+            for m, m1, sd in zip(mappers, mappers1, dss):
+                assert_true(m.is_trained)
+                assert_array_equal(m.proj, m1.proj)
+                assert_array_equal(m.forward(sd), m1.forward(sd))
+
     def test_hyper_ref_ds_range_checks(self):
         # If supplied ref_ds can't be fit into non-negative int
         # it should thrown an exception
@@ -170,6 +170,35 @@ class KernelTests(unittest.TestCase):
                         "CachedKernel did not recompute old data which had\n" + \
                         "previously been computed, but had the cache overriden")
 
+    @reseed_rng()
+    def test_cached_linear_kernel(self):
+        d = Dataset(np.random.randn(40, 30))
+        d.init_origids('both')
+        lk = npK.LinearKernel()
+        ck = npK.CachedLinearKernel()
+        ck.compute(d)
+        # remove few features (downdate) and most of them (recompute),
+        # selecting in arbitrary order
+        for ids in (np.arange(30)[::-1][:27], [20, 3, 7, 1, 5, 0]):
+            ck.select_features(d, ids)
+            d = d[:, ids]
+            lk.compute(d)
+            ck.compute(d)
+            self.failIf(ck._recomputed,
+                        "CachedLinearKernel recomputed after downdate")
+            assert_array_almost_equal(lk.as_raw_np(), ck.as_raw_np())
+            # and for subsets of samples
+            lk.compute(d[5:10], d[::2])
+            ck.compute(d[5:10], d[::2])
+            assert_array_almost_equal(lk.as_raw_np(), ck.as_raw_np())
+        # other features get computed directly without altering the cache
+        lk.compute(d[:, :2])
+        ck.compute(d[:, :2])
+        assert_array_almost_equal(lk.as_raw_np(), ck.as_raw_np())
+        ck.compute(d)
+        self.failIf(ck._recomputed)
+        assert_array_almost_equal(ck.as_raw_np(), np.dot(d.samples, d.samples.T))
+
     if _has_sg:
         # Unit tests which require shogun kernels
         # Note - there is a loss of precision from double to float32 in SG
@@ -13,6 +13,7 @@ import numpy as np
 from mvpa2.testing import *
 from mvpa2.testing.datasets import pure_multivariate_signal
 
+from mvpa2.datasets import Dataset
 from mvpa2.clfs.knn import kNN
 from mvpa2.clfs.distance import one_minus_correlation
 
@@ -63,6 +64,58 @@ class KNNTests(unittest.TestCase):
         self.assertTrue(not (clf.ca.distances.fa['chunks'] is train.sa['chunks']))
         self.assertTrue(not (clf.ca.distances.fa.chunks is train.sa.chunks))
 
+    def test_knn_chunks(self):
+        train = pure_multivariate_signal(40, 3)
+        test = pure_multivariate_signal(20, 3)
+        for voting in ('majority', 'weighted'):
+            clf = kNN(k=5, voting=voting,
+                      enable_ca=['estimates', 'distances'])
+            clf.train(train)
+            p = clf.predict(test.samples)
+            estimates = clf.ca.estimates
+            distances = clf.ca.distances.samples
+            for chunk_size in (None, 1, 7, 1000):
+                clf_ = kNN(k=5, voting=voting, chunk_size=chunk_size,
+                           enable_ca=['estimates', 'distances'])
+                clf_.train(train)
+                assert_equal(clf_.predict(test.samples), p)
+                assert_equal(clf_.ca.estimates, estimates)
+                assert_array_equal(clf_.ca.distances.samples, distances)
+        clf = kNN(voting='bogus')
+        clf.train(train)
+        assert_raises(ValueError, clf.predict, test.samples)
+
+
+    def test_knn_ties(self):
+        train = Dataset([[0], [1], [1], [3], [3]],
+                        sa={'targets': ['a', 'b', 'a', 'a', 'b']})
+        # first of the equally distant neighbors are taken
+        clf = kNN(k=1)
+        clf.train(train)
+        assert_equal(clf.predict([[1.], [3.]]), ['b', 'a'])
+        # tie of votes is broken by the mean distance
+        clf = kNN(k=2, voting='majority', enable_ca=['estimates'])
+        clf.train(train)
+        assert_equal(clf.predict([[0.4]]), ['a'])
+        assert_equal(clf.ca.estimates, [{'a': 1, 'b': 1}])
+
+
+    def test_knn_nan_dists(self):
+        # correlation with a constant sample is undefined
+        train = Dataset([[1, 2, 3], [3, 2, 1], [1, 2, 4], [4, 2, 1],
+                         [1, 3, 3], [2, 2, 2]],
+                        sa={'targets': ['a', 'b', 'a', 'b', 'a', 'b']})
+        test = [[1, 2, 3.5], [3.5, 2, 1]]
+        clf = kNN(k=6, dfx=one_minus_correlation)
+        clf.train(train)
+        assert_equal(len(clf.predict(test)), 2)
+        # the constant sample is the farthest neighbor
+        clf = kNN(k=5, dfx=one_minus_correlation, enable_ca=['estimates'])
+        clf.train(train)
+        assert_equal(clf.predict(test), ['a', 'a'])
+        assert_equal(clf.ca.estimates, [{'a': 3, 'b': 2}] * 2)
+
+
 def suite():  # pragma: no cover
     return unittest.makeSuite(KNNTests)
 
@@ -17,7 +17,7 @@ import mvpa2.misc.neighborhood as ne
 from mvpa2.clfs.distance import *
 
 from mvpa2.testing.tools import ok_, assert_raises, assert_false, assert_equal, \
-        assert_array_equal
+        assert_array_equal, with_tempfile, skip_if_no_external
 from mvpa2.testing.datasets import datasets
 
 def test_distances():
@@ -275,6 +275,92 @@ def test_cached_query_engine():
     #ds2.fa.myspace = ds2.fa.myspace*3
     #assert_raises(ValueError, qec.train, ds2)
 
+def test_query_byid_batch():
+    ds = datasets['3dlarge'].copy()
+    # punch some holes into the volume
+    ds = ds[:, np.arange(ds.nfeatures) % 7 != 3]
+    ds.fa['time'] = np.arange(ds.nfeatures) * 2
+    ds_1d = Dataset(np.zeros((2, 10)), fa={'x': [0, 1, 3, 4, 5, 7, 9, 10, 11, 15]})
+    fids = [0, 5, 3, ds.nfeatures - 1, 5]
+
+    for qe, d in [(ne.IndexQueryEngine(myspace=ne.Sphere(2)), ds),
+                  (ne.IndexQueryEngine(myspace=ne.Sphere(1.5, element_sizes=(1, 2, 1))), ds),
+                  (ne.IndexQueryEngine(myspace=ne.HollowSphere(2, 1)), ds),
+                  (ne.IndexQueryEngine(myspace=ne.Sphere(0)), ds),
+                  (ne.IndexQueryEngine(myspace=ne.Sphere(2), sorted=False), ds),
+                  (ne.IndexQueryEngine(x=ne.Sphere(2)), ds_1d),
+                  # multiple spaces fall back to per-id queries
+                  (ne.IndexQueryEngine(myspace=ne.Sphere(1), time=ne.Sphere(4)), ds),
+                  (ne.CachedQueryEngine(ne.IndexQueryEngine(myspace=ne.Sphere(2))), ds),
+                  ]:
+        qe.train(d)
+        if isinstance(qe, ne.IndexQueryEngine) and len(qe._spaceorder) == 1:
+            ok_(qe._get_volume() is not None)
+        ids = [f for f in fids if f < d.nfeatures]
+        indptr, indices = qe.query_byid_batch(ids)
+        assert_equal(len(indptr), len(ids) + 1)
+        assert_equal(indptr[-1], len(indices))
+        for i, f in enumerate(ids):
+            batch = indices[indptr[i]:indptr[i + 1]]
+            if getattr(qe, 'sorted', True):
+                assert_array_equal(batch, qe[f])
+            else:
+                assert_array_equal(sorted(batch), sorted(qe[f]))
+        # all at once
+        indptr, indices = qe.query_byid_batch(range(d.nfeatures))
+        assert_array_equal(np.diff(indptr),
+                           [len(qe[f]) for f in xrange(d.nfeatures)])
+
+    # the volume-based query by itself
+    volume = -np.ones((3, 4), dtype=int)
+    volume[1, 1], volume[1, 2], volume[0, 1], volume[2, 3] = 10, 11, 12, 13
+    indptr, indices = ne.Sphere(1).query_volume([(1, 1), (2, 3), (0, 0)],
+                                                volume)
+    assert_array_equal(indptr, [0, 3, 1 + 3, 2 + 3])
+    assert_array_equal(indices, [10, 11, 12, 13, 12])
+    assert_raises(ValueError, ne.Sphere(1).query_volume, [(1., 1.)], volume)
+    assert_raises(ValueError, ne.Sphere(1).query_volume, [(1, 1, 1)], volume)
+
+
+@with_tempfile()
+def test_cached_qe_cache_dir(cache_dir):
+    skip_if_no_external('h5py')
+    ds = datasets['3dsmall'].copy()
+
+    ref = ne.IndexQueryEngine(myspace=ne.Sphere(1))
+    ref.train(ds)
+    qe = ne.CachedQueryEngine(ne.IndexQueryEngine(myspace=ne.Sphere(1)),
+                              cache_dir=cache_dir)
+    qe.train(ds)
+    assert_equal(len(os.listdir(cache_dir)), 1)
+
+    # new session loads the neighborhoods without training the engine
+    qe2 = ne.CachedQueryEngine(ne.IndexQueryEngine(myspace=ne.Sphere(1)),
+                               cache_dir=cache_dir)
+    qe2.train(ds)
+    ok_(qe2.queryengine._searcharray is None)
+    assert_equal(qe2.ids, list(ref.ids))
+    for fid in ref.ids:
+        assert_array_equal(qe2[fid], ref[fid])
+    ids = [5, 0, 3, 5]
+    assert_array_equal(qe2.query_byid_batch(ids)[1],
+                       ref.query_byid_batch(ids)[1])
+    assert_array_equal(qe2.query_byid_batch(ids)[0],
+                       ref.query_byid_batch(ids)[0])
+    # generic queries still work, by training the engine on demand
+    assert_array_equal(qe2.query(myspace=(0, 0)), ref.query(myspace=(0, 0)))
+
+    # different engine or feature attributes -- different cache
+    qe3 = ne.CachedQueryEngine(ne.IndexQueryEngine(myspace=ne.Sphere(2)),
+                               cache_dir=cache_dir)
+    qe3.train(ds)
+    ds = ds[:, 1:]
+    qe4 = ne.CachedQueryEngine(ne.IndexQueryEngine(myspace=ne.Sphere(2)),
+                               cache_dir=cache_dir)
+    qe4.train(ds)
+    assert_equal(len(os.listdir(cache_dir)), 3)
+
+
 def test_scattered_neighborhoods():
     radius = 1
     sphere = ne.Sphere(radius)
@@ -116,6 +116,49 @@ class ProcrusteanMapperTests(unittest.TestCase):
                                     msg="%s: Failed to reconstruct into source space correctly."
                                         " normed error=%g" % (sdim, ndsfr))
 
+    @reseed_rng()
+    def test_batch_transformations(self):
+        d_orig = datasets['uni4large'].samples
+        nsamples = len(d_orig)
+        sources, targets = [], []
+        for nf_s, nf_t in ((5, 5), (5, 5), (3, 5), (5, 3), (5, 5), (2, 4)):
+            R = get_random_rotation(nf_s, nf_t, d_orig)
+            sources.append(d_orig[:, :nf_s] + np.random.normal(size=nf_s))
+            targets.append(np.dot(sources[-1], R)
+                           + np.random.normal(size=(nsamples, nf_t)))
+        for scaling, reflection, demean in itertools.product(
+                (True, False), (True, False), (True, False)):
+            kwargs = dict(scaling=scaling, reflection=reflection,
+                          demean=demean)
+            pm = ProcrusteanMapper(**kwargs)
+            assert_true(pm.supports_batch)
+            # targets could be generated on the fly
+            transformations = pm.get_batch_transformations(
+                sources, (t for t in targets))
+            assert_equal(len(transformations), len(sources))
+            for source, target, transformation \
+                    in zip(sources, targets, transformations):
+                pm_ = ProcrusteanMapper(**kwargs)
+                pm_.train(dataset_wizard(samples=source, targets=target))
+                assert_array_almost_equal(transformation[0], pm_.proj)
+                assert_almost_equal(transformation[1], pm_._scale)
+                assert_array_almost_equal(
+                    pm.forward_transformation(source, transformation),
+                    pm_.forward(source))
+                # and materialized mapper behaves the same
+                pm_batch = pm.from_transformation(transformation)
+                assert_true(pm_batch.is_trained)
+                assert_array_almost_equal(pm_batch.forward(source),
+                                          pm_.forward(source))
+                assert_array_almost_equal(pm_batch.reverse(target),
+                                          pm_.reverse(target))
+        assert_raises(ValueError, ProcrusteanMapper().get_batch_transformations,
+                      sources, targets[:-1])
+        pm = ProcrusteanMapper(oblique=True)
+        assert_false(pm.supports_batch)
+        assert_raises(ValueError, pm.get_batch_transformations,
+                      sources, targets)
+
 
 def suite():  # pragma: no cover
     return unittest.makeSuite(ProcrusteanMapperTests)
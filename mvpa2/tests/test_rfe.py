@@ -381,6 +381,98 @@ class RFETests(unittest.TestCase):
             # use the same classifier
 
 
+    @reseed_rng()
+    def test_rfe_warm_start(self):
+        skip_if_no_external('libsvm')
+        from mvpa2.clfs.svm import LinearCSVMC
+        from mvpa2.featsel.rfe import _get_warm_start_learners
+
+        class StoreWarmStart(object):
+            """Record warm_start setting of the classifier at every step"""
+            def __init__(self, clf):
+                self.clf = clf
+                self.warm_start = []
+
+            def __call__(self, sensitivity):
+                self.warm_start.append(self.clf.params.warm_start)
+                return FixedNElementTailSelector(2)(sensitivity)
+
+        clf = LinearCSVMC()
+        sens_ana = clf.get_sensitivity_analyzer(postproc=maxofabs_sample())
+        pmeasure = ProxyMeasure(clf, postproc=BinaryFxNode(mean_mismatch_error,
+                                                           'targets'))
+        # found through the sensitivity analyzer and the proxy, but only once
+        assert_equal(_get_warm_start_learners(sens_ana, pmeasure), [clf])
+        assert_equal(_get_warm_start_learners(OneWayAnova(), None), [])
+
+        # not enabled unless asked for
+        fselector = StoreWarmStart(clf)
+        rfe = RFE(sens_ana, pmeasure, Splitter('train'),
+                  fselector=fselector, train_pmeasure=False)
+        ok_(not 'warm_start' in repr(rfe))
+        rfe.train(self.get_data())
+        ok_(len(fselector.warm_start) > 1)
+        ok_(not any(fselector.warm_start))
+
+        fselector = StoreWarmStart(clf)
+        rfe = RFE(sens_ana, pmeasure, Splitter('train'),
+                  fselector=fselector, train_pmeasure=False, warm_start=True)
+        ok_('warm_start=True' in repr(rfe))
+        rfe.train(self.get_data())
+        ok_(len(fselector.warm_start) > 1)
+        ok_(all(fselector.warm_start))
+        # gets disabled back after elimination
+        ok_(not clf.params.warm_start)
+        ok_(clf._SVM__warm_start is None)
+
+
+    @reseed_rng()
+    def test_rfe_cached_kernel(self):
+        skip_if_no_external('libsvm')
+        from mvpa2.clfs.svm import LinearCSVMC, RbfCSVMC
+        from mvpa2.kernels.np import CachedLinearKernel
+
+        class StoreKernel(object):
+            """Record kernel of the classifier at every step"""
+            def __init__(self, clf):
+                self.clf = clf
+                self.kernels = []
+
+            def __call__(self, sensitivity):
+                self.kernels.append(self.clf.params.kernel)
+                return FractionTailSelector(0.7)(sensitivity)
+
+        ds = self.get_data()
+        ds_ = ds.copy(deep=False)
+        results = {}
+        for cache_kernel in (False, True):
+            clf = LinearCSVMC()
+            kernel = clf.params.kernel
+            fselector = StoreKernel(clf)
+            rfe = RFE(clf.get_sensitivity_analyzer(postproc=maxofabs_sample()),
+                      ProxyMeasure(clf,
+                                   postproc=BinaryFxNode(mean_mismatch_error,
+                                                         'targets')),
+                      Splitter('train'), fselector=fselector,
+                      cache_kernel=cache_kernel, train_pmeasure=False)
+            assert_equal(len(rfe._get_kernel_learners()), int(cache_kernel))
+            rfe.train(ds)
+            ok_(len(fselector.kernels) > 1)
+            assert_equal(
+                [isinstance(k, CachedLinearKernel) for k in fselector.kernels],
+                [cache_kernel] * len(fselector.kernels))
+            # original kernel is restored
+            ok_(clf.params.kernel is kernel)
+            results[cache_kernel] = rfe.ca.errors, rfe.ca.history
+        assert_array_almost_equal(results[True][0], results[False][0])
+        assert_array_equal(results[True][1], results[False][1])
+        # input dataset was not altered
+        assert_equal(sorted(ds.sa.keys()), sorted(ds_.sa.keys()))
+        assert_equal(sorted(ds.fa.keys()), sorted(ds_.fa.keys()))
+        # no caching for nonlinear kernels
+        rfe = RFE(OneWayAnova(), ProxyMeasure(RbfCSVMC()), Repeater(2))
+        assert_equal(rfe._get_kernel_learners(), [])
+
     def test_james_problem(self):
         percent = 80
         dataset = datasets['uni2small']
@@ -168,6 +168,69 @@ def test_PDistTargetSimilaritySearchlight():
     assert_true(np.all(0 <= sl_both.samples[1]))
 
 
+@sweepargs(center_data=(False, True))
+def test_RSASearchlight(center_data):
+    from mvpa2.mappers.fx import mean_group_sample
+    from mvpa2.mappers.shape import TransposeMapper
+    from mvpa2.measures.searchlight import sphere_searchlight
+    from mvpa2.measures.rsasearchlight import sphere_rsasearchlight, \
+        _rankdata_columns
+    ds = datasets['3dsmall'].copy()
+    ds.fa['voxel_indices'] = ds.fa.myspace
+    ds = ds[:8]
+    center_ids = range(0, ds.nfeatures, 3)
+    # DSMs of all ROIs are the same as with PDist
+    sl = sphere_rsasearchlight(radius=2, center_data=center_data,
+                               center_ids=center_ids)
+    sl.ca.enable('roi_sizes')
+    res = sl(ds)
+    res_generic = sphere_searchlight(PDist(center_data=center_data),
+                                     radius=2, center_ids=center_ids)(ds)
+    assert_array_almost_equal(res.samples, res_generic.samples)
+    assert_array_equal(res.sa.pairs, res_generic.sa.pairs)
+    assert_array_equal(res.fa.center_ids, center_ids)
+    assert_equal(len(sl.ca.roi_sizes), len(center_ids))
+    # and correlations with the target as with PDistTargetSimilarity
+    tdsm = np.random.rand(len(res))
+    for metric in ('pearson', 'spearman'):
+        res = sphere_rsasearchlight(tdsm, radius=2, center_data=center_data,
+                                    comparison_metric=metric)(ds)
+        res_generic = sphere_searchlight(
+            PDistTargetSimilarity(tdsm, center_data=center_data,
+                                  comparison_metric=metric,
+                                  postproc=TransposeMapper()),
+            radius=2)(ds)
+        assert_array_almost_equal(res.samples, res_generic.samples)
+        assert_array_equal(res.sa.metrics, ['rho', 'p'])
+        res_rho = sphere_rsasearchlight(tdsm, radius=2,
+                                        center_data=center_data,
+                                        comparison_metric=metric,
+                                        corrcoef_only=True)(ds)
+        assert_array_equal(res_rho.sa.metrics, ['rho'])
+        assert_array_almost_equal(res_rho.samples, res.samples[:1])
+    # the same when computed in blocks of a few ROIs
+    import mvpa2.measures.rsasearchlight as rsasl
+    max_size = rsasl._FUSED_TERMS_MAX_SIZE
+    try:
+        rsasl._FUSED_TERMS_MAX_SIZE = 3 * len(tdsm)
+        for target in (None, tdsm):
+            res_blocks = sphere_rsasearchlight(target, radius=2,
+                                               center_data=center_data)(ds)
+            rsasl._FUSED_TERMS_MAX_SIZE = max_size
+            res = sphere_rsasearchlight(target, radius=2,
+                                        center_data=center_data)(ds)
+            rsasl._FUSED_TERMS_MAX_SIZE = 3 * len(tdsm)
+            assert_array_almost_equal(res_blocks.samples, res.samples)
+    finally:
+        rsasl._FUSED_TERMS_MAX_SIZE = max_size
+    # target must match the number of pairs
+    assert_raises(ValueError, sphere_rsasearchlight(tdsm[1:], radius=2), ds)
+    # batched ranking with ties
+    a = np.random.randint(0, 5, size=(20, 6))
+    assert_array_equal(_rankdata_columns(a),
+                       np.array([rankdata(c) for c in a.T]).T)
+
+
 def test_Regression():
     skip_if_no_external('skl')
     # a very correlated dataset
@@ -8,7 +8,7 @@
 ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
 """Unit tests for PyMVPA searchlight algorithm"""
 
-import tempfile, time
+import os, tempfile, time, shutil
 import numpy.random as rnd
 
 from math import ceil
@@ -35,7 +35,8 @@ from mvpa2.measures.nnsearchlight import sphere_m1nnsearchlight, \
 from mvpa2.clfs.knn import kNN
 
 from mvpa2.misc.neighborhood import IndexQueryEngine, Sphere, HollowSphere, CachedQueryEngine
-from mvpa2.misc.errorfx import corr_error, mean_match_accuracy
+from mvpa2.misc.errorfx import corr_error, mean_match_accuracy, \
+     mean_mismatch_error
 from mvpa2.generators.partition import NFoldPartitioner, OddEvenPartitioner, CustomPartitioner
 from mvpa2.generators.splitters import Splitter
 from mvpa2.generators.permutation import AttributePermutator
@@ -122,7 +123,7 @@ class SearchlightTests(unittest.TestCase):
                 ]
                )
     @sweepargs(do_roi=(False, True))
-    @sweepargs(results_backend=('native', 'hdf5'))
+    @sweepargs(results_backend=('native', 'hdf5', 'memmap'))
     @reseed_rng()
     def test_spatial_searchlight(self, lrn_sllrn_SL_partitioner, do_roi=False,
                                  results_backend='native'):
@@ -321,6 +322,44 @@ class SearchlightTests(unittest.TestCase):
         assert_array_equal(sl.ca.null_t.samples.shape,
                            (1, ds.nfeatures))
 
+    @reseed_rng()
+    def test_adhocsearchlight_permuting_generator(self):
+        from mvpa2.base.node import ChainNode
+        ds = datasets['3dmedium'].copy()
+        ds.fa['voxel_indices'] = ds.fa.myspace
+        partitioner = ChainNode(
+            [NFoldPartitioner(),
+             AttributePermutator('targets', count=3,
+                                 limit={'partitions': 1})],
+            space='partitions')
+        partitions = list(partitioner.generate(ds))
+
+        class FixedGenerator(object):
+            # provides the same partitions on every call
+            def __init__(self, partitions):
+                self.partitions = partitions
+            def get_space(self):
+                return 'partitions'
+            def generate(self, ds):
+                for p in self.partitions:
+                    p_ = ds.copy(deep=False)
+                    p_.sa['targets'] = p.sa.targets
+                    p_.sa['partitions'] = p.sa.partitions
+                    yield p_
+
+        for slfx, lrn in ((sphere_gnbsearchlight, GNB()),
+                          (sphere_m1nnsearchlight, kNN(1))):
+            res = slfx(lrn, FixedGenerator(partitions), radius=1)(ds)
+            assert_equal(len(res), len(partitions))
+            # must match scoring every partition on its own
+            for i, p in enumerate(partitions):
+                ds_ = ds.copy(deep=False)
+                ds_.sa['targets'] = p.sa.targets
+                res_ = slfx(lrn, FixedGenerator([p]), radius=1)(ds_)
+                assert_array_almost_equal(res.samples[i], res_.samples[0])
+            # permutations differ from each other
+            assert(np.any(res.samples[0] != res.samples[1]))
+
     def test_gnbsearchlight_matchaccuracy(self):
         # was not able to deal with custom errorfx collapsing samples
         # after 55e147e0bd30fbf4edede3faef3a15c6c65b33ea
@@ -332,6 +371,30 @@ class SearchlightTests(unittest.TestCase):
                                          radius=0, errorfx=mean_match_accuracy)
         assert_array_almost_equal(sl_err(ds), 1.0 - sl_acc(ds).samples)
 
+    @sweepargs(errorfx=(mean_mismatch_error, None))
+    def test_adhocsearchlight_fused_splits(self, errorfx):
+        skip_if_no_external('scipy')
+        import mvpa2.measures.adhocsearchlightbase as ahsl
+        ds = datasets['3dmedium'].copy()
+        ds.fa['voxel_indices'] = ds.fa.myspace
+        for slfx, lrn in ((sphere_gnbsearchlight, GNB()),
+                          (sphere_m1nnsearchlight, kNN(1))):
+            res_fancy = slfx(lrn, NFoldPartitioner(), radius=1,
+                             errorfx=errorfx, indexsum='fancy')(ds)
+            res = slfx(lrn, NFoldPartitioner(), radius=1,
+                       errorfx=errorfx, indexsum='sparse')(ds)
+            assert_array_almost_equal(res.samples, res_fancy.samples)
+            assert_array_equal(res.sa.cvfolds, res_fancy.sa.cvfolds)
+            # sums get computed in multiple portions if the terms are large
+            max_size = ahsl._FUSED_TERMS_MAX_SIZE
+            try:
+                ahsl._FUSED_TERMS_MAX_SIZE = 1
+                res_ = slfx(lrn, NFoldPartitioner(), radius=1,
+                            errorfx=errorfx, indexsum='sparse')(ds)
+            finally:
+                ahsl._FUSED_TERMS_MAX_SIZE = max_size
+            assert_array_equal(res_.samples, res.samples)
+
     def test_partial_searchlight_with_full_report(self):
         ds = self.dataset.copy()
         center_ids = np.zeros(ds.nfeatures, dtype='bool')
@@ -665,6 +728,142 @@ class SearchlightTests(unittest.TestCase):
         assert_array_equal(res1, res2)
 
 
+    def test_memmap_dataset_backend(self):
+        skip_if_no_external('pprocess')
+        ds = datasets['3dsmall'].copy(deep=True)[:, :13]
+        ds.fa['voxel_indices'] = ds.fa.myspace
+        cv = CrossValidation(GNB(), OddEvenPartitioner())
+        tmp_prefix = tempfile.mktemp()
+        res1 = sphere_searchlight(cv, radius=1, nproc=2)(ds)
+        sl = sphere_searchlight(cv, radius=1, nproc=2,
+                                dataset_backend='memmap',
+                                tmp_prefix=tmp_prefix)
+        ok_("dataset_backend='memmap'" in repr(sl))
+        res2 = sl(ds)
+        assert_array_equal(res1, res2)
+        assert_array_equal(res1.fa.center_ids, res2.fa.center_ids)
+        # verify that no junk is left behind
+        assert_equal(len(glob.glob(tmp_prefix + '*')), 0)
+        assert_raises(ValueError, sphere_searchlight, cv,
+                      dataset_backend='shm')
+
+
+    def test_memmap_results_backend(self):
+        ds = datasets['3dsmall'].copy(deep=True)[:, :13]
+        ds.fa['voxel_indices'] = ds.fa.myspace
+        cv = CrossValidation(GNB(), OddEvenPartitioner())
+        if os.name != 'posix':
+            assert_raises(ValueError, sphere_searchlight, cv,
+                          results_backend='memmap')
+            raise SkipTest("results_backend='memmap' is POSIX only")
+        tmp_prefix = tempfile.mktemp()
+        res_native = sphere_searchlight(cv, radius=1)(ds)
+        for kwargs in [{}, {'center_ids': [3, 1, 7]}] + \
+                (externals.exists('pprocess')
+                 and [{'nproc': 2}, {'nproc': 2, 'nblocks': 5},
+                      {'nproc': 2, 'scheduling': 'dynamic'}] or []):
+            sl = sphere_searchlight(cv, radius=1, results_backend='memmap',
+                                    tmp_prefix=tmp_prefix,
+                                    enable_ca=['roi_sizes'], **kwargs)
+            res = sl(ds)
+            ok_(isinstance(res.samples, np.memmap))
+            center_ids = kwargs.get('center_ids', np.arange(ds.nfeatures))
+            assert_array_equal(res, res_native[:, center_ids])
+            assert_array_equal(res.fa.center_ids, center_ids)
+            assert_array_equal(res.sa.cvfolds, res_native.sa.cvfolds)
+            assert_equal(len(sl.ca.roi_sizes), len(center_ids))
+            # verify that no junk is left behind
+            assert_equal(len(glob.glob(tmp_prefix + '*')), 0)
+
+        # results of varying shapes cannot be stored
+        sl = sphere_searchlight(lambda x: np.arange(x.nfeatures), radius=1,
+                                results_backend='memmap',
+                                tmp_prefix=tmp_prefix)
+        assert_raises(ValueError, sl, ds)
+        assert_equal(len(glob.glob(tmp_prefix + '*')), 0)
+        assert_raises(ValueError, sphere_searchlight, cv,
+                      results_backend='zarr')
+
+
+    def test_checkpoints(self):
+        skip_if_no_external('h5py')
+        ds = datasets['3dsmall'].copy(deep=True)[:, :13]
+        ds.fa['voxel_indices'] = ds.fa.myspace
+        cv = CrossValidation(GNB(), OddEvenPartitioner())
+        res_native = sphere_searchlight(cv, radius=1)(ds)
+
+        computed = []
+        def measure(x):
+            computed.append(x.fa.voxel_indices[0])
+            return cv(x)
+
+        for kwargs in [{}, {'results_backend': 'memmap'}] + \
+                (externals.exists('pprocess')
+                 and [{'nproc': 2, 'scheduling': 'dynamic'}] or []):
+            checkpoint_dir = tempfile.mktemp()
+            try:
+                sl = sphere_searchlight(measure, radius=1,
+                                        checkpoint_dir=checkpoint_dir,
+                                        checkpoint_every=4, **kwargs)
+                res = sl(ds)
+                assert_array_equal(res, res_native)
+                stored = sorted(glob.glob(os.path.join(checkpoint_dir,
+                                                       'roi*.hdf5')))
+                # at least 4 checkpoints for 13 ROIs
+                ok_(len(stored) >= 4)
+                # "lose" some results and resume
+                for f in stored[::2]:
+                    os.unlink(f)
+                del computed[:]
+                mvpa2.seed()
+                res = sl(ds)
+                assert_array_equal(res, res_native)
+                assert_array_equal(res.fa.center_ids, res_native.fa.center_ids)
+                if not kwargs.get('nproc'):
+                    # only the lost ROIs were computed again
+                    ok_(0 < len(computed) < ds.nfeatures)
+                    # and nothing at all once everything is stored
+                    del computed[:]
+                    res = sl(ds)
+                    assert_array_equal(res, res_native)
+                    assert_equal(len(computed), 0)
+                # different dataset must not reuse the results
+                assert_raises(ValueError, sl, ds[:, :12])
+            finally:
+                shutil.rmtree(checkpoint_dir, ignore_errors=True)
+
+
+    def test_dynamic_scheduling(self):
+        skip_if_no_external('pprocess')
+        ds = datasets['3dsmall'].copy(deep=True)[:, :13]
+        ds.fa['voxel_indices'] = ds.fa.myspace
+        cv = CrossValidation(GNB(), OddEvenPartitioner())
+        res1 = sphere_searchlight(cv, radius=1, nproc=2)(ds)
+        sl = sphere_searchlight(cv, radius=1, nproc=2, scheduling='dynamic',
+                                enable_ca=['block_timings',
+                                           'workers_utilization',
+                                           'roi_center_ids'])
+        res2 = sl(ds)
+        assert_array_equal(res1, res2)
+        assert_array_equal(res1.fa.center_ids, res2.fa.center_ids)
+        assert_array_equal(sl.ca.roi_center_ids, res2.fa.center_ids)
+        # by default 10 blocks per each process, but no more blocks than
+        # ROIs, i.e. one ROI per block here -- covering all ROIs
+        assert_equal(sl.ca.block_timings.shape,
+                     (min(ds.nfeatures, 2 * 10), 3))
+        assert_equal(sl.ca.block_timings[:, 2].sum(), ds.nfeatures)
+        ok_(np.all(sl.ca.block_timings[:, 1] >= sl.ca.block_timings[:, 0]))
+        assert_equal(len(sl.ca.workers_utilization), 2)
+        ok_(np.all(sl.ca.workers_utilization >= 0))
+        ok_(np.all(sl.ca.workers_utilization <= 1))
+        # the most expensive ROI goes first
+        roi_sizes = [len(sl.queryengine[i]) for i in range(ds.nfeatures)]
+        order = sl._get_roi_order(np.arange(ds.nfeatures))
+        assert_equal(roi_sizes[order[0]], max(roi_sizes))
+        assert_equal(roi_sizes[order[-1]], min(roi_sizes))
+        assert_raises(ValueError, sphere_searchlight, cv, scheduling='guided')
+
+
     def test_custom_results_fx_logic(self):
         # results_fx was introduced for the blow-up-the-memory-Swaroop
         # where keeping all intermediate results of the dark-magic SL
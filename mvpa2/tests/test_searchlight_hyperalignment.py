@@ -12,7 +12,7 @@ import unittest
 import numpy as np
 
 from mvpa2.algorithms.searchlight_hyperalignment import SearchlightHyperalignment, \
-    FeatureSelectionHyperalignment, compute_feature_scores
+    FeatureSelectionHyperalignment, compute_feature_scores, _TripletsAccumulator
 from mvpa2.mappers.zscore import zscore
 from mvpa2.misc.support import idhash
 from mvpa2.misc.data_generators import \
@@ -283,6 +283,37 @@ class SearchlightHyperalignmentTests(unittest.TestCase):
         # currently they are just suppressed :-/  So this is just a smoke test
         mappers = slhyper([ds_orig, ds_orig.copy()])
 
+    @reseed_rng()
+    def test_triplets_accumulator(self):
+        skip_if_no_external('scipy')
+        from scipy.sparse import coo_matrix
+
+        acc = _TripletsAccumulator('float32', size=4)
+        assert_equal(acc.tocsc((3, 3)).shape, (3, 3))
+        rows, cols, values = [], [], []
+        for i in xrange(50):
+            # overlapping entries have to be summed
+            r = np.random.randint(0, 10, size=np.random.randint(1, 7))
+            c = np.random.randint(0, 8)
+            v = np.random.normal(size=len(r))
+            acc.add(r, c, v)
+            rows += list(r)
+            cols += [c] * len(r)
+            values += list(v)
+        acc.add_matrix(coo_matrix(np.eye(12)))
+        rows += range(12)
+        cols += range(12)
+        values += [1] * 12
+        target = coo_matrix((values, (rows, cols))).toarray()
+        # duplicates got summed while growing
+        assert_true(len(acc) < len(values))
+        assert_equal(acc.shape, (12, 12))
+        assert_array_almost_equal(acc.tocsc().toarray(), target, decimal=5)
+        res = acc.tocsc((20, 5))
+        assert_equal(res.shape, (20, 12))
+        assert_equal(res.dtype, np.float32)
+        assert_array_almost_equal(res.toarray()[:12], target, decimal=5)
+
     @reseed_rng()
     def test_custom_qas(self):
         # Test if we could provide custom QEs per each of the datasets
@@ -11,6 +11,7 @@
 from mvpa2.testing import *
 from mvpa2.testing.datasets import datasets
 
+import mvpa2
 from mvpa2 import cfg
 from mvpa2.base import externals
 from mvpa2.clfs.stats import MCNullDist, FixedNullDist, NullDist
@@ -79,6 +80,59 @@ class StatsTests(unittest.TestCase):
             self.assertRaises(ValueError, null.p, [5, 3, 4])
 
 
+    @reseed_rng()
+    def test_mcnulldist_nproc(self):
+        skip_if_no_external('pprocess')
+        ds = datasets['uni2small']
+        dists = []
+        for nproc in (1, 2):
+            null = MCNullDist(AttributePermutator('targets', count=6),
+                              nproc=nproc, enable_ca=['dist_samples'])
+            mvpa2.seed(3)
+            null.fit(OneWayAnova(), ds)
+            assert_equal(null.ca.skipped, 0)
+            dists.append(null.ca.dist_samples.samples)
+        assert_equal(dists[1].shape, (1, ds.nfeatures, 6))
+        # same permutations in the same order
+        assert_array_equal(dists[0], dists[1])
+        assert_true('nproc=2' in repr(null))
+
+    @reseed_rng()
+    def test_nonparametric_set(self):
+        from mvpa2.clfs.stats import Nonparametric, NonparametricSet
+        samples = np.round(np.random.normal(size=(100, 20)), 1)
+        samples[3, :4] = np.nan
+        x = np.round(np.random.normal(size=20), 1)
+        x[5] = np.nan
+        x[6] = samples[0, 6]
+        for correction in ('clip', None):
+            dists = NonparametricSet(samples, correction=correction)
+            assert_equal(len(dists), 20)
+            for method in ('cdf', 'rcdf'):
+                assert_array_equal(
+                    getattr(dists, method)(x),
+                    [getattr(Nonparametric(s, correction=correction),
+                             method)(v)
+                     for s, v in zip(samples.T, x)])
+                assert_array_equal(getattr(dists[2], method)(x[2]),
+                                   getattr(dists, method)(x)[2])
+        assert_raises(ValueError, dists.cdf, x[:3])
+        assert_raises(ValueError, NonparametricSet, samples[0])
+
+        # MCNullDist uses it for Nonparametric
+        ds = datasets['uni2small']
+        null = MCNullDist(AttributePermutator('targets', count=10),
+                          tail='any', enable_ca=['dist_samples'])
+        null.fit(OneWayAnova(), ds)
+        ok_(isinstance(null.dists(), NonparametricSet))
+        f = OneWayAnova()(ds).samples[0]
+        dist_samples = null.ca.dist_samples.samples[0]
+        for method in ('cdf', 'rcdf'):
+            assert_array_equal(
+                getattr(null, method)(f),
+                [getattr(Nonparametric(s), method)(v)
+                 for s, v in zip(dist_samples, f)])
+
     def test_anova(self):
         """Do some extended testing of OneWayAnova
 
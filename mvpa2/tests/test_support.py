@@ -304,6 +304,19 @@ def test_mask2slice():
     assert_equal(mask2slice(slc), slice(None, 0, None))
 
 
+def test_tempfile_dump_load():
+    import os
+    from mvpa2.support.utils import dump_to_tempfile, load_from_tempfile
+    ds = datasets['uni2small']
+    fname = dump_to_tempfile((ds, {'a': 1}), prefix='tmptest')
+    ok_(os.path.basename(fname).startswith('tmptest'))
+    lds, d = load_from_tempfile(fname)
+    assert_datasets_equal(lds, ds)
+    assert_equal(d, {'a': 1})
+    # gets removed after loading
+    ok_(not os.path.exists(fname))
+
+
 def suite():  # pragma: no cover
     return unittest.makeSuite(SupportFxTests)
 
@@ -214,6 +214,123 @@ class SVMTests(unittest.TestCase):
                         msg="Memory consumption was %d, became %d"
                             % (mem0[1], mem1[1]))
 
+    @reseed_rng()
+    def test_libsvm_node_matrix(self):
+        skip_if_no_external('libsvm')
+        from mvpa2.clfs.libsvmc import _svm
+        x = np.random.randn(30, 7)
+        y = (x[:, 0] > 0).astype(float)
+        x_test = np.random.randn(11, 7)
+
+        nodes = _svm.SVMNodeMatrix(x_test)
+        assert_equal(len(nodes), len(x_test))
+        assert_raises(IndexError, nodes.__getitem__, len(x_test))
+        assert_raises(ValueError, _svm.SVMNodeMatrix, x[0])
+        assert_array_equal(
+            _svm.svmc.svm_node_matrix2numpy_array(nodes.matrix, 11, 7),
+            x_test)
+        # no rows
+        assert_equal(len(_svm.SVMNodeMatrix(np.zeros((0, 7)))), 0)
+
+        def get_model(x, kernel_type, precomputed=False):
+            prob = _svm.SVMProblem(y.tolist(), x, precomputed=precomputed)
+            param = _svm.SVMParameter(kernel_type=kernel_type, C=1.0)
+            return _svm.SVMModel(prob, param)
+
+        # samples converted at once or one by one
+        model = get_model(x, _svm.LINEAR)
+        model_ = get_model(list(x), _svm.LINEAR)
+        predictions = model.predict_array(nodes)
+        assert_array_equal(predictions,
+                           [model_.predict(list(p)) for p in x_test])
+        assert_array_equal([model.predict_values_raw(p) for p in nodes],
+                           [model_.predict_values_raw(p) for p in x_test])
+        assert_array_equal(model.get_sv(), model_.get_sv())
+
+        # precomputed kernel
+        model_k = get_model(np.dot(x, x.T), _svm.PRECOMPUTED,
+                            precomputed=True)
+        nodes_k = _svm.SVMNodeMatrix(np.dot(x_test, x.T), precomputed=True)
+        assert_array_equal(model_k.predict_array(nodes_k), predictions)
+        assert_array_almost_equal(
+            [model_k.predict_values_raw(p) for p in nodes_k],
+            [model.predict_values_raw(p) for p in nodes])
+
+    @reseed_rng()
+    def test_libsvm_warm_start(self):
+        skip_if_no_external('libsvm')
+        from mvpa2.clfs.libsvmc import _svm
+        if not _svm.svmc.svm_has_warm_start():
+            raise SkipTest("Available libsvm provides no warm start")
+        x = np.random.randn(60, 10)
+        y = np.arange(60) % 3
+        x[:, :3] += y[:, None]
+
+        def get_model(x, init_coef=None, C=1.0):
+            prob = _svm.SVMProblem(y.tolist(), x)
+            param = _svm.SVMParameter(kernel_type=_svm.LINEAR, C=C)
+            return _svm.SVMModel(prob, param, init_coef=init_coef)
+
+        model = get_model(x)
+        assert_equal(model.coef.shape, (60, 2))
+        # coefficients of support vectors are stored relative to C
+        assert_array_almost_equal(
+            np.sort(model.get_sv_coef().ravel()),
+            np.sort(model.coef[np.any(model.coef != 0, axis=1)].ravel()))
+        # starting from the solution yields it back
+        assert_array_almost_equal(get_model(x, model.coef).coef, model.coef)
+        assert_raises(ValueError, get_model, x, model.coef[:, :1])
+
+        # with fewer features or different C the solution is the same as
+        # without a warm start
+        for x_, C in ((x[:, 1:], 1.0), (x, 0.1), (x, 10.0)):
+            cold = get_model(x_, C=C)
+            warm = get_model(x_, model.coef, C=C)
+            assert_array_equal(warm.predict_array(x_), cold.predict_array(x_))
+            assert_array_almost_equal(
+                [warm.predict_values_raw(p) for p in x_],
+                [cold.predict_values_raw(p) for p in x_], decimal=1)
+
+        # and on the level of the classifier
+        ds = dataset_wizard(x, targets=y)
+        clf, clf_ws = LinearCSVMC(), LinearCSVMC(warm_start=True)
+        for ds_ in (ds, ds[:, 1:], ds[:, 2:], ds[::2]):
+            clf.train(ds_)
+            clf_ws.train(ds_)
+            assert_array_equal(clf_ws.predict(ds_), clf.predict(ds_))
+            clf_ws.untrain()
+        ok_(clf_ws._SVM__warm_start is not None)
+        clf_ws.reset_warm_start()
+        ok_(clf_ws._SVM__warm_start is None)
+        # only C-SVM supports it
+        ok_(not 'warm_start' in LinearNuSVMC().params)
+
+
+    @reseed_rng()
+    def test_libsvm_precomputed_kernel(self):
+        skip_if_no_external('libsvm')
+        from mvpa2.kernels.np import LinearKernel, CachedLinearKernel
+        from mvpa2.clfs.libsvmc.svm import SVM as libSVM
+        ds = datasets['uni3small'].copy()
+        ds.init_origids('both')
+        clf = LinearCSVMC()
+        clf.train(ds)
+        sens = clf.get_sensitivity_analyzer(force_train=False)(ds)
+        for kernel in (LinearKernel(), CachedLinearKernel()):
+            clf_np = libSVM(svm_impl='C_SVC', kernel=kernel)
+            clf_np.train(ds)
+            # support vectors are taken from the training dataset
+            assert_array_equal(clf_np.get_sv(),
+                               ds.samples[clf_np.model.get_sv_indices()])
+            # and the solution is the same as with libsvm's own linear kernel
+            assert_array_equal(clf_np.predict(ds[::3]), clf.predict(ds[::3]))
+            assert_array_almost_equal(
+                clf_np.get_sensitivity_analyzer(force_train=False)(ds),
+                sens, decimal=4)
+            clf_np.untrain()
+            ok_(clf_np._SVM__traindataset is None)
+
+
 def suite():  # pragma: no cover
     return unittest.makeSuite(SVMTests)
 
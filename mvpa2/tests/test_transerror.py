@@ -122,6 +122,74 @@ class ErrorsTests(unittest.TestCase):
         assert_array_equal(r1, [1, 2, 1])
 
 
+    @reseed_rng()
+    def test_confusion_matrix_store_sets(self):
+        labels = ['a', 'b', 'c', 'd']
+        sets = []
+        for i in xrange(6):
+            # labels get introduced gradually
+            nlabels = min(i + 2, len(labels))
+            sets.append(tuple(
+                np.array(labels)[np.random.randint(nlabels, size=20)]
+                for j in xrange(2)))
+        cm = ConfusionMatrix(sets=sets)
+        cm_ns = ConfusionMatrix(store_sets=False)
+        for targets, predictions in sets:
+            cm_ns.add(targets, predictions)
+        assert_equal(cm_ns.sets, [])
+        assert_equal(cm_ns.nsets, len(sets))
+        assert_equal(cm_ns.labels, labels)
+        assert_array_equal(cm_ns.matrix, cm.matrix)
+        assert_array_equal(cm_ns.matrix.sum(), 20 * len(sets))
+        for k in ('TP', 'FP', 'ACC', 'MCC', '# of sets'):
+            assert_array_equal(cm_ns.stats[k], cm.stats[k])
+        if 'LOE(ACC):slope' in cm.stats:
+            assert_equal(cm_ns.stats['LOE(ACC):slope'],
+                         cm.stats['LOE(ACC):slope'])
+        # no sets -- no ROC
+        ok_(cm_ns.ROC is None)
+        ok_(np.all(np.isnan(cm_ns.stats['AUC'])))
+
+        # accumulation keeps the sets only if all have them
+        cm_sum = ConfusionMatrix()
+        cm_sum += cm
+        assert_equal(len(cm_sum.sets), len(sets))
+        cm_sum += cm_ns
+        assert_equal(cm_sum.sets, [])
+        assert_equal(cm_sum.nsets, 2 * len(sets))
+        assert_array_equal(cm_sum.matrix, 2 * cm.matrix)
+        # and labels are matched regardless of their order of appearance
+        cm_rev = ConfusionMatrix(targets=['d', 'a'], predictions=['a', 'a'])
+        cm_rev += cm
+        assert_array_equal(cm_rev.matrix[0], cm.matrix[0] + [1, 0, 0, 1])
+        assert_array_equal(cm_rev.matrix[1:], cm.matrix[1:])
+
+
+    @with_tempfile(suffix='.hdf5')
+    def test_confusion_matrix_old_state(self, fname):
+        import cPickle
+        cm = ConfusionMatrix(targets=['a', 'b', 'b', 'c'],
+                             predictions=['a', 'b', 'c', 'c'])
+        cm.add(['a', 'c'], ['b', 'c'])
+        # state as stored by versions which did not count the sets
+        cm_old = ConfusionMatrix(sets=cm.sets)
+        for attr in ('store_sets', 'code_labels', 'counts', 'set_counts'):
+            delattr(cm_old, '_ConfusionMatrix__' + attr)
+        loaders = [lambda: cPickle.loads(cPickle.dumps(cm_old, 2))]
+        if externals.exists('h5py'):
+            from mvpa2.base.hdf5 import h5save, h5load
+            h5save(fname, cm_old)
+            loaders.append(lambda: h5load(fname))
+        for load in loaders:
+            cm_loaded = load()
+            assert_equal(cm_loaded.nsets, 2)
+            assert_array_equal(cm_loaded.matrix, cm.matrix)
+            assert_equal(cm_loaded.percent_correct, cm.percent_correct)
+            cm_loaded.add(['c'], ['c'])
+            cm_loaded += cm
+            assert_equal(cm_loaded.nsets, 5)
+
+
     def test_degenerate_confusion(self):
         # We must not just puke -- some testing splits might
         # have just a single target label
@@ -221,14 +221,11 @@ def test_gnbsearchlight_permutations():
                                null_dist=distr_est, postproc=mean_sample(),
                                errorfx=mean_mismatch_error,
                                **slkwargs)
-    if __debug__:                         # assert is done only without -O mode
-        assert_raises(NotImplementedError, sl, ds)
-
-    # "ad-hoc searchlights can't handle yet varying targets across partitions"
-    if False:
-        # after above limitation is removed -- enable
-        sl_map = sl(ds)
-        sl_null_prob = sl.ca.null_prob.samples.copy()
+    sl_map = sl(ds)
+    sl_null_prob = sl.ca.null_prob.samples.copy()
+    # permutations must have resulted in varying estimates
+    assert_array_less(-np.var(distr_est.ca.dist_samples.samples[0],
+                              axis=1), -1e-5)
 
     mvpa2.seed(mvpa2._random_seed)
     ### 'normal' Searchlight